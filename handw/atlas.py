@@ -0,0 +1,177 @@
+"""
+笔画图集: 整套字体预先提取的中心线笔画打包成一个二进制文件
+
+文件布局 (小端, 各段按 8 字节对齐):
+    header   HEADER_DTYPE, 1 条
+    index    INDEX_DTYPE, 每个字形一条, 按码位升序
+    strokes  uint32, 每个笔画在 points 中的起点, 末尾多一项为总点数
+    points   float32 (n, 2), 以 em 为单位、字形原点为原点的坐标, y 向上
+
+读取时用 mmap 映射整个文件, 各段是 np.frombuffer 视图, 查询单个字形只做二分查找和切片,
+不复制数据, 打开时间与字体大小无关。
+"""
+import mmap
+import os
+from functools import lru_cache
+
+import numpy as np
+import emit
+
+MAGIC = b"HWATLAS1"
+VERSION = 1
+HEADER_DTYPE = np.dtype([("magic", "S8"), ("version", "<u4"), ("n_glyphs", "<u4"),
+                         ("n_strokes", "<u4"), ("n_points", "<u4")])
+INDEX_DTYPE = np.dtype([("codepoint", "<u4"), ("first", "<u4"), ("count", "<u4"), ("advance", "<f4")])
+# 图集里没有的字符按半个 em 前进
+MISSING_ADVANCE = 0.5
+
+
+def _aligned(n):
+    return (n + 7) & ~7
+
+
+def write_atlas(path, glyphs):
+    """
+    写出图集
+
+    参数:
+        glyphs (dict): 码位 -> (strokes, advance); strokes 为 (k, 2) 数组的列表, em 单位
+    """
+    codepoints = sorted(glyphs)
+    index = np.zeros(len(codepoints), dtype=INDEX_DTYPE)
+    offsets = [0]
+    points = []
+    for i, cp in enumerate(codepoints):
+        strokes, advance = glyphs[cp]
+        index[i] = (cp, len(offsets) - 1, len(strokes), advance)
+        for stroke in strokes:
+            points.append(np.asarray(stroke, dtype="<f4").reshape(-1, 2))
+            offsets.append(offsets[-1] + len(points[-1]))
+    offsets = np.asarray(offsets, dtype="<u4")
+    points = np.concatenate(points) if points else np.empty((0, 2), dtype="<f4")
+
+    header = np.zeros(1, dtype=HEADER_DTYPE)
+    header[0] = (MAGIC, VERSION, len(index), len(offsets) - 1, len(points))
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        for section in (header, index, offsets, points):
+            data = section.tobytes()
+            f.write(data)
+            f.write(b"\0" * (_aligned(len(data)) - len(data)))
+    # 先写临时文件再替换, 正在读取旧图集的进程不受影响
+    os.replace(tmp, path)
+
+
+class StrokeAtlas:
+    """
+    只读打开图集文件
+
+    用法:
+        atlas = StrokeAtlas("font.atlas")
+        vertices, starts = atlas.strokes("永")   # 都是映射内存的视图
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        header = np.frombuffer(self._mm, dtype=HEADER_DTYPE, count=1)[0]
+        if header["magic"] != MAGIC or header["version"] != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} stroke atlas")
+        n_glyphs, n_strokes, n_points = (int(header[k]) for k in ("n_glyphs", "n_strokes", "n_points"))
+        offset = _aligned(HEADER_DTYPE.itemsize)
+        self.index = np.frombuffer(self._mm, dtype=INDEX_DTYPE, count=n_glyphs, offset=offset)
+        offset += _aligned(self.index.nbytes)
+        self.offsets = np.frombuffer(self._mm, dtype="<u4", count=n_strokes + 1, offset=offset)
+        offset += _aligned(self.offsets.nbytes)
+        self.points = np.frombuffer(self._mm, dtype="<f4", count=2 * n_points, offset=offset).reshape(-1, 2)
+        self._codepoints = self.index["codepoint"]
+
+    def __len__(self):
+        return len(self.index)
+
+    def _find(self, char):
+        cp = ord(char)
+        i = int(np.searchsorted(self._codepoints, cp))
+        if i < len(self._codepoints) and self._codepoints[i] == cp:
+            return i
+        return -1
+
+    def __contains__(self, char):
+        return self._find(char) >= 0
+
+    def advance(self, char):
+        i = self._find(char)
+        return float(self.index[i]["advance"]) if i >= 0 else MISSING_ADVANCE
+
+    def strokes(self, char):
+        """
+        返回:
+            vertices (np.ndarray): (n, 2) float32, 映射内存的只读视图
+            starts (np.ndarray): 每个笔画在 vertices 中的起点
+        """
+        i = self._find(char)
+        if i < 0:
+            return self.points[:0], self.offsets[:0]
+        first, count = int(self.index[i]["first"]), int(self.index[i]["count"])
+        if not count:
+            return self.points[:0], self.offsets[:0]
+        bounds = self.offsets[first:first + count + 1]
+        lo = int(bounds[0])
+        return self.points[lo:int(bounds[-1])], bounds[:-1] - lo
+
+    def close(self):
+        # 仍有视图引用映射时不能关闭, 交给垃圾回收
+        try:
+            self._mm.close()
+        except BufferError:
+            pass
+
+
+def read_glyphs(path):
+    """读出图集中全部字形, 返回 write_atlas 的 glyphs 格式 (用于合并分片)"""
+    atlas = StrokeAtlas(path)
+    glyphs = {}
+    for cp, advance in zip(atlas.index["codepoint"].tolist(), atlas.index["advance"].tolist()):
+        vertices, starts = atlas.strokes(chr(cp))
+        glyphs[cp] = ([s.copy() for s in np.split(vertices, starts[1:])] if len(vertices) else [], advance)
+    return glyphs
+
+
+@lru_cache(maxsize=8)
+def open_atlas(path):
+    return StrokeAtlas(path)
+
+
+def is_atlas(font_name):
+    return isinstance(font_name, str) and font_name.lower().endswith(".atlas")
+
+
+def line_advances(line, atlas_file, size, face_index=0, cache=None):
+    """单行中每个字符的前进宽度, 参数与 layout_line 相同"""
+    atlas = open_atlas(atlas_file)
+    return np.array([atlas.advance(char) * size for char in line], dtype=float)
+
+
+def layout_line(line, atlas_file, size, x=0., y=0., face_index=0, cache=None):
+    """
+    用图集排版单行文本, 参数与 glyph_cache.layout_line 相同 (face_index/cache 不使用); 图集没有字距表
+
+    返回:
+        vertices (np.ndarray), codes (np.ndarray): 只含 MOVETO/LINETO
+    """
+    atlas = open_atlas(atlas_file)
+    verts, codes = [], []
+    pen_x = x
+    for char in line:
+        vertices, starts = atlas.strokes(char)
+        if len(vertices):
+            verts.append(vertices.astype(float) * size + (pen_x, y))
+            glyph_codes = np.full(len(vertices), emit.LINETO, dtype=np.uint8)
+            glyph_codes[starts] = emit.MOVETO
+            codes.append(glyph_codes)
+        pen_x += atlas.advance(char) * size
+
+    if not verts:
+        return np.empty((0, 2)), np.empty(0, dtype=np.uint8)
+    return np.concatenate(verts), np.concatenate(codes)
@@ -0,0 +1,231 @@
+"""
+批量转换: 把目录中的 .txt / .docx 文件在多个进程中转换成 G-code, 不需要打开界面
+
+输出按 "文件内容 + 字体 + 参数" 的哈希缓存在 <输出目录>/.cache 中, 重新运行时内容和参数都没变的
+文件直接从缓存取出, 不再生成; 内容相同的多个文件也只生成一次。结束时打印吞吐统计,
+有文件失败时退出码为 1 (其余文件照常转换), 适合无人值守的定时任务。
+
+用法:
+    python batch.py letters/ -o gcode/ --font "Noto Sans CJK SC" --size 8 --optimize --workers 4
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+from collections import Counter, namedtuple
+
+import utils as ul
+
+control = ul.lazy_import("control")
+
+EXTENSIONS = (".txt", ".docx")
+# 改变输出格式时加一, 旧缓存自动失效
+CACHE_VERSION = 2
+
+Job = namedtuple("Job", ["key", "path", "options"])
+Result = namedtuple("Result", ["key", "chars", "lines", "size", "seconds", "error"])
+
+
+def find_inputs(paths, recursive=True):
+    """展开输入: 目录下的 .txt/.docx (按路径排序), 文件原样保留; 返回 [(文件, 相对输出路径), ...]"""
+    inputs = []
+    for path in paths:
+        if os.path.isdir(path):
+            found = []
+            for root, dirs, files in os.walk(path):
+                dirs[:] = sorted(d for d in dirs if not d.startswith(".")) if recursive else []
+                found.extend(os.path.join(root, f) for f in files
+                             if f.lower().endswith(EXTENSIONS) and not f.startswith("~$"))
+            inputs.extend((f, os.path.relpath(f, path)) for f in sorted(found))
+        elif os.path.isfile(path):
+            inputs.append((path, os.path.basename(path)))
+        else:
+            raise FileNotFoundError(path)
+    return inputs
+
+
+def read_text(path):
+    """.txt 按 UTF-8 读取, .docx 取各段落文字 (与 handw.py 打开文件时相同)"""
+    if path.lower().endswith(".docx"):
+        from docx import Document
+        return "\n".join(para.text for para in Document(path).paragraphs)
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def _file_stamp(path):
+    # 字体/变体库用 路径 + 大小 + 修改时间 代表内容, 不必每次读整个字体文件
+    try:
+        st = os.stat(path)
+    except OSError:
+        return path
+    return f"{os.path.abspath(path)}:{st.st_size}:{st.st_mtime_ns}"
+
+
+def cache_key(data, options):
+    """输入文件内容 (bytes) 与全部转换参数的哈希"""
+    fonts = [_file_stamp(options["font_name"])]
+    if options.get("mode") == "handwriting":
+        import handwriting
+        if not handwriting.is_handwriting(options["font_name"]):
+            fonts.append(_file_stamp(handwriting.default_path()))
+    h = hashlib.sha256()
+    h.update(json.dumps([CACHE_VERSION, options, fonts], sort_keys=True).encode("utf-8"))
+    h.update(b"\0")
+    h.update(data)
+    return h.hexdigest()
+
+
+def cache_file(cache_dir, key):
+    return os.path.join(cache_dir, key[:2], key + ".gcode")
+
+
+def convert(job):
+    """
+    子进程入口: 读取并转换一个文件, G-code 写入缓存 (不传 log, 各文件的统计不打印)
+
+    返回:
+        Result; 出错时 error 为错误信息, 不抛出 (不影响其余文件)
+    """
+    key, path, (options, cache_dir) = job
+    start = time.perf_counter()
+    try:
+        text = read_text(path)
+        gcode, _ = control.text_to_gcode(text, **options)
+        target = cache_file(cache_dir, key)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        tmp = f"{target}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(gcode)
+        os.replace(tmp, target)
+        chars = len(text) - text.count("\n")
+        return Result(key, chars, gcode.count("\n") + 1, len(gcode), time.perf_counter() - start, None)
+    except Exception as e:
+        return Result(key, 0, 0, 0, time.perf_counter() - start, f"{type(e).__name__}: {e}")
+
+
+def _place(source, target):
+    # 缓存到输出: 复制 (不用硬链接, 否则就地修改输出文件会改坏缓存), 先写临时文件再替换
+    os.makedirs(os.path.dirname(target) or ".", exist_ok=True)
+    tmp = f"{target}.{os.getpid()}.tmp"
+    shutil.copyfile(source, tmp)
+    os.replace(tmp, target)
+
+
+def output_names(inputs):
+    """相对输出路径: 扩展名换成 .gcode; a.txt 与 a.docx 这样会重名的保留原扩展名 (a.txt.gcode)"""
+    stems = [os.path.splitext(rel)[0] for _, rel in inputs]
+    counts = Counter(os.path.normcase(stem) for stem in stems)
+    names = [(stem if counts[os.path.normcase(stem)] == 1 else rel) + ".gcode"
+             for stem, (_, rel) in zip(stems, inputs)]
+    # 不同目录下同名的输入文件 (作为文件参数给出时只保留文件名) 仍会重名
+    seen = {}
+    for (path, _), name in zip(inputs, names):
+        other = seen.setdefault(os.path.normcase(name), path)
+        if other != path:
+            raise ValueError(f"{other} and {path} would both be written to {name}")
+    return names
+
+
+def run(paths, output, options, workers=None, cache_dir=None, recursive=True, force=False, log=print):
+    """
+    批量转换
+
+    参数:
+        paths (list[str]): 输入文件或目录
+        output (str): 输出目录, 保留输入目录下的相对路径, 扩展名换成 .gcode (重名时见 output_names)
+        options (dict): 传给 control.text_to_gcode 的参数
+        workers (int): 进程数, None 为 CPU 核数
+        cache_dir (str): 缓存目录, 默认 <output>/.cache
+        force (bool): 忽略缓存, 全部重新生成
+
+    返回:
+        dict: files, converted, cached, failed, chars, lines, bytes, seconds, errors
+    """
+    start = time.perf_counter()
+    cache_dir = cache_dir or os.path.join(output, ".cache")
+    inputs = find_inputs(paths, recursive)
+
+    targets = {}
+    jobs = {}
+    for (path, _), name in zip(inputs, output_names(inputs)):
+        with open(path, "rb") as f:
+            key = cache_key(f.read(), options)
+        targets[path] = (key, os.path.join(output, name))
+        if key not in jobs and (force or not os.path.exists(cache_file(cache_dir, key))):
+            jobs[key] = Job(key, path, (options, cache_dir))
+
+    stats = dict(files=len(inputs), converted=0, cached=0, failed=0, chars=0, lines=0, bytes=0, errors={})
+    results = {}
+    if jobs:
+        workers = 1 if len(jobs) == 1 else workers
+        for result in ul.ordered_map(convert, jobs.values(), workers):
+            results[result.key] = result
+            if result.error:
+                log(f"FAILED {jobs[result.key].path}: {result.error}")
+
+    for path, (key, target) in targets.items():
+        result = results.get(key)
+        if result is not None and result.error:
+            stats["failed"] += 1
+            stats["errors"][path] = result.error
+            continue
+        _place(cache_file(cache_dir, key), target)
+        if result is not None and jobs[key].path == path:
+            stats["converted"] += 1
+            stats["chars"] += result.chars
+            stats["lines"] += result.lines
+            stats["bytes"] += result.size
+        else:
+            stats["cached"] += 1
+    stats["seconds"] = time.perf_counter() - start
+    return stats
+
+
+def format_summary(stats):
+    seconds = max(stats["seconds"], 1e-9)
+    return "\n".join([
+        f"{stats['files']} files: {stats['converted']} converted, {stats['cached']} from cache, "
+        f"{stats['failed']} failed in {seconds:.1f} s",
+        f"{stats['files'] / seconds:.1f} files/s, {stats['chars'] / seconds:,.0f} chars/s converted, "
+        f"{stats['lines']:,} G-code lines ({stats['bytes'] / 1e6:.1f} MB) written",
+    ])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert .txt/.docx files to G-code in batch")
+    parser.add_argument("inputs", nargs="+", help="input files or directories")
+    parser.add_argument("-o", "--output", required=True, help="output directory")
+    parser.add_argument("--font", default="DejaVu Sans", help="font name, font file, .atlas or .hand library")
+    parser.add_argument("--size", type=float, default=20, help="font size (mm)")
+    parser.add_argument("--mode", default="outline", choices=("outline", "centerline", "handwriting"))
+    parser.add_argument("--feedrate", type=float, default=1000)
+    parser.add_argument("--z-safe", type=float, default=5)
+    parser.add_argument("--z-draw", type=float, default=-1)
+    parser.add_argument("--tolerance", type=float, default=0.05)
+    parser.add_argument("--arcs", action="store_true", help="fit curves as G2/G3 arcs")
+    parser.add_argument("--optimize", action="store_true", help="reorder strokes to reduce pen-up travel")
+    parser.add_argument("--simplify", type=float, default=0., help="RDP tolerance (mm), 0 to disable")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="processes (default: CPU count)")
+    parser.add_argument("--cache", default=None, help="cache directory (default: OUTPUT/.cache)")
+    parser.add_argument("--no-recursive", action="store_true", help="do not descend into subdirectories")
+    parser.add_argument("--force", action="store_true", help="ignore the cache and convert everything")
+    args = parser.parse_args(argv)
+
+    font_file, face_index = control.resolve_font(args.font)
+    options = dict(font_size=args.size, font_name=font_file, face_index=face_index, mode=args.mode,
+                   feedrate=args.feedrate, z_safe=args.z_safe, z_draw=args.z_draw, tolerance=args.tolerance,
+                   arcs=args.arcs, optimize=args.optimize, simplify=args.simplify)
+    try:
+        stats = run(args.inputs, args.output, options, args.workers, args.cache, not args.no_recursive, args.force)
+    except (FileNotFoundError, ValueError) as e:
+        parser.error(str(e))
+    print(format_summary(stats))
+    return 1 if stats["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,375 @@
+"""
+性能基准脚本
+
+用法: python bench.py [font_file]
+"""
+import sys
+import time
+
+FONT = "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf"
+SAMPLE = "The quick brown fox jumps over the lazy dog 0123456789"
+
+
+def timeit(func, *args, repeat=3, **kwargs):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def _loop_emit(vertices, codes, feedrate=1000, z_safe=5, z_draw=-1):
+    # 逐顶点循环的旧实现, 作为对照
+    gcode = []
+    gcode.append("G21 ; 设置单位为毫米")
+    gcode.append("G90 ; 使用绝对坐标")
+    gcode.append(f"G1 F{feedrate} ; 设置进给速度")
+
+    pen_down = False
+    for code, (x, y) in zip(codes, vertices):
+        if code == 1:  # MOVETO
+            if pen_down:
+                gcode.append(f"G0 Z{z_safe}")
+                pen_down = False
+            gcode.append(f"G0 X{x:.3f} Y{y:.3f}")
+            gcode.append(f"G1 Z{z_draw}")
+            pen_down = True
+        elif code == 2:  # LINETO
+            gcode.append(f"G1 X{x:.3f} Y{y:.3f}")
+        elif code == 79:  # CLOSEPOLY
+            if pen_down:
+                gcode.append(f"G0 Z{z_safe}")
+                pen_down = False
+
+    if pen_down:
+        gcode.append(f"G0 Z{z_safe}")
+
+    gcode.append("M2 ; 程序结束")
+    return "\n".join(gcode)
+
+
+def bench_emit(font_file=FONT, n_lines=500):
+    import control
+    import emit
+
+    text = "\n".join([SAMPLE] * n_lines)
+    path = control.multiline_text_path(text, font_name=font_file)
+    t_loop, ref = timeit(_loop_emit, path.vertices, path.codes)
+    t_vec, out = timeit(emit.emit_gcode, path.vertices, path.codes)
+    assert out == ref, "vectorized emitter output differs from loop emitter"
+    n = ref.count("\n") + 1
+    print(f"[emit] {n} lines  loop: {n / t_loop:,.0f} lines/s  "
+          f"numpy: {n / t_vec:,.0f} lines/s  ({t_loop / t_vec:.1f}x)")
+
+
+def _walk_prune(skel, min_length=10):
+    # 逐像素追踪的旧剪枝实现, 作为对照
+    import numpy as np
+    from scipy.ndimage import convolve
+
+    skel = skel.copy() // 255
+    skel_out = skel.copy()
+
+    # 8邻域卷积，用于检测端点
+    kernel = np.ones((3,3), dtype=int)
+    kernel[1,1] = 0
+    neighbor_count = convolve(skel, kernel, mode='constant', cval=0)
+
+    # 端点坐标
+    endpoints = np.array(np.where((neighbor_count==1) & (skel==1))).T
+
+    visited = np.zeros_like(skel, dtype=bool)
+
+    def trace(y,x):
+        path = [(y,x)]
+        py, px = y, x
+        prev = None
+        while True:
+            visited[py,px] = True
+            # 找未访问的邻居
+            neighbors = []
+            for dy in [-1,0,1]:
+                for dx in [-1,0,1]:
+                    ny, nx = py+dy, px+dx
+                    if 0<=ny<skel.shape[0] and 0<=nx<skel.shape[1]:
+                        if skel[ny,nx]==1 and not visited[ny,nx]:
+                            neighbors.append((ny,nx))
+            if len(neighbors)==0 or len(neighbors)>1:
+                break  # 到达端点或分叉
+            py, px = neighbors[0]
+            path.append((py, px))
+        return path
+
+    for y, x in endpoints:
+        if visited[y,x]:
+            continue
+        path = trace(y,x)
+        if len(path) < min_length:
+            for py, px in path:
+                skel_out[py, px] = 0
+                visited[py, px] = True
+
+    return (skel_out*255).astype(np.uint8)
+
+
+def bench_prune(font_file=FONT, n_chars=300, min_length=15):
+    import numpy as np
+    import easy_skel
+
+    chars = easy_skel.get_font_chars(font_file)[:n_chars]
+    skels = [easy_skel.safe_skeletonize(easy_skel.render_char_to_bitmap(font_file, c)) for c in chars]
+    t_walk, ref = timeit(lambda: [_walk_prune(s, min_length) for s in skels], repeat=1)
+    t_graph, out = timeit(lambda: [easy_skel.remove_short_branches_any_dir(s, min_length) for s in skels], repeat=1)
+    assert all(np.array_equal(a, b) for a, b in zip(ref, out)), "graph pruning differs from pixel walk"
+    n = len(skels)
+    print(f"[prune] {n} glyphs  walk: {n / t_walk:,.0f} glyphs/s  "
+          f"graph: {n / t_graph:,.0f} glyphs/s  ({t_walk / t_graph:.1f}x)")
+
+
+def bench_travel(n_strokes=30000, seed=0):
+    import numpy as np
+    import travel
+
+    # 随机分布的短笔画, 检验排序在大规模下不出现平方级耗时
+    rng = np.random.default_rng(seed)
+    heads = rng.uniform(0, 1000, size=(n_strokes, 2))
+    vertices = np.empty((2 * n_strokes, 2))
+    vertices[0::2] = heads
+    vertices[1::2] = heads + rng.normal(scale=3, size=(n_strokes, 2))
+    codes = np.tile([1, 2], n_strokes).astype(np.uint8)
+    for two_opt in (False, True):
+        t, (_, _, _, report) = timeit(travel.optimize_travel, vertices, codes, two_opt=two_opt, repeat=1)
+        print(f"[travel] {n_strokes} strokes  2-opt={two_opt}  "
+              f"{report['before']:,.0f} mm -> {report['after']:,.0f} mm  in {t:.2f}s")
+
+
+def bench_centerline(font_file=FONT, n_lines=20):
+    import numpy as np
+    import control
+    import curves
+    import emit
+
+    text = "\n".join([SAMPLE] * n_lines)
+    for mode in control.MODES:
+        path = control.multiline_text_path(text, font_name=font_file, mode=mode)
+        vertices, codes = curves.flatten(path.vertices, path.codes, 0.05)
+        # 落笔行程: 每个 LINETO 段的长度之和
+        lines = np.flatnonzero(codes == emit.LINETO)
+        drawn = np.linalg.norm(vertices[lines] - vertices[lines - 1], axis=1).sum()
+        t, (gcode, _) = timeit(control.text_to_gcode, text, font_name=font_file, mode=mode, repeat=1)
+        print(f"[centerline] {mode:<10} pen-down {drawn:,.0f} mm  "
+              f"{gcode.count(chr(10)) + 1} lines  in {t:.2f}s")
+
+
+def bench_startup(module="handw_qt", top=12):
+    """在新进程中用 -X importtime 导入 module, 报告总耗时和最慢的导入 (含其子模块)"""
+    import os
+    import subprocess
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            cwd=here, capture_output=True, text=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        # import time: self [us] | cumulative | imported package (缩进表示层级)
+        self_us, cumulative, name = line.split(":", 1)[1].split("|")
+        self_us = int(self_us)
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((int(cumulative), self_us, depth, name.strip()))
+    total = sum(c for c, _, d, _ in rows if d == 0)
+    print(f"[startup] import {module}: {total / 1e3:.0f} ms")
+    for cumulative, self_us, depth, name in sorted(rows, reverse=True)[:top]:
+        print(f"  {cumulative / 1e3:8.1f} ms  (self {self_us / 1e3:6.1f} ms)  {'  ' * depth}{name}")
+
+
+def bench_preview(font_file=FONT, n_lines=60):
+    """预览: 建立分块、首次绘制 (含构建路径)、缓存后重绘、放大后重绘、改一行后重新预览"""
+    import os
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PyQt5.QtGui import QImage
+    from PyQt5.QtWidgets import QApplication
+    import control
+    from qt_show import PathCanvas
+
+    app = QApplication.instance() or QApplication([])  # noqa: F841, 绘制需要 QApplication
+    text = "\n".join([SAMPLE] * n_lines)
+    path = control.multiline_text_path(text, font_name=font_file)
+    canvas = PathCanvas()
+    canvas.resize(800, 800)
+    image = QImage(800, 800, QImage.Format_RGB32)
+    t_set, _ = timeit(canvas.set_path, path.vertices, path.codes, repeat=1)
+    t_first, _ = timeit(canvas.render, image, repeat=1)
+    t_again, _ = timeit(canvas.render, image)
+    canvas.scale *= 20
+    t_zoom, _ = timeit(canvas.render, image)
+    edited = control.multiline_text_path(text.replace(SAMPLE[-1], "#", 1), font_name=font_file)
+    t_edit, _ = timeit(canvas.set_path, edited.vertices, edited.codes, repeat=1)
+    print(f"[preview] {len(path.vertices):,} vertices in {len(canvas.tiles)} tiles: set {t_set * 1e3:.0f} ms, "
+          f"first paint {t_first * 1e3:.1f} ms, repaint {t_again * 1e3:.1f} ms, "
+          f"zoomed {t_zoom * 1e3:.1f} ms, edit {t_edit * 1e3:.0f} ms")
+
+
+def bench_estimate(font_file=FONT, n_lines=20):
+    """各种生成选项下的预计加工时间 (及估算本身的耗时)"""
+    import control
+    import estimate
+
+    text = "\n".join([SAMPLE] * n_lines)
+    for options in ({}, {"optimize": True}, {"arcs": True}, {"mode": "centerline"},
+                    {"mode": "centerline", "optimize": True}):
+        gcode, _ = control.text_to_gcode(text, font_name=font_file, **options)
+        t, report = timeit(estimate.estimate, gcode, is_file=False, repeat=1)
+        label = " ".join(f"{k}={v}" for k, v in options.items()) or "default"
+        print(f"[estimate] {label:<32} {estimate.format_duration(report['seconds']):>8}  "
+              f"draw {report['draw']:6.0f}s  travel {report['travel']:5.0f}s  pen {report['pen']:5.0f}s  "
+              f"({report['blocks']} blocks in {t:.2f}s)")
+
+
+def bench_simplify(font_file=FONT, n_lines=20, tolerances=(0.02, 0.05, 0.1, 0.2)):
+    """RDP 简化: 各容差下的顶点数、G-code 行数与预计加工时间"""
+    import control
+    import curves
+    import estimate
+
+    text = "\n".join([SAMPLE] * n_lines)
+    for mode in control.MODES:
+        path = control.multiline_text_path(text, font_name=font_file, mode=mode)
+        vertices, codes = curves.flatten(path.vertices, path.codes, 0.05)
+        for tol in (0,) + tuple(tolerances):
+            t, (v, c, _) = timeit(curves.simplify, vertices, codes, tol)
+            gcode = control.emit.emit_gcode(v, c)
+            seconds = estimate.estimate(gcode, is_file=False)["seconds"]
+            print(f"[simplify] {mode:<10} tol {tol:<4} {len(c):7,} vertices  {gcode.count(chr(10)) + 1:7,} lines  "
+                  f"{estimate.format_duration(seconds):>8}  ({t * 1e3:.1f} ms)")
+
+
+def bench_pages(font_file=FONT, n_paragraphs=12, font_size=8):
+    """分页生成: 单进程与进程池的整体耗时和每页耗时"""
+    import os
+    import control
+
+    text = "\n".join([(SAMPLE + " ") * 40] * n_paragraphs)
+    t, pages = timeit(control.paginate_text, text, font_size, font_file, repeat=1)
+    print(f"[pages] paginate {len(pages)} A4 pages in {t:.2f}s")
+    for workers in (1, os.cpu_count()):
+        t, out = timeit(lambda: list(control.text_to_pages_gcode(text, font_size, font_file, workers=workers)),
+                        repeat=1)
+        print(f"[pages] workers={workers:<3} {len(out)} pages in {t:.2f}s ({len(out) / t:.1f} pages/s)")
+
+
+def bench_line_cache(font_file=FONT, n_lines=60):
+    """编辑器增量生成: 整篇生成与改一个字、插入一行后用行缓存重新生成的耗时"""
+    import control
+    from line_cache import LineCache
+
+    lines = [f"{SAMPLE} {i}" for i in range(n_lines)]
+    text = "\n".join(lines)
+    edited = "\n".join(lines[:n_lines // 2] + [lines[n_lines // 2] + "!"] + lines[n_lines // 2 + 1:])
+    inserted = "New line\n" + edited
+    cache = LineCache()
+    t_full, _ = timeit(control.text_to_gcode, text, font_name=font_file, repeat=1)
+    t_cold, _ = timeit(cache.generate, text, font_name=font_file, repeat=1)
+    t_edit, _ = timeit(cache.generate, edited, font_name=font_file, repeat=1)
+    t_insert, _ = timeit(cache.generate, inserted, font_name=font_file, repeat=1)
+    print(f"[line_cache] {n_lines} lines: text_to_gcode {t_full * 1e3:.0f} ms, cold {t_cold * 1e3:.0f} ms, "
+          f"one-char edit {t_edit * 1e3:.1f} ms, insert line {t_insert * 1e3:.1f} ms")
+
+
+def bench_unipen(label_file="c_samples.txt"):
+    """UNIPEN 样本: 逐个数字解析与整文件 NumPy 解析的对照, 以及打开已编译缓存的耗时"""
+    import os
+    import unipen
+
+    path = os.path.join(unipen.DEFAULT_FOLDER, label_file)
+    if not os.path.exists(path):
+        print(f"[unipen] {path} not found, skipped")
+        return
+    with open(path, "rb") as f:
+        data = f.read()
+
+    def loop_parse(lines):
+        # eng/test.py 原来的做法
+        out = []
+        for line in lines:
+            parts = line.split()
+            if parts:
+                coords = parts[1:]
+                out.append(([float(coords[i]) for i in range(0, len(coords), 2)],
+                            [float(coords[i + 1]) for i in range(0, len(coords), 2)]))
+        return out
+
+    t_loop, samples = timeit(loop_parse, data.decode().splitlines())
+    t_bulk, _ = timeit(unipen.parse_samples, data)
+    unipen.load()  # 没有缓存时先编译
+    t_load, library = timeit(unipen.load)
+    print(f"[unipen] {label_file} ({len(data) / 1e6:.1f} MB, {len(samples)} samples): per-float {t_loop * 1e3:.0f} ms, "
+          f"bulk {t_bulk * 1e3:.0f} ms; cached library ({len(library)} samples) opens in {t_load * 1e3:.0f} ms")
+
+
+def bench_handwriting(n_lines=200):
+    """手写体: 变体库排版与整篇生成 G-code 的每秒字符数"""
+    import control
+    import handwriting
+
+    hand = handwriting.load()
+    text = "\n".join([SAMPLE] * n_lines)
+    n_chars = len(text) - text.count("\n")
+    t_layout, _ = timeit(lambda: [hand.layout(line, 8.) for line in text.split("\n")])
+    t_gcode, (gcode, _) = timeit(control.text_to_gcode, text, font_size=8, mode="handwriting", repeat=1)
+    print(f"[handwriting] {n_chars} chars ({len(hand.variants)} variants): layout {n_chars / t_layout:,.0f} chars/s, "
+          f"text_to_gcode {n_chars / t_gcode:,.0f} chars/s ({gcode.count(chr(10)) + 1} lines)")
+
+
+def bench_spooler(n_jobs=12, line_time=0.001):
+    """打印队列: 三台 pty 模拟 GRBL (其中一台中途掉线) 同时发送, 报告各机器利用率"""
+    import control
+    from fake_grbl import FakeGrbl
+    from spooler import Machine, format_report, spool
+
+    jobs = [(f"letter-{i}", control.text_to_gcode(f"{SAMPLE[:20]} {i}", font_size=10)[0]) for i in range(n_jobs)]
+    fakes = [FakeGrbl(line_time=line_time), FakeGrbl(line_time=line_time, fail_after=200),
+             FakeGrbl(line_time=2 * line_time)]
+    for fake in fakes:
+        fake.start()
+    try:
+        machines = [Machine(f"fake-{i}", fake.port, wake_delay=0) for i, fake in enumerate(fakes)]
+        results, spooler = spool(jobs, machines, stall_timeout=5, log=lambda message: None)
+    finally:
+        for fake in fakes:
+            fake.close()
+    print("[spooler] " + format_report(results, spooler).replace("\n", "\n[spooler] "))
+
+
+def bench_compact(font_file=FONT, baudrate=115200):
+    """G-code 压缩: 每种模式节省的字节数, 以及 115200 波特下节省的线路时间"""
+    import compact
+    import control
+
+    text = "\n".join([SAMPLE] * 20)
+    for mode, kwargs in (("outline", {}), ("arcs", {"arcs": True}), ("centerline", {"mode": "centerline"})):
+        gcode, _ = control.text_to_gcode(text, font_size=8, font_name=font_file, **kwargs)
+        t, (_, report) = timeit(compact.compact_gcode, gcode, repeat=1)
+        wire = 10 / baudrate  # 8N1: 每字节 10 位
+        print(f"[compact] {mode}: {compact.format_report(report)}; wire time {report['bytes_before'] * wire:.1f} s -> "
+              f"{report['bytes_after'] * wire:.1f} s, compact+verify {report['lines_before'] / t:,.0f} lines/s")
+
+
+if __name__ == "__main__":
+    font_file = sys.argv[1] if len(sys.argv) > 1 else FONT
+    bench_emit(font_file)
+    bench_travel()
+    bench_prune(font_file)
+    bench_centerline(font_file)
+    bench_preview(font_file)
+    bench_estimate(font_file)
+    bench_simplify(font_file)
+    bench_pages(font_file)
+    bench_line_cache(font_file)
+    bench_unipen()
+    bench_handwriting()
+    bench_spooler()
+    bench_compact(font_file)
+    bench_startup()
@@ -0,0 +1,110 @@
+"""
+单线 (中心线) 字体
+
+轮廓字体的每一笔会沿字形两侧各画一遍。这里把缓存的字形轮廓栅格化, 用 easy_skel 的骨架流程
+提取中心线, 再拆成有序折线, 每一笔只画一遍。笔画按字形 (与字号无关) 缓存, 排版时缩放平移。
+"""
+from functools import lru_cache
+
+import cv2
+import numpy as np
+
+import curves
+import easy_skel
+import emit
+import glyph_cache as gc
+
+# 栅格化分辨率: 一个 em (FONT_SCALE) 对应的像素数, 与 easy_skel 的 256px 字形图一致
+EM_PIXELS = 256
+PAD = 4
+MIN_BRANCH = 15  # 短于此 (像素) 的支线视为骨架毛刺
+EPSILON = 1.0    # 折线简化容差 (像素)
+
+
+def rasterize(vertices, codes, scale):
+    """
+    按非零环绕规则把字形轮廓填充为位图
+
+    每个闭合轮廓单独填充, 按方向 (有向面积的符号) 累加 +1/-1, 结果非零处为字形内部,
+    重叠的同向轮廓 (常见于 CJK 字体) 不会像奇偶规则那样被挖空。
+
+    返回:
+        img (np.ndarray): uint8 0/255 位图
+        origin (tuple): 位图左上角对应的字形坐标 (x0, y1), 像素 (c, r) 对应 (x0 + c/scale, y1 - r/scale)
+    """
+    vertices, codes = curves.flatten(vertices, codes, 0.5 / scale)
+    x0, y0 = vertices.min(axis=0) - PAD / scale
+    x1, y1 = vertices.max(axis=0) + PAD / scale
+    w = int(np.ceil((x1 - x0) * scale)) + 1
+    h = int(np.ceil((y1 - y0) * scale)) + 1
+    px = np.stack([(vertices[:, 0] - x0) * scale, (y1 - vertices[:, 1]) * scale], axis=1)
+
+    winding = np.zeros((h, w), dtype=np.int16)
+    layer = np.zeros((h, w), dtype=np.uint8)
+    heads = np.r_[np.flatnonzero(codes == emit.MOVETO), len(codes)]
+    for lo, hi in zip(heads[:-1], heads[1:]):
+        ring = px[lo:hi][codes[lo:hi] != emit.CLOSEPOLY]
+        if len(ring) < 3:
+            continue
+        x, y = ring.T
+        area = np.dot(x, np.roll(y, -1)) - np.dot(y, np.roll(x, -1))
+        layer[:] = 0
+        # shift=4: 1/16 像素精度
+        cv2.fillPoly(layer, [np.round(ring * 16).astype(np.int32)], 1, lineType=cv2.LINE_8, shift=4)
+        winding += np.where(area > 0, 1, -1).astype(np.int16) * layer
+    img = np.where(winding != 0, 255, 0).astype(np.uint8)
+    return img, (x0, y1)
+
+
+@lru_cache(maxsize=4096)
+def glyph_strokes(font_file, face_index, char):
+    """
+    字形的中心线笔画, 字形原点处、FONT_SCALE 字号下的坐标
+
+    返回:
+        vertices (np.ndarray), codes (np.ndarray): 只含 MOVETO/LINETO, 每个 MOVETO 开始一笔
+    """
+    glyph = gc.default_cache().get(font_file, face_index, char, gc.FONT_SCALE)
+    if not len(glyph.codes):
+        return np.empty((0, 2)), np.empty(0, dtype=np.uint8)
+    scale = EM_PIXELS / gc.FONT_SCALE
+    img, (x0, y1) = rasterize(glyph.vertices, glyph.codes, scale)
+    skel = easy_skel.safe_skeletonize(img)
+    pruned = easy_skel.remove_short_branches_any_dir(skel, MIN_BRANCH)
+    strokes = easy_skel.glyph_strokes(skel, pruned, EPSILON)
+    if not strokes:
+        return np.empty((0, 2)), np.empty(0, dtype=np.uint8)
+
+    pts = np.concatenate(strokes)
+    vertices = np.stack([x0 + pts[:, 0] / scale, y1 - pts[:, 1] / scale], axis=1)
+    codes = np.full(len(pts), emit.LINETO, dtype=np.uint8)
+    codes[np.cumsum([0] + [len(s) for s in strokes[:-1]])] = emit.MOVETO
+    return vertices, codes
+
+
+def layout_line(line, font_file, size, x=0., y=0., face_index=0, cache=None):
+    """
+    中心线版本的 glyph_cache.layout_line: 字距与前进宽度相同, 字形换成中心线笔画
+
+    返回:
+        vertices (np.ndarray), codes (np.ndarray)
+    """
+    if cache is None:
+        cache = gc.default_cache()
+    scale = size / gc.FONT_SCALE
+    verts, codes = [], []
+    pen_x = x
+    prev_index = 0
+    for char in line:
+        glyph = cache.get(font_file, face_index, char, size)
+        pen_x += cache.kerning(font_file, face_index, prev_index, glyph.index, size)
+        stroke_verts, stroke_codes = glyph_strokes(font_file, face_index, char)
+        if len(stroke_codes):
+            verts.append(stroke_verts * scale + (pen_x, y))
+            codes.append(stroke_codes)
+        pen_x += glyph.advance
+        prev_index = glyph.index
+
+    if not verts:
+        return np.empty((0, 2)), np.empty(0, dtype=np.uint8)
+    return np.concatenate(verts), np.concatenate(codes)
@@ -0,0 +1,273 @@
+"""
+G-code 线路压缩: 去掉串口上不必要的字节, 运动不变
+
+text_to_gcode 的输出为了可读, 每行都写 G1、坐标固定三位小数、没变的轴也重发、文件头带注释。
+GRBL 的运动模式、进给速度、单位和坐标模式都是模态的, 字之间的空格也会被忽略, 因此上传前可以:
+    - 去掉注释、空格和空行;
+    - 运动模式 (G0/G1/G2/G3) 只在实际运动前与上次发出的不同时才写;
+    - 绝对坐标下与当前位置相同的轴不写 (圆弧至少保留一个轴, 否则 GRBL 报 error:26);
+    - 与上次相同的 F、G20/G21、G90/G91 不写, 没有运动效果的行整行去掉;
+    - 数字去掉多余的零: "0.500" -> ".5", "-0.000" -> "0", "10.000" -> "10"。
+数字只改写法不改数值, verify 用 estimate.parse_gcode 解释压缩前后的程序, 逐条比较运动。
+
+遇到不认识的 G 代码 (G28/G30/G92/G53 等) 时该行原样保留 (只去注释和空格), 之后位置视为未知,
+直到每个轴重新写出。
+"""
+import re
+from array import array
+
+import grbl
+
+_COMMENT = re.compile(r"\(.*?\)|;.*")
+_WORD = re.compile(r"([A-Z])\s*([-+]?(?:\d+\.?\d*|\.\d+))")
+_AXES = "XYZ"
+_MOTION = {"0": 0, "1": 1, "2": 2, "3": 3}
+# 会被改写或按模态省略的 G 代码; 其他 G 代码的行原样保留
+_KNOWN_G = {"0", "1", "2", "3", "4", "17", "20", "21", "90", "91", "94"}
+
+
+def trim_number(text):
+    """去掉数字中多余的符号和零, 数值不变: "-0.500" -> "-.5", "+10.000" -> "10", "-0.000" -> "0" """
+    sign = "-" if text[0] == "-" else ""
+    text = text.lstrip("+-")
+    whole, _, frac = text.partition(".")
+    whole = whole.lstrip("0")
+    frac = frac.rstrip("0")
+    out = whole + ("." + frac if frac else "")
+    if not out:
+        return "0"
+    return sign + out
+
+
+class Compactor:
+    """
+    逐行压缩, 保存 GRBL 一侧的模态状态 (已经发出的运动模式、进给速度、单位、坐标模式和位置)
+
+    用法:
+        compactor = Compactor()
+        for line in compactor.compact(lines): ser.write(...)
+        print(compactor.report())
+        compactor.source_line(n)  # 发出的第 n 行来自输入的第几行
+    """
+
+    def __init__(self):
+        self.motion = None      # 程序当前的运动模式
+        self.sent_motion = None  # 最后发给控制器的运动模式
+        self.feed = None
+        self.units = None
+        self.relative = None
+        self.position = [None, None, None]
+        self.lines_in = self.lines_out = 0
+        self.bytes_in = self.bytes_out = 0
+        self.sources = array("q")  # 每个输出行对应的输入行号 (从 0 开始)
+
+    def line(self, raw):
+        """压缩一行; 整行可以去掉时返回空字符串"""
+        raw = raw.strip()
+        self.lines_in += 1
+        self.bytes_in += len(raw.encode("utf-8")) + 1 if raw else 0
+        out = self._line(raw)
+        if out:
+            self.lines_out += 1
+            self.bytes_out += len(out) + 1
+            self.sources.append(self.lines_in - 1)
+        return out
+
+    def source_line(self, line_no):
+        """输出的第 line_no 行 (从 0 开始) 对应的输入行号, 用于把控制器的报错对应回原来的 G-code"""
+        return self.sources[line_no]
+
+    def _line(self, raw):
+        if not raw or raw.startswith("("):
+            return ""
+        if raw[0] in "$%":
+            return raw
+        code = _COMMENT.sub("", raw).upper()
+        words = _WORD.findall(code)
+        if not words:
+            return ""
+        words = [(letter, trim_number(value)) for letter, value in words]
+        g_codes = [value for letter, value in words if letter == "G"]
+        if any(g not in _KNOWN_G for g in g_codes):
+            # 回原点、坐标系设置等: 原样发出, 之后位置未知
+            self.position = [None, None, None]
+            for g in g_codes:
+                if g in _MOTION:
+                    self.motion = self.sent_motion = _MOTION[g]
+            return "".join(letter + value for letter, value in words)
+        if "4" in g_codes:
+            # 暂停 (G4 P..): 不含运动, 原样发出
+            return "".join(letter + value for letter, value in words)
+
+        out = []
+        axes = {}
+        arc_words = []
+        for letter, value in words:
+            if letter == "G":
+                if value in _MOTION:
+                    self.motion = _MOTION[value]
+                elif value in ("20", "21"):
+                    if value != self.units:
+                        if self.units is not None:
+                            self.position = [None, None, None]
+                            self.feed = None
+                        self.units = value
+                        out.append("G" + value)
+                elif value in ("90", "91"):
+                    relative = value == "91"
+                    if relative != self.relative:
+                        self.relative = relative
+                        out.append("G" + value)
+                else:
+                    out.append("G" + value)  # G17/G94: 保持不变
+            elif letter == "F":
+                if value != self.feed:
+                    self.feed = value
+                    out.append("F" + value)
+            elif letter in _AXES:
+                axes[letter] = value
+            elif letter in "IJKR":
+                arc_words.append(letter + value)
+            else:
+                out.append(letter + value)  # M/S/T/N 等
+
+        motion_words = []
+        arc = self.motion in (2, 3) and arc_words
+        for letter, value in axes.items():
+            i = _AXES.index(letter)
+            known = self.position[i]
+            if self.relative:
+                if float(value) != 0 or arc:
+                    motion_words.append(letter + value)
+                if known is not None:
+                    self.position[i] = known + float(value)
+            else:
+                if known is None or float(value) != known:
+                    motion_words.append(letter + value)
+                self.position[i] = float(value)
+        if arc and axes and not motion_words:
+            # 终点与起点相同的整圆: 至少写一个轴
+            letter = next(iter(axes))
+            motion_words.append(letter + axes[letter])
+        if motion_words:
+            if self.motion != self.sent_motion:
+                motion_words.insert(0, f"G{self.motion}")
+                self.sent_motion = self.motion
+            motion_words.extend(arc_words if arc else [])
+        return "".join(out + motion_words)
+
+    def compact(self, lines):
+        """逐行压缩, 跳过被整行去掉的行 (可以是生成器, 边压缩边发送)"""
+        for raw in lines:
+            out = self.line(raw)
+            if out:
+                yield out
+
+    def report(self):
+        saved = self.bytes_in - self.bytes_out
+        return {
+            "lines_before": self.lines_in,
+            "lines_after": self.lines_out,
+            "bytes_before": self.bytes_in,
+            "bytes_after": self.bytes_out,
+            "bytes_saved": saved,
+            "ratio": self.bytes_out / self.bytes_in if self.bytes_in else 1.,
+        }
+
+
+def _commands(lines):
+    # 运动以外的指令 (M/S/T 和 $、% 行), 按出现顺序
+    commands = []
+    for raw in lines:
+        raw = raw.strip()
+        if raw[:1] in ("$", "%"):
+            commands.append(raw)
+            continue
+        for letter, value in _WORD.findall(_COMMENT.sub("", raw).upper()):
+            if letter in "MST":
+                commands.append(letter + trim_number(value))
+    return commands
+
+
+def _motions(lines):
+    import numpy as np
+    import estimate
+
+    program = estimate.parse_gcode(lines)
+    # 起止点相同的直线/快速移动没有运动效果, 压缩时会被去掉
+    arc = np.isin(program["motion"], (estimate.ARC_CW, estimate.ARC_CCW))
+    keep = arc | np.any(program["start"] != program["end"], axis=1)
+    linear = program["motion"][keep] != estimate.RAPID
+    return {
+        "motion": program["motion"][keep],
+        "end": program["end"][keep],
+        # 快速移动不用进给速度, 非圆弧的圆心无意义
+        "feed": np.where(linear, program["feed"][keep], 0.),
+        "center": np.where(arc[keep][:, None], program["center"][keep], 0.),
+        "dwell": [p for _, p in program["dwell"]],
+    }
+
+
+def verify(original, compacted):
+    """
+    检查两段程序的运动是否相同: 每段运动的类型、终点、进给速度、圆心, 暂停, 以及 M/S/T 指令序列
+
+    返回:
+        (bool, str): 是否相同, 以及第一处不同的说明
+    """
+    import numpy as np
+
+    original, compacted = list(original), list(compacted)
+    a, b = _motions(original), _motions(compacted)
+    if len(a["motion"]) != len(b["motion"]):
+        return False, f"{len(a['motion'])} motions before, {len(b['motion'])} after"
+    for key in ("motion", "end", "feed", "center"):
+        diff = a[key] != b[key]
+        if diff.any():
+            i = int(np.flatnonzero(diff.reshape(len(diff), -1).any(axis=1))[0])
+            return False, f"motion {i}: {key} {a[key][i]} != {b[key][i]}"
+    if a["dwell"] != b["dwell"]:
+        return False, "dwell commands differ"
+    if _commands(original) != _commands(compacted):
+        return False, "M/S/T commands differ"
+    return True, ""
+
+
+def compact_gcode(gcode, is_file=False, check=True):
+    """
+    压缩整段 G-code
+
+    参数:
+        gcode: 文件路径 (is_file=True)、文本、行列表或生成器, 同 grbl.iter_gcode_lines
+        check (bool): 用 verify 检查运动不变, 不同时抛出 ValueError
+
+    返回:
+        text (str), report (dict): lines_before/after, bytes_before/after, bytes_saved, ratio
+    """
+    lines = grbl.read_gcode_lines(gcode, is_file)
+    compactor = Compactor()
+    out = list(compactor.compact(lines))
+    if check:
+        same, reason = verify(lines, out)
+        if not same:
+            raise ValueError(f"Compacted G-code changes the motion: {reason}")
+    return "\n".join(out), compactor.report()
+
+
+def format_report(report):
+    return (f"{report['lines_before']} -> {report['lines_after']} lines, "
+            f"{report['bytes_before']:,} -> {report['bytes_after']:,} bytes "
+            f"({report['bytes_saved']:,} saved, {1 - report['ratio']:.1%})")
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) < 2:
+        print("usage: python compact.py input.gcode [output.gcode]")
+        sys.exit(2)
+    text, report = compact_gcode(sys.argv[1], is_file=True)
+    print(format_report(report))
+    if len(sys.argv) > 2:
+        with open(sys.argv[2], "w", encoding="utf-8") as f:
+            f.write(text + "\n")
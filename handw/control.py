@@ -1,67 +1,233 @@
-import matplotlib.pyplot as plt
-from matplotlib.textpath import TextPath
-from matplotlib.font_manager import FontProperties
-from matplotlib.patches import PathPatch
-from matplotlib.path import Path
-import numpy as np
-import utils as ul
 import os
-import serial
-import time
+import utils as ul
+import font_index
 from typing import Union
 
-def multiline_text_path(text, font_size=20, font_name="DejaVu Sans"):
-    # font_prop = FontProperties(family=font_name)
-    font_prop = FontProperties(fname=font_name)
+# matplotlib/numpy/skimage/pyserial 导入很慢, 用到对应功能时才导入, GUI 启动不必等待
+plt = ul.lazy_import("matplotlib.pyplot")
+patches = ul.lazy_import("matplotlib.patches")
+mpath = ul.lazy_import("matplotlib.path")
+np = ul.lazy_import("numpy")
+gc = ul.lazy_import("glyph_cache")
+centerline = ul.lazy_import("centerline")
+atlas = ul.lazy_import("atlas")
+emit = ul.lazy_import("emit")
+grbl = ul.lazy_import("grbl")
+layout = ul.lazy_import("layout")
+toolpath = ul.lazy_import("toolpath")
+handwriting = ul.lazy_import("handwriting")
+compaction = ul.lazy_import("compact")
+
+MODES = ("outline", "centerline", "handwriting")
+LINE_SPACING = 1.2  # 行距, 字号的倍数
+
+def iter_line_paths(text, font_size=20, font_name="DejaVu Sans", face_index=0, cache=None, mode="outline"):
+    """
+    逐行产出每行文字的 (vertices, codes), 不把整篇拼成一个大数组
+
+    mode: "outline" 沿字形轮廓绘制, "centerline" 沿骨架中心线单线绘制 (每笔只画一遍),
+          "handwriting" 用 UNIPEN 真实笔迹排版 (见 handwriting 模块)
+    font_name 是 easy_skel 生成的 .atlas 图集时, 直接使用其中预先提取的笔画; 是 .hand 变体库时按手写体排版
+    """
+    layout_line = _layout_line(font_name, mode)
     lines = text.split("\n")
-    line_spacing = font_size * 1.2
+    line_spacing = font_size * LINE_SPACING
 
-    paths = []
     for i, line in enumerate(lines):
         y_offset = -i * line_spacing
-        path = TextPath((0, y_offset), line, size=font_size, prop=font_prop)
-        paths.append(path)
-
-    all_vertices = np.concatenate([p.vertices for p in paths])
-    all_codes = np.concatenate([p.codes for p in paths])
-    return Path(all_vertices, all_codes)
-
-def text_to_gcode(text, font_size=20, font_name="DejaVu Sans", feedrate=1000, z_safe=5, z_draw=-1):
-    text_path = multiline_text_path(text, font_size, font_name)
-
-    vertices = text_path.vertices
-    codes = text_path.codes
-
-    gcode = []
-    gcode.append("G21 ; 设置单位为毫米")
-    gcode.append("G90 ; 使用绝对坐标")
-    gcode.append(f"G1 F{feedrate} ; 设置进给速度")
-
-    pen_down = False
-    for code, (x, y) in zip(codes, vertices):
-        if code == 1:  # MOVETO
-            if pen_down:
-                gcode.append(f"G0 Z{z_safe}")
-                pen_down = False
-            gcode.append(f"G0 X{x:.3f} Y{y:.3f}")
-            gcode.append(f"G1 Z{z_draw}")
-            pen_down = True
-        elif code == 2:  # LINETO
-            gcode.append(f"G1 X{x:.3f} Y{y:.3f}")
-        elif code == 79:  # CLOSEPOLY
-            if pen_down:
-                gcode.append(f"G0 Z{z_safe}")
-                pen_down = False
-
-    if pen_down:
-        gcode.append(f"G0 Z{z_safe}")
-
-    gcode.append("M2 ; 程序结束")
-    return "\n".join(gcode), text_path
+        yield layout_line(line, font_name, font_size, y=y_offset, face_index=face_index, cache=cache)
+
+def _layout_line(font_name, mode):
+    # 字形轮廓来自 glyph_cache, 每个字形只解析一次, 排版时按偏移平移
+    if mode not in MODES:
+        raise ValueError(f"Unknown mode {mode!r}, expected one of {MODES}")
+    if atlas.is_atlas(font_name):
+        return atlas.layout_line
+    if mode == "handwriting" or handwriting.is_handwriting(font_name):
+        return handwriting.layout_line
+    if mode == "centerline":
+        return centerline.layout_line
+    return gc.layout_line
+
+def multiline_text_path(text, font_size=20, font_name="DejaVu Sans", face_index=0, cache=None, mode="outline"):
+    vertices, codes = zip(*iter_line_paths(text, font_size, font_name, face_index, cache, mode))
+    all_vertices = np.concatenate(vertices)
+    all_codes = np.concatenate(codes)
+    return mpath.Path(all_vertices, all_codes)
+
+def text_to_toolpath(text, font_size=20, font_name="DejaVu Sans", feedrate=1000, tolerance=0.05, arcs=False,
+                     optimize=False, mode="outline", face_index=0, simplify=0., log=None):
+    """
+    文本转 toolpath 刀路 (结构化数组, 见 toolpath 模块), 参数同 text_to_gcode
+
+    刀路可以直接交给 emit.emit_toolpath (导出)、estimate.estimate (时间估算)、
+    PreviewWindow.draw_path (预览) 和 upload_gcode_to_grbl (上传), 中间不经过 G-code 文本。
+
+    返回:
+        tp (np.ndarray), text_path (matplotlib.path.Path)
+    """
+    paths, parts = [], []
+    vertices_before = 0
+    for i, line in enumerate(text.split("\n")):
+        y = -i * font_size * LINE_SPACING
+        vertices, codes, tp, flattened = _line_toolpath(line, font_size, font_name, feedrate, tolerance, arcs,
+                                                        False, mode, face_index, simplify)
+        paths.append((vertices + (0., y), codes))
+        parts.append(toolpath.translate(tp, 0., y))
+        vertices_before += flattened
+    vertices, codes = zip(*paths)
+    text_path = mpath.Path(np.concatenate(vertices), np.concatenate(codes))
+    tp = toolpath.concatenate(parts)
+    if simplify > 0 and log:
+        # 简化只删 LINETO 顶点, 每删一个顶点少一行 G1
+        log(f"Simplify ({simplify} mm): {vertices_before} -> {len(tp)} vertices, "
+            f"{vertices_before - len(tp)} fewer G-code lines")
+    if optimize:
+        tp, report = toolpath.optimize(tp)
+        if log:
+            log(f"Pen-up travel: {report['before']:.1f} mm -> {report['after']:.1f} mm "
+                f"({report['strokes']} strokes)")
+    return tp, text_path
+
+def line_toolpath(line, font_size=20, font_name="DejaVu Sans", feedrate=1000, tolerance=0.05, arcs=False,
+                  optimize=False, mode="outline", face_index=0, simplify=0.):
+    """
+    单行文字在原点 (0, 0) 处的路径和刀路, 参数同 text_to_gcode (optimize 只重排这一行的笔画)
+
+    整篇、逐行、分页生成和编辑器的行缓存 (line_cache) 都用它生成每行的刀路, 再用 toolpath.translate
+    平移到该行的位置, 因此各处输出的 G-code 逐字节一致。
+
+    返回:
+        vertices, codes (排版后的路径, 用于预览), tp (刀路)
+    """
+    vertices, codes, tp, _ = _line_toolpath(line, font_size, font_name, feedrate, tolerance, arcs, optimize, mode,
+                                            face_index, simplify)
+    return vertices, codes, tp
+
+def _line_toolpath(line, font_size, font_name, feedrate, tolerance, arcs, optimize, mode, face_index, simplify):
+    vertices, codes = _layout_line(font_name, mode)(line, font_name, font_size, face_index=face_index)
+    # 另外返回简化前的顶点数, 供 text_to_toolpath 报告
+    tp = toolpath.flatten(toolpath.from_path(vertices, codes, feed=feedrate), tolerance, arcs)
+    flattened = len(tp)
+    if simplify > 0:
+        tp = toolpath.simplify(tp, simplify)
+    if optimize:
+        tp, _ = toolpath.optimize(tp)
+    return vertices, codes, tp, flattened
+
+def text_to_gcode(text, font_size=20, font_name="DejaVu Sans", feedrate=1000, z_safe=5, z_draw=-1,
+                  tolerance=0.05, arcs=False, optimize=False, mode="outline", face_index=0, simplify=0., log=None):
+    """
+    文本转 G-code
+
+    参数:
+        tolerance (float): 曲线展开/拟合允许的最大偏差 (mm)
+        arcs (bool): True 时把曲线拟合为 G2/G3 圆弧, 否则展开为 G1 折线
+        optimize (bool): True 时重排笔画顺序/方向以减少抬笔空走
+        mode (str): "outline" 画字形轮廓; "centerline" 画骨架中心线, 每笔只画一遍, 落笔行程约减半;
+            "handwriting" 用 UNIPEN 笔迹库中的真实笔迹, 每个字符一笔
+        face_index (int): .ttc 字体集合中的 face 索引, 见 resolve_font
+        simplify (float): 大于 0 时用 RDP 删掉偏差不超过该值 (mm) 的折线顶点, 减少 G1 行数
+        log (callable): 给出时 (如 print) 输出简化和抬笔空走的统计, 默认不输出
+    """
+    tp, text_path = text_to_toolpath(text, font_size, font_name, feedrate, tolerance, arcs, optimize, mode,
+                                     face_index, simplify, log)
+    return emit.emit_toolpath(tp, z_safe, z_draw), text_path
+
+def text_to_gcode_iter(text, font_size=20, font_name="DejaVu Sans", feedrate=1000, z_safe=5, z_draw=-1,
+                       tolerance=0.05, arcs=False, optimize=False, mode="outline", face_index=0, simplify=0.):
+    """
+    text_to_gcode 的生成器版本: 逐行文字生成并产出 G-code
+
+    每次产出一段以换行分隔的 G-code (文件头、每行文字一段、文件尾), 段尾不带换行,
+    "\n".join 后与 text_to_gcode 的输出一致 (optimize=True 时只在每行内从该行起点开始重排笔画)。
+    内存占用与文档长度无关, 导出和上传可以在生成完成前就开始。
+    """
+    yield from emit.iter_toolpaths(_line_toolpaths(text, font_size, font_name, feedrate, tolerance, arcs, optimize,
+                                                   mode, face_index, simplify), z_safe, z_draw, feedrate=feedrate)
+
+def _line_toolpaths(text, font_size, font_name, feedrate, tolerance, arcs, optimize, mode, face_index, simplify):
+    # 逐行文字的刀路, 平移到各行的位置; optimize 时每行从该行的起点开始重排 (与 line_cache 相同)
+    for i, line in enumerate(text.split("\n")):
+        _, _, tp = line_toolpath(line, font_size, font_name, feedrate, tolerance, arcs, optimize, mode, face_index,
+                                 simplify)
+        yield toolpath.translate(tp, 0., -i * font_size * LINE_SPACING)
+
+def paginate_text(text, font_size=20, font_name="DejaVu Sans", face_index=0, page_size="A4", margins=20,
+                  line_spacing=1.2, cache=None, mode="outline"):
+    """
+    按纸张和页边距自动换行、分页, 返回 layout.Page 列表 (只含每行文字和基线位置)
+
+    字宽与 layout_line 的排版一致: 图集用图集中的前进宽度, 手写体用变体库中每个字符的前进宽度,
+    其余用 glyph_cache 的前进宽度和字距。
+    """
+    if atlas.is_atlas(font_name):
+        advances = atlas.line_advances
+    elif mode == "handwriting" or handwriting.is_handwriting(font_name):
+        advances = handwriting.line_advances
+    else:
+        advances = gc.line_advances
+    measure = lambda line: advances(line, font_name, font_size, face_index=face_index, cache=cache)
+    return layout.paginate(text, measure, font_size, page_size, margins, line_spacing)
+
+def page_path(page, font_size=20, font_name="DejaVu Sans", face_index=0, cache=None, mode="outline"):
+    """一页文字的路径 (vertices, codes), 坐标以页面左下角为原点"""
+    layout_line = _layout_line(font_name, mode)
+    paths = [layout_line(line, font_name, font_size, x, y, face_index=face_index, cache=cache)
+             for line, x, y in page.lines]
+    if not paths:
+        return np.empty((0, 2)), np.empty(0, dtype=np.uint8)
+    vertices, codes = zip(*paths)
+    return np.concatenate(vertices), np.concatenate(codes)
+
+def page_to_gcode(page, font_size=20, font_name="DejaVu Sans", feedrate=1000, z_safe=5, z_draw=-1,
+                  tolerance=0.05, arcs=False, optimize=False, mode="outline", face_index=0, simplify=0.):
+    """一页的完整 G-code (含文件头尾), 参数同 text_to_gcode"""
+    parts = []
+    for line, x, y in page.lines:
+        _, _, tp = line_toolpath(line, font_size, font_name, feedrate, tolerance, arcs, False, mode, face_index,
+                                 simplify)
+        parts.append(toolpath.translate(tp, x, y))
+    tp = toolpath.concatenate(parts)
+    if optimize:
+        tp, _ = toolpath.optimize(tp)
+    return emit.emit_toolpath(tp, z_safe, z_draw)
+
+def _page_job(job):
+    # 子进程入口: 必须是模块级函数才能 pickle
+    page, options = job
+    return page.number, page_to_gcode(page, **options)
+
+def text_to_pages_gcode(text, font_size=20, font_name="DejaVu Sans", face_index=0, page_size="A4", margins=20,
+                        line_spacing=1.2, workers=None, **options):
+    """
+    整篇文字排版分页, 各页在多个进程中并行生成 G-code, 按页码顺序逐页产出 (页码, gcode)
+
+    参数:
+        page_size, margins, line_spacing: 见 paginate_text
+        workers (int): 进程数, None 为 CPU 核数, 1 在当前进程中生成
+        options: 传给 page_to_gcode 的其余参数 (feedrate, mode, optimize, simplify ...)
+    """
+    pages = paginate_text(text, font_size, font_name, face_index, page_size, margins, line_spacing,
+                          mode=options.get("mode", "outline"))
+    options.update(font_size=font_size, font_name=font_name, face_index=face_index)
+    if len(pages) == 1:
+        workers = 1  # 只有一页时不值得启动进程池
+    yield from ul.ordered_map(_page_job, ((page, options) for page in pages), workers)
+
+def export_pages(text, folder, prefix="page", **kwargs):
+    """逐页生成并保存为 folder/page_001.gcode ..., 参数同 text_to_pages_gcode; 返回文件列表"""
+    os.makedirs(folder, exist_ok=True)
+    files = []
+    for number, gcode in text_to_pages_gcode(text, **kwargs):
+        filename = os.path.join(folder, f"{prefix}_{number:03d}.gcode")
+        export_gcode_to_file(gcode, filename)
+        files.append(filename)
+    return files
 
 def preview_text_path(text_path):
     fig, ax = plt.subplots()
-    patch = PathPatch(text_path, facecolor='black', edgecolor='black', lw=1)
+    patch = patches.PathPatch(text_path, facecolor='black', edgecolor='black', lw=1)
     ax.add_patch(patch)
 
     ax.set_xlim(text_path.vertices[:, 0].min() - 10, text_path.vertices[:, 0].max() + 10)
@@ -79,8 +245,18 @@ def list_fonts():
 
 
 def export_gcode_to_file(gcode, filename):
+    """
+    保存 G-code; gcode 可以是完整字符串, 也可以是 text_to_gcode_iter 这样逐段产出的可迭代对象,
+    后者边生成边写入文件
+    """
     with open(filename, 'w') as f:
-        f.write(gcode)
+        if isinstance(gcode, str):
+            f.write(gcode)
+        else:
+            for i, chunk in enumerate(gcode):
+                if i:
+                    f.write("\n")
+                f.write(chunk)
     print(f"G-code saved to {filename}")
 
 def system_fonts():
@@ -91,67 +267,118 @@ def system_fonts():
     }
     return sys_fonts
 
+HW_FONT_DIR = ""  # your font
+_font_index = None
+_font_faces = None
+
+def get_font_faces(refresh=False):
+    """
+    可用字体: 名称 -> font_index.FontFace (文件路径, face 索引, 家族名, 样式)
+
+    字体目录的扫描结果保存在 font_index 的缓存文件里, 只有文件的 mtime/大小变化时才重新解析;
+    本进程内第一次调用后结果留在内存, refresh=True 时重新检查目录。
+    .ttc 字体集合中的每个 face 以其全名单独列出, system_fonts 中的名称保持不变。
+    """
+    global _font_index, _font_faces
+    if _font_faces is not None and not refresh:
+        return _font_faces
+    if _font_index is None:
+        _font_index = font_index.FontIndex()
+    faces = {}
+    for face in _font_index.scan([HW_FONT_DIR]):
+        faces.setdefault(face.full_name, face)
+    for name, path in system_fonts().items():
+        known = _font_index.faces_of(path)
+        faces[name] = known[0] if known else font_index.FontFace(path, 0, name, "Regular", name)
+    _font_index.save()
+    _font_faces = faces
+    return faces
+
 def get_font_support():
-    hw_font_dir = ""  # your font
-    files = ul.list_file(hw_font_dir, suffixes=['.ttf', '.ttc'])
-    fonts = {os.path.basename(file).split('.')[0]:file for file in files}
-    sys_fonts = system_fonts()
-    fonts.update(sys_fonts)
-    return fonts
+    return {name: face.path for name, face in get_font_faces().items()}
+
+def resolve_font(name):
+    """字体名称 -> (字体文件, face 索引); 不在索引中的名称原样返回 (可以是文件路径或家族名)"""
+    face = get_font_faces().get(name)
+    if face is None:
+        return name, 0
+    return face.path, face.face_index
 
 
-def upload_gcode_to_grbl(port: str, baudrate: int, gcode: Union[str, list], is_file: bool = True):
+def upload_gcode_to_grbl(port: str, baudrate: int, gcode: Union[str, list], is_file: bool = True,
+                         streaming: bool = True, progress=None, job=None, on_status=None, compact: bool = False,
+                         z_safe: float = 5):
     """
     上传 G-code 到 GRBL 控制板
     
     参数:
         port (str): 串口端口 (Windows: 'COM3', Linux: '/dev/ttyUSB0')
         baudrate (int): 波特率 (GRBL 默认 115200)
-        gcode (str|list): G-code 文件路径 (is_file=True) 或 G-code 文本/列表 (is_file=False)
-        is_file (bool): True 表示 gcode 是文件路径, False 表示 gcode 是字符串或列表
-    """
-    # 读取 G-code 内容
-    if is_file:
-        if not os.path.exists(gcode):
-            raise FileNotFoundError(f"G-code file not found: {gcode}")
-        with open(gcode, "r", encoding="utf-8") as f:
-            lines = f.readlines()
+        gcode (str|list|iterable): G-code 文件路径 (is_file=True) 或 G-code 文本/列表 (is_file=False);
+            也可以是 text_to_gcode_iter 之类的生成器, 此时后台线程继续生成, 同时开始发送已生成的笔画;
+            或 toolpath 刀路 (text_to_toolpath), 边输出 G-code 边发送
+        is_file (bool): True 表示 gcode 是文件路径, False 表示 gcode 是字符串、列表或生成器
+        streaming (bool): True 使用字符计数流式发送, False 逐行等待 ok
+        progress (callable): 进度回调 progress(done, total)
+        job (grbl.StreamJob): 暂停/继续/取消控制
+        on_status (callable): 机器状态回调, 发送过程中定期以 ? 查询位置
+        compact (bool): True 时发送前压缩 G-code (见 compact 模块): 去掉注释、空格、重复的模态字和没变的轴,
+            数字去掉多余的零; 完整的文本/列表先用 compact.verify 检查运动不变, 生成器边压缩边发送。
+            progress 和 errors 中的行号仍按原 G-code (去掉空行和注释行后) 计, lines 为实际发送的行数
+        z_safe (float): 取消上传后抬笔的高度
+
+    返回:
+        dict: 发送统计 (lines, seconds, lines_per_sec, errors); compact=True 时另有 compaction (见 Compactor.report)
+    """
+    if not isinstance(gcode, (str, list)) and toolpath.is_toolpath(gcode):
+        gcode, is_file = emit.iter_toolpath(gcode), False
+    if is_file or isinstance(gcode, (str, list)):
+        lines = grbl.read_gcode_lines(gcode, is_file)
     else:
-        if isinstance(gcode, str):
-            lines = gcode.splitlines()
-        elif isinstance(gcode, list):
-            lines = gcode
+        lines = ul.prefetch(grbl.iter_gcode_lines(gcode, is_file=False))
+    if compact:
+        compactor = compaction.Compactor()
+        original = lines if isinstance(lines, list) else None
+        if original is not None:
+            lines = list(compactor.compact(original))
+            same, reason = compaction.verify(original, lines)
+            if not same:
+                raise ValueError(f"Compacted G-code changes the motion: {reason}")
         else:
-            raise ValueError("gcode must be str or list when is_file=False")
+            lines = compactor.compact(lines)
+        if progress:
+            # 进度按原 G-code 的行数计
+            user_progress, source_total = progress, len(original) if original is not None else None
+            progress = lambda done, total: user_progress(compactor.source_line(done - 1) + 1 if done else 0,
+                                                         source_total)
 
     # 连接 GRBL
-    ser = serial.Serial(port, baudrate, timeout=1)
-    time.sleep(2)  # 等待 GRBL 上电复位
-
-    # 重置并清空缓冲
-    ser.write(b"\r\n\r\n")
-    time.sleep(2)
-    ser.flushInput()
-
-    # 发送 G-code
-    for line in lines:
-        l = line.strip()
-        if not l or l.startswith("("):  # 跳过空行和注释
-            continue
-        cmd = (l + "\n").encode("utf-8")
-        ser.write(cmd)
-        print(f"Sent: {l}")
-        
-        # 等待 GRBL 回复
-        while True:
-            reply = ser.readline().decode(errors="ignore").strip()
-            if reply:
-                print(f"Reply: {reply}")
-                if reply.lower() == "ok" or reply.lower().startswith("error"):
-                    break
-
-    ser.close()
-    print("✅ G-code upload complete.")
+    ser = grbl.open_grbl(port, baudrate)
+    try:
+        if streaming:
+            stats = grbl.stream_gcode(ser, lines, progress=progress, job=job, on_status=on_status, z_safe=z_safe)
+        else:
+            stats = grbl.send_gcode(ser, lines, progress=progress, job=job, on_status=on_status, z_safe=z_safe)
+    finally:
+        ser.close()
+
+    if compact:
+        # 报错的行号对应回原 G-code; 生成器输入时原文没有保留, 给出实际发送的压缩后文本
+        stats["errors"] = [(compactor.source_line(line_no),
+                            original[compactor.source_line(line_no)] if original is not None else line, reply)
+                           for line_no, line, reply in stats["errors"]]
+        stats["compaction"] = compactor.report()
+        print(f"Compaction: {compaction.format_report(stats['compaction'])}")
+    for line_no, line, reply in stats["errors"]:
+        print(f"Line {line_no + 1} '{line}': {reply}")
+    if stats["cancelled"]:
+        print(f"G-code upload cancelled after {stats['lines']} lines.")
+        if not stats["pen_up"]:
+            print("⚠️ The controller did not come back after the reset, the pen may still be down.")
+        return stats
+    print(f"✅ G-code upload complete. {stats['lines']} lines in {stats['seconds']:.1f}s "
+          f"({stats['lines_per_sec']:.0f} lines/s)")
+    return stats
 
 
 if __name__ == "__main__":
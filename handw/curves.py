@@ -0,0 +1,266 @@
+import numpy as np
+import emit
+
+CURVE3 = 3
+CURVE4 = 4
+
+# 圆弧拟合时在这些参数处检查 Bézier 与圆的偏差
+_ARC_CHECK_T = np.array([0.125, 0.25, 0.375, 0.625, 0.75, 0.875])
+
+
+def _run_offset(mask):
+    # mask 中每个 True 在其连续段内的位置
+    idx = np.arange(len(mask))
+    run_start = mask & ~np.r_[False, mask[:-1]]
+    starts = np.where(run_start, idx, 0)
+    np.maximum.accumulate(starts, out=starts)
+    return idx - starts
+
+
+def bezier_segments(vertices, codes):
+    """
+    从 Path 的 vertices/codes 中找出全部 Bézier 曲线段
+
+    二次曲线 (CURVE3) 每段占 2 个顶点, 三次曲线 (CURVE4) 每段占 3 个顶点,
+    起点是前一个顶点。二次曲线统一升阶为三次, 后续只处理一种形式。
+
+    返回:
+        ends (np.ndarray): 每段曲线终点在 vertices 中的下标 (升序)
+        ctrl (np.ndarray): (k, 4, 2) 三次 Bézier 控制点
+        member (np.ndarray): 属于曲线 (控制点或终点) 的顶点掩码
+    """
+    quad = codes == CURVE3
+    cubic = codes == CURVE4
+    quad_end = np.flatnonzero(quad & (_run_offset(quad) % 2 == 1))
+    cubic_end = np.flatnonzero(cubic & (_run_offset(cubic) % 3 == 2))
+
+    p0 = vertices[np.maximum(quad_end - 2, 0)]
+    p1 = vertices[quad_end - 1]
+    p2 = vertices[quad_end]
+    quad_ctrl = np.stack([p0, p0 + 2 / 3 * (p1 - p0), p2 + 2 / 3 * (p1 - p2), p2], axis=1)
+    cubic_ctrl = np.stack([vertices[np.maximum(cubic_end - k, 0)] for k in (3, 2, 1, 0)], axis=1)
+
+    ends = np.concatenate([quad_end, cubic_end])
+    ctrl = np.concatenate([quad_ctrl, cubic_ctrl]).reshape(-1, 4, 2)
+    order = np.argsort(ends, kind="stable")
+    return ends[order], ctrl[order], quad | cubic
+
+
+def bezier_eval(ctrl, t):
+    """在参数 t (与 ctrl 一一对应, 形状 (k, 1)) 处求三次 Bézier 上的点"""
+    mt = 1 - t
+    return (mt ** 3 * ctrl[:, 0] + 3 * mt ** 2 * t * ctrl[:, 1]
+            + 3 * mt * t ** 2 * ctrl[:, 2] + t ** 3 * ctrl[:, 3])
+
+
+def segment_steps(ctrl, tolerance):
+    """
+    按弦高误差估算每段曲线需要的折线数 (Wang 公式)
+
+    均匀 n 段折线的最大弦高误差不超过 3/4 * max|二阶差分| / n^2。
+    """
+    dd = np.maximum(np.linalg.norm(ctrl[:, 0] - 2 * ctrl[:, 1] + ctrl[:, 2], axis=1),
+                    np.linalg.norm(ctrl[:, 1] - 2 * ctrl[:, 2] + ctrl[:, 3], axis=1))
+    steps = np.ceil(np.sqrt(0.75 * dd / tolerance))
+    return np.clip(steps, 1, 1024).astype(np.intp)
+
+
+def _splice(vertices, codes, ends, member, counts, piece_vertices, piece_codes, piece_centers=None):
+    # 用每段曲线的若干小段替换原曲线顶点, 其他顶点原样保留并保持顺序
+    end_mask = np.zeros(len(codes), dtype=bool)
+    end_mask[ends] = True
+    items = np.flatnonzero(~member | end_mask)
+    is_curve = end_mask[items]
+    item_counts = np.ones(len(items), dtype=np.intp)
+    item_counts[is_curve] = counts
+
+    slots = np.repeat(is_curve, item_counts)
+    out_vertices = np.empty((len(slots), 2))
+    out_codes = np.empty(len(slots), dtype=np.uint8)
+    out_vertices[~slots] = vertices[items[~is_curve]]
+    out_codes[~slots] = codes[items[~is_curve]]
+    out_vertices[slots] = piece_vertices
+    out_codes[slots] = piece_codes
+    if piece_centers is None:
+        return out_vertices, out_codes
+
+    out_centers = np.full((len(slots), 2), np.nan)
+    out_centers[slots] = piece_centers
+    return out_vertices, out_codes, out_centers
+
+
+def flatten(vertices, codes, tolerance=0.05):
+    """
+    把 Path 中的 CURVE3/CURVE4 曲线自适应地展开为 LINETO 折线
+
+    参数:
+        vertices (np.ndarray): (n, 2) 顶点
+        codes (np.ndarray): Path 指令
+        tolerance (float): 允许的最大弦高误差 (mm)
+
+    返回:
+        vertices, codes: 只含 MOVETO/LINETO/CLOSEPOLY 的路径
+    """
+    vertices = np.asarray(vertices, dtype=float).reshape(-1, 2)
+    codes = np.asarray(codes)
+    ends, ctrl, member = bezier_segments(vertices, codes)
+    if not member.any():
+        return vertices, codes
+
+    steps = segment_steps(ctrl, tolerance)
+    seg = np.repeat(np.arange(len(ends)), steps)
+    k = np.arange(len(seg)) - np.repeat(np.cumsum(steps) - steps, steps) + 1
+    points = bezier_eval(ctrl[seg], (k / steps[seg])[:, None])
+    return _splice(vertices, codes, ends, member, steps, points, emit.LINETO)
+
+
+def _circle_through(a, b, c):
+    # 过三点的圆; 三点共线时 valid 为 False
+    ab = b - a
+    ac = c - a
+    cross = ab[:, 0] * ac[:, 1] - ab[:, 1] * ac[:, 0]
+    valid = np.abs(cross) > 1e-12
+    d = np.where(valid, 2 * cross, 1.)
+    ab2 = (ab ** 2).sum(axis=1)
+    ac2 = (ac ** 2).sum(axis=1)
+    ux = (ac[:, 1] * ab2 - ab[:, 1] * ac2) / d
+    uy = (ab[:, 0] * ac2 - ac[:, 0] * ab2) / d
+    center = a + np.stack([ux, uy], axis=1)
+    return center, np.hypot(ux, uy), cross > 0, valid
+
+
+def _chord_distance(ctrl):
+    # 控制点 P1/P2 到弦 P0P3 的最大距离, 用于判断曲线是否近似直线
+    chord = ctrl[:, 3] - ctrl[:, 0]
+    length = np.linalg.norm(chord, axis=1)
+    safe = np.where(length > 0, length, 1.)
+    dist = []
+    for k in (1, 2):
+        rel = ctrl[:, k] - ctrl[:, 0]
+        perp = np.abs(chord[:, 0] * rel[:, 1] - chord[:, 1] * rel[:, 0]) / safe
+        dist.append(np.where(length > 0, perp, np.linalg.norm(rel, axis=1)))
+    return np.maximum(*dist)
+
+
+def fit_arcs(vertices, codes, tolerance=0.05, max_depth=8):
+    """
+    把 Path 中的曲线拟合为圆弧 (G2/G3) 与直线
+
+    每段 Bézier 先尝试用过起点、中点、终点的圆弧近似, 偏差超过 tolerance
+    的段在 t=0.5 处二分后整批重试, 直到全部满足或达到 max_depth。
+    近似直线的段直接输出 LINETO。
+
+    返回:
+        vertices, codes, centers: centers 为圆弧圆心 (绝对坐标), 非圆弧处为 NaN;
+        codes 中圆弧用 emit.ARC_CW / emit.ARC_CCW 表示
+    """
+    vertices = np.asarray(vertices, dtype=float).reshape(-1, 2)
+    codes = np.asarray(codes)
+    ends, ctrl, member = bezier_segments(vertices, codes)
+    if not member.any():
+        return vertices, codes, np.full((len(codes), 2), np.nan)
+
+    pending = ctrl
+    seg = np.arange(len(ends))
+    t0 = np.zeros(len(ends))
+    span = 1.
+    done_seg, done_t0, done_code, done_end, done_center = [], [], [], [], []
+    for depth in range(max_depth + 1):
+        if not len(pending):
+            break
+        flat = _chord_distance(pending) <= tolerance
+        mid = bezier_eval(pending, np.full((len(pending), 1), 0.5))
+        center, radius, ccw, valid = _circle_through(pending[:, 0], mid, pending[:, 3])
+        samples = np.stack([bezier_eval(pending, np.full((len(pending), 1), t)) for t in _ARC_CHECK_T])
+        error = np.abs(np.linalg.norm(samples - center, axis=2) - radius).max(axis=0)
+        is_arc = ~flat & valid & (error <= tolerance)
+        accept = flat | is_arc | (depth == max_depth)
+
+        done_seg.append(seg[accept])
+        done_t0.append(t0[accept])
+        done_code.append(np.where(is_arc[accept], np.where(ccw[accept], emit.ARC_CCW, emit.ARC_CW),
+                                  emit.LINETO))
+        done_end.append(pending[accept, 3])
+        done_center.append(np.where(is_arc[accept, None], center[accept], np.nan))
+
+        # 未通过的段用 de Casteljau 在中点二分
+        rest = pending[~accept]
+        p01 = (rest[:, 0] + rest[:, 1]) / 2
+        p12 = (rest[:, 1] + rest[:, 2]) / 2
+        p23 = (rest[:, 2] + rest[:, 3]) / 2
+        p012 = (p01 + p12) / 2
+        p123 = (p12 + p23) / 2
+        p0123 = (p012 + p123) / 2
+        left = np.stack([rest[:, 0], p01, p012, p0123], axis=1)
+        right = np.stack([p0123, p123, p23, rest[:, 3]], axis=1)
+        span /= 2
+        pending = np.concatenate([left, right])
+        seg = np.concatenate([seg[~accept], seg[~accept]])
+        t0 = np.concatenate([t0[~accept], t0[~accept] + span])
+
+    piece_seg = np.concatenate(done_seg)
+    order = np.lexsort((np.concatenate(done_t0), piece_seg))
+    counts = np.bincount(piece_seg, minlength=len(ends))
+    return _splice(vertices, codes, ends, member, counts,
+                   np.concatenate(done_end)[order],
+                   np.concatenate(done_code)[order],
+                   np.concatenate(done_center)[order])
+
+
+def simplify(vertices, codes, tolerance=0.05, centers=None):
+    """
+    Ramer–Douglas–Peucker 折线简化: 删掉偏离保留折线不超过 tolerance (mm) 的 LINETO 顶点
+
+    只简化连续的直线段; MOVETO、CLOSEPOLY、圆弧及其前后的顶点都保留, 笔画数与圆弧不变。
+    各段折线同时处理: 每一轮对所有待定区间一起求弦距最大点, 超过容差的在该点二分,
+    轮数只与最深的递归层数有关。
+
+    返回:
+        vertices, codes, centers: 删去的只有 LINETO 顶点, centers 为 None 时返回 None
+    """
+    vertices = np.asarray(vertices, dtype=float).reshape(-1, 2)
+    codes = np.asarray(codes)
+    if tolerance <= 0 or len(codes) < 3:
+        return vertices, codes, centers
+    keep = simplify_mask(vertices, codes, tolerance)
+    return vertices[keep], codes[keep], None if centers is None else np.asarray(centers)[keep]
+
+
+def simplify_mask(vertices, codes, tolerance=0.05):
+    """simplify 保留的顶点 (布尔数组)"""
+    codes = np.asarray(codes)
+    if tolerance <= 0 or len(codes) < 3:
+        return np.ones(len(codes), dtype=bool)
+
+    line = codes == emit.LINETO
+    keep = ~line
+    keep[:-1] |= ~line[1:]
+    keep[-1] = True
+    anchors = np.flatnonzero(keep)
+    lo, hi = anchors[:-1], anchors[1:]
+    inner = hi - lo > 1
+    lo, hi = lo[inner], hi[inner]
+    tol2 = tolerance ** 2
+    while len(lo):
+        counts = hi - lo - 1
+        starts = np.cumsum(counts) - counts
+        seg = np.repeat(np.arange(len(lo)), counts)
+        idx = np.arange(len(seg)) - starts[seg] + lo[seg] + 1
+        # 点到弦 (线段) 的距离平方
+        a = vertices[lo][seg]
+        ab = vertices[hi][seg] - a
+        ap = vertices[idx] - a
+        len2 = (ab ** 2).sum(axis=1)
+        t = np.clip((ap * ab).sum(axis=1) / np.where(len2 > 0, len2, 1.), 0, 1)
+        d2 = ((ap - t[:, None] * ab) ** 2).sum(axis=1)
+
+        dmax = np.maximum.reduceat(d2, starts)
+        hits = np.flatnonzero(d2 == dmax[seg])
+        first = hits[np.r_[True, seg[hits][1:] != seg[hits][:-1]]]
+        split = dmax > tol2
+        mid = idx[first][split]
+        keep[mid] = True
+        lo, hi = np.r_[lo[split], mid], np.r_[mid, hi[split]]
+        inner = hi - lo > 1
+        lo, hi = lo[inner], hi[inner]
+    return keep
@@ -1,23 +1,45 @@
 from PIL import Image, ImageDraw, ImageFont
 import numpy as np
 import cv2
-from scipy.ndimage import convolve
 from skimage.morphology import skeletonize as sk_skeletonize
 from fontTools.ttLib import TTFont
 import turtle
 import time
 import os
+import json
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from tqdm import tqdm
+import atlas
+
+def _placement(draw, font, char, img_size):
+    # 字形居中时文字左上角 (anchor "la") 的位置
+    bbox = draw.textbbox((0,0), char, font=font)
+    w, h = bbox[2]-bbox[0], bbox[3]-bbox[1]
+    return (img_size-w)/2 - bbox[0], (img_size-h)/2 - bbox[1]
 
 def render_char_to_bitmap(font_path, char, img_size=256, font_number=0):
     img = Image.new("L", (img_size, img_size), 0)
     draw = ImageDraw.Draw(img)
-    font = ImageFont.truetype(font_path, size=img_size-20, index=font_number)
-    bbox = draw.textbbox((0,0), char, font=font)
-    w, h = bbox[2]-bbox[0], bbox[3]-bbox[1]
-    draw.text(((img_size-w)/2 - bbox[0], (img_size-h)/2 - bbox[1]), char, font=font, fill=255)
+    font = _load_font(font_path, img_size-20, font_number)
+    draw.text(_placement(draw, font, char, img_size), char, font=font, fill=255)
     return np.array(img)
 
+def glyph_metrics(font_path, char, img_size=256, font_number=0):
+    """
+    render_char_to_bitmap 图像与字形坐标 (em 为单位, 原点在基线起点, y 向上) 的对应关系
+
+    返回:
+        origin (tuple): 字形原点在图像中的像素坐标 (x, y)
+        em (float): 一个 em 的像素数
+        advance (float): 前进宽度 (em)
+    """
+    em = img_size - 20
+    font = _load_font(font_path, em, font_number)
+    x, y = _placement(ImageDraw.Draw(Image.new("L", (1, 1))), font, char, img_size)
+    ascent, _ = font.getmetrics()
+    return (x, y + ascent), float(em), font.getlength(char) / em
+
 
 def skeletonize(img):
     _, binary = cv2.threshold(img, 127, 255, cv2.THRESH_BINARY)
@@ -48,22 +70,17 @@ def skeleton_to_trace(skel_img):
     skeleton_img: 二值骨架图 (255=骨架)
     输出: trace_list = [(x, y, pen_state), ...]
     """
-    skel = skel_img.copy()
-    skel[skel > 0] = 1  # 0/1
-    h, w = skel.shape
     trace_list = []
 
-    # 找轮廓，轮廓本身是笔画的一条路径
-    contours, _ = cv2.findContours(skel.astype(np.uint8), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_NONE)
-
-    for cnt in contours:
+    # 按中心线笔画走, 每笔只走一遍 (findContours 的外轮廓会沿骨架两侧各走一遍)
+    for stroke in skeleton_to_strokes(skel_img, epsilon=0):
+        stroke = stroke.tolist()
         # 抬笔
-        trace_list.append((cnt[0][0][0], cnt[0][0][1], 0))
-        for point in cnt:
-            x, y = point[0]
+        trace_list.append((stroke[0][0], stroke[0][1], 0))
+        for x, y in stroke:
             trace_list.append((x, y, 1))  # 笔触
         # 最后抬笔
-        trace_list.append((cnt[-1][0][0], cnt[-1][0][1], 0))
+        trace_list.append((stroke[-1][0], stroke[-1][1], 0))
 
     return trace_list
 
@@ -118,77 +135,327 @@ def safe_skeletonize(img, threshold=50, min_area=1):
         clean_skel : np.ndarray
             单通道 uint8 骨架图像，0 背景，255 骨架
     """
-    # 1. 转灰度
-    if len(img.shape) == 3:
-        img_gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    else:
-        img_gray = img.copy()
+    return safe_skeletonize_batch(np.asarray(img)[None], threshold, min_area)[0]
 
-    # 2. 二值化
-    _, binary = cv2.threshold(img_gray, threshold, 255, cv2.THRESH_BINARY)
-    binary_bool = binary > 0  # skimage skeletonize 需要布尔型
 
-    # 3. 提取骨架
-    skeleton = sk_skeletonize(binary_bool)
-    skeleton = (skeleton.astype(np.uint8)) * 255  # 转回 uint8
+def safe_skeletonize_batch(imgs, threshold=50, min_area=1):
+    """
+    一次处理一叠同尺寸字形图像, 结果与逐张调用 safe_skeletonize 相同
 
-    # 4. 删除孤立小连通域
-    num_labels, labels, stats, _ = cv2.connectedComponentsWithStats(skeleton)
-    clean_skel = np.zeros_like(skeleton)
-    for i in range(1, num_labels):  # 跳过背景
-        if stats[i, cv2.CC_STAT_AREA] >= min_area:
-            clean_skel[labels == i] = 255
+    二值化和连通域过滤对整叠图像只做一次: 各图像之间隔一行空白拼成一张长图,
+    连通域标记一次完成, 再用 "标签 -> 是否保留" 查找表一次取出保留的像素。
+    骨架提取仍逐张进行 (拼图后细化迭代次数由最粗的字形决定, 反而更慢),
+    但只处理字形的外接矩形。
+
+    参数:
+        imgs : np.ndarray 或图像列表
+            (N, H, W) 灰度或 (N, H, W, 3) 彩色
+        threshold, min_area : 同 safe_skeletonize
+
+    返回:
+        np.ndarray: (N, H, W) uint8 骨架, 0 背景, 255 骨架
+    """
+    imgs = np.asarray(imgs)
+    if imgs.ndim == 4:
+        imgs = np.stack([cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) for img in imgs])
+    n, h, w = imgs.shape
+
+    # 1. 二值化 (与 cv2.THRESH_BINARY 一致: 大于阈值为前景)
+    binary = imgs > threshold
+
+    # 2. 提取骨架, 只处理外接矩形; skimage 在边界外按背景处理, 裁剪不改变结果
+    skel = np.zeros((n, h + 1, w), dtype=np.uint8)
+    for i in range(n):
+        x, y, bw, bh = cv2.boundingRect(binary[i].view(np.uint8))
+        if bw:
+            skel[i, y:y + bh, x:x + bw] = sk_skeletonize(binary[i, y:y + bh, x:x + bw])
+
+    # 3. 删除小连通域: 面积查找表, 背景标签 0 不保留
+    if min_area > 1:
+        num_labels, labels, stats, _ = cv2.connectedComponentsWithStats(skel.reshape(-1, w))
+        lut = np.where(stats[:, cv2.CC_STAT_AREA] >= min_area, 255, 0).astype(np.uint8)
+        lut[0] = 0
+        return np.ascontiguousarray(lut[labels].reshape(n, h + 1, w)[:, :h])
+    return skel[:, :h] * 255
+
+# 8 邻域偏移 (行, 列)
+_NEIGHBORS = [(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)]
+_KERNEL = np.array([[1, 1, 1], [1, 0, 1], [1, 1, 1]], dtype=np.float32)
+
+
+def _count_neighbors(mask):
+    return cv2.filter2D(mask, -1, _KERNEL, borderType=cv2.BORDER_CONSTANT) * mask
+
+
+def skeleton_graph(skel):
+    """
+    把单像素骨架转成图: 节点是端点 (1 邻居) 和分叉像素 (>=3 邻居), 边是邻居数 <=2 的像素段
+
+    像素段用连通域标记一次求出, 段内像素的顺序不需要逐个追踪,
+    只记录每段的像素数和两端像素。坐标为外扩一圈后的一维下标, 访问邻居时不用判断越界。
+
+    返回:
+        dict: shape (外扩后), mask, degree, labels (段编号, 0 表示非段像素),
+            sizes (每段像素数), end_a/end_b (每段两端), offsets (8 邻域的一维偏移)
+    """
+    mask = np.pad((skel > 0).astype(np.uint8), 1)
+    degree = _count_neighbors(mask)
+    runs = ((degree <= 2) & (mask > 0)).astype(np.uint8)
+    n_runs, labels = cv2.connectedComponents(runs, connectivity=8)
+    labels = labels.ravel()
+    sizes = np.bincount(labels, minlength=n_runs)
+
+    # 段内邻居数 <=1 的像素是段的端头; 单像素段两端相同, 闭环没有端头
+    ends = np.flatnonzero((_count_neighbors(runs) <= 1).ravel() & (runs.ravel() > 0))
+    end_a = np.full(n_runs, -1, dtype=np.intp)
+    end_b = np.full(n_runs, -1, dtype=np.intp)
+    np.maximum.at(end_b, labels[ends], ends)
+    end_a[labels[ends[::-1]]] = ends[::-1]
+
+    width = mask.shape[1]
+    return {
+        "shape": mask.shape,
+        "mask": mask.ravel().astype(bool),
+        "degree": degree.ravel(),
+        "labels": labels,
+        "sizes": sizes,
+        "end_a": end_a,
+        "end_b": end_b,
+        "offsets": np.array([dy * width + dx for dy, dx in _NEIGHBORS], dtype=np.intp),
+    }
 
-    return clean_skel
 
 def remove_short_branches_any_dir(skel, min_length=10):
     """
     skel: uint8 0/255 单像素骨架
     min_length: 小于这个长度的支线会被删除
+
+    在 skeleton_graph 上剪枝: 从每个端点出发整段跨过像素段, 只在分叉像素处逐个判断,
+    与逐像素追踪的结果一致 (包括追踪停下时的分叉像素一并删除、已访问像素影响后续追踪)。
     """
-    skel = skel.copy() // 255
-    skel_out = skel.copy()
-    
-    # 8邻域卷积，用于检测端点
-    kernel = np.ones((3,3), dtype=int)
-    kernel[1,1] = 0
-    neighbor_count = convolve(skel, kernel, mode='constant', cval=0)
-    
-    # 端点坐标
-    endpoints = np.array(np.where((neighbor_count==1) & (skel==1))).T
-
-    visited = np.zeros_like(skel, dtype=bool)
-    
-    def trace(y,x):
-        path = [(y,x)]
-        py, px = y, x
-        prev = None
+    skel = skel // 255
+    out = np.zeros(skel.shape, dtype=np.uint8)
+    # 只处理骨架的外接矩形, 字形周围的大片空白不参与数组运算
+    x, y, w, h = cv2.boundingRect(skel)
+    if w == 0:
+        return out
+    g = skeleton_graph(skel[y:y + h, x:x + w])
+    mask, labels, sizes = g["mask"], g["labels"], g["sizes"]
+    end_a, end_b, offsets = g["end_a"], g["end_b"], g["offsets"]
+    run_visited = np.zeros(len(sizes), dtype=bool)
+    node_visited = np.zeros(len(mask), dtype=bool)
+
+    def unvisited(p):
+        out = []
+        for q in (p + offsets).tolist():
+            if mask[q] and not (run_visited[labels[q]] if labels[q] else node_visited[q]):
+                out.append(q)
+        return out
+
+    def enter(run, p):
+        # 从段的一端进入, 返回另一端
+        run_visited[run] = True
+        return end_b[run] if end_a[run] == p else end_a[run]
+
+    removed_runs, removed_nodes = [], []
+    for p in np.flatnonzero((g["degree"] == 1) & mask).tolist():
+        run = labels[p]
+        if run_visited[run]:
+            continue
+        runs, nodes = [run], []
+        length = sizes[run]
+        p = enter(run, p)
         while True:
-            visited[py,px] = True
-            # 找未访问的邻居
-            neighbors = []
-            for dy in [-1,0,1]:
-                for dx in [-1,0,1]:
-                    ny, nx = py+dy, px+dx
-                    if 0<=ny<skel.shape[0] and 0<=nx<skel.shape[1]:
-                        if skel[ny,nx]==1 and not visited[ny,nx]:
-                            neighbors.append((ny,nx))
-            if len(neighbors)==0 or len(neighbors)>1:
+            nxt = unvisited(p)
+            if len(nxt) != 1:
                 break  # 到达端点或分叉
-            py, px = neighbors[0]
-            path.append((py, px))
-        return path
+            p = nxt[0]
+            run = labels[p]
+            if run:
+                runs.append(run)
+                length += sizes[run]
+                p = enter(run, p)
+            else:
+                node_visited[p] = True
+                nodes.append(p)
+                length += 1
+        if length < min_length:
+            removed_runs.extend(runs)
+            removed_nodes.extend(nodes)
+
+    keep = mask.copy()
+    keep[np.isin(labels, removed_runs) & (labels > 0)] = False
+    keep[removed_nodes] = False
+    out[y:y + h, x:x + w] = keep.reshape(g["shape"])[1:-1, 1:-1] * 255
+    return out
+
+
+def _order_run(start, run, labels, offsets):
+    # 沿像素段从一端走到另一端 (闭环回到起点前停下); labels/offsets 为 list
+    order = [start]
+    prev, cur = -1, start
+    while True:
+        nxt = -1
+        for o in offsets:
+            q = cur + o
+            if q != prev and labels[q] == run and q != start:
+                nxt = q
+                break
+        if nxt < 0:
+            return order
+        order.append(nxt)
+        prev, cur = cur, nxt
+
+
+def _pair_ends(ends, direction):
+    # 同一分叉处的线头两两相接, 方向最接近直线穿过的一对优先
+    pairs = []
+    if len(ends) < 2:
+        return pairs
+    d = np.array([direction[e] for e in ends])
+    cost = d @ d.T
+    i, j = np.triu_indices(len(ends), 1)
+    free = set(range(len(ends)))
+    for k in np.argsort(cost[i, j], kind="stable").tolist():
+        a, b = i[k], j[k]
+        if a in free and b in free:
+            free -= {a, b}
+            pairs.append((ends[a], ends[b]))
+    return pairs
+
+
+def skeleton_to_strokes(skel, epsilon=0.5):
+    """
+    把单像素骨架拆成有序的单线笔画 (中心线), 每段笔画只画一遍
+
+    在 skeleton_graph 上: 相邻的分叉像素合成一个分叉点 (取质心), 每个像素段是一条边,
+    两端接到相邻的分叉点上。每个分叉点处把线头按 "最直" 两两相接, 沿相接关系把边串成
+    尽量长的笔画, 减少抬笔次数。孤立的分叉块 (如很小的点) 输出为单点笔画。
+
+    参数:
+        skel: uint8 0/255 单像素骨架
+        epsilon (float): cv2.approxPolyDP 简化容差 (像素), 0 表示保留全部像素
+
+    返回:
+        list[np.ndarray]: 每个笔画为 (k, 2) 的 (x, y) 像素坐标
+    """
+    # 只处理骨架的外接矩形
+    x0, y0, bw, bh = cv2.boundingRect((skel > 0).astype(np.uint8))
+    if bw == 0:
+        return []
+    g = skeleton_graph(skel[y0:y0 + bh, x0:x0 + bw])
+    mask, labels, offsets = g["mask"], g["labels"], g["offsets"]
+    end_a, end_b = g["end_a"], g["end_b"]
+    h, w = g["shape"]
+    label_list, offset_list = labels.tolist(), offsets.tolist()
+
+    # 分叉块: 相邻的分叉像素 (邻居数 >=3) 为同一个分叉点
+    nodes = (mask & (labels == 0)).reshape(h, w).astype(np.uint8)
+    n_clusters, clusters = cv2.connectedComponents(nodes, connectivity=8)
+    clusters = clusters.ravel()
+    node_px = np.flatnonzero(clusters)
+    counts = np.bincount(clusters[node_px], minlength=n_clusters)
+    cy = np.bincount(clusters[node_px], node_px // w, minlength=n_clusters)
+    cx = np.bincount(clusters[node_px], node_px % w, minlength=n_clusters)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        centroid = np.stack([cx, cy], axis=1) / counts[:, None]
+
+    def attached(p):
+        return [clusters[q] for q in (p + offsets).tolist() if clusters[q]]
 
-    for y, x in endpoints:
-        if visited[y,x]:
+    # 边: (起点分叉, 像素坐标折线, 终点分叉), 不接分叉的一端为 0
+    edges = []
+    members = np.argsort(labels, kind="stable")
+    starts = np.searchsorted(labels[members], np.arange(len(end_a)))
+    for run in range(1, len(end_a)):
+        start = end_a[run] if end_a[run] >= 0 else members[starts[run]]
+        order = _order_run(start, run, label_list, offset_list)
+        pts = np.stack([np.array(order) % w, np.array(order) // w], axis=1).astype(float)
+        if end_a[run] < 0:  # 闭环
+            edges.append([0, np.vstack([pts, pts[:1]]), 0])
             continue
-        path = trace(y,x)
-        if len(path) < min_length:
-            for py, px in path:
-                skel_out[py, px] = 0
-                visited[py, px] = True
+        head = attached(order[0])
+        tail = attached(order[-1])
+        if len(order) == 1:
+            tail = head[1:]
+        u = head[0] if head else 0
+        v = tail[-1] if tail else 0
+        if u:
+            pts = np.vstack([centroid[u], pts])
+        if v:
+            pts = np.vstack([pts, centroid[v]])
+        edges.append([u, pts, v])
+
+    # 每个分叉点上的线头及其离开分叉点的方向
+    ends_at = {}
+    direction = {}
+    for e, (u, pts, v) in enumerate(edges):
+        k = min(5, len(pts) - 1)
+        for side, node, vec in ((0, u, pts[k] - pts[0]), (1, v, pts[-1 - k] - pts[-1])):
+            if node:
+                ends_at.setdefault(node, []).append((e, side))
+                direction[(e, side)] = vec / (np.hypot(*vec) or 1.)
+    link = {}
+    for node, ends in ends_at.items():
+        for a, b in _pair_ends(ends, direction):
+            link[a] = b
+            link[b] = a
+
+    used = [False] * len(edges)
+
+    def chain(e, side):
+        # 从 e 的 side 端进入, 沿相接关系一直走到没有后续或回到已用的边
+        parts = []
+        while not used[e]:
+            used[e] = True
+            pts = edges[e][1]
+            parts.append(pts if side == 0 else pts[::-1])
+            nxt = link.get((e, 1 - side))
+            if nxt is None:
+                break
+            e, side = nxt
+        return np.vstack([parts[0]] + [p[1:] for p in parts[1:]])
+
+    strokes = []
+    # 先从自由线头出发, 剩下的都在环上
+    for e, (u, pts, v) in enumerate(edges):
+        if not used[e] and (e, 0) not in link:
+            strokes.append(chain(e, 0))
+        if not used[e] and (e, 1) not in link:
+            strokes.append(chain(e, 1))
+    for e in range(len(edges)):
+        if not used[e]:
+            strokes.append(chain(e, 0))
+    for c in range(1, n_clusters):
+        if c not in ends_at:
+            strokes.append(centroid[c:c + 1])
+
+    out = []
+    for pts in strokes:
+        pts = pts + (x0 - 1, y0 - 1)  # 去掉外扩的一圈, 回到原图坐标
+        if epsilon > 0 and len(pts) > 2:
+            pts = cv2.approxPolyDP(pts.astype(np.float32).reshape(-1, 1, 2), epsilon, False).reshape(-1, 2)
+        out.append(pts.astype(float))
+    return out
+
+
+def lost_components(skel, pruned):
+    """
+    剪枝时整个被删掉的连通域 (整段短于 min_length 的孤立笔画, 如 i 上的点)
+
+    返回:
+        np.ndarray: (k, 2) 各连通域质心的 (x, y) 像素坐标
+    """
+    n, labels, _, centroids = cv2.connectedComponentsWithStats(skel)
+    lost = np.bincount(labels[pruned > 0], minlength=n) == 0
+    lost[0] = False
+    return centroids[lost]
+
+
+def glyph_strokes(skel, pruned, epsilon=1.0):
+    """中心线笔画: 剪枝后骨架的折线, 加上被剪掉的孤立小笔画 (单点)"""
+    return skeleton_to_strokes(pruned, epsilon) + [c[None] for c in lost_components(skel, pruned)]
 
-    return (skel_out*255).astype(np.uint8)
 
 def get_font_chars(font_path, font_number=0):
     """
@@ -210,31 +477,183 @@ def get_font_chars(font_path, font_number=0):
         print(f"Error reading font {font_path}: {e}")
     return chars
 
-def run(font_path, img_size=256, font_number=0, save_dir=None):
+STAGES = ("render", "skeletonize", "prune", "strokes", "save")
+MANIFEST = "manifest.jsonl"
+ATLAS = "strokes.atlas"
+
+
+@lru_cache(maxsize=8)
+def _load_font(font_path, size, font_number=0):
+    return ImageFont.truetype(font_path, size=size, index=font_number)
+
+
+def _safe_name(c):
+    char_safe = c
+    for ch in ['/', '\\', ':', '*', '?', '"', '<', '>', '|']:
+        char_safe = char_safe.replace(ch, '_')
+    return char_safe
+
+
+def _save_char(save_dir, c, bitmap, skel):
+    char_safe = _safe_name(c)
+    Image.fromarray(bitmap).save(os.path.join(save_dir, "glyph", f"{char_safe}_glyph.png"))
+    Image.fromarray(skel).save(os.path.join(save_dir, "skeleton", f"{char_safe}_skeleton.png"))
+
+
+def char_strokes(font_path, c, skel, pruned, img_size=256, font_number=0):
     """
-    遍历字体里的字符，把每个字符渲染成图像
+    把字符图像上的中心线笔画换算成字形坐标 (em 为单位, 原点在基线起点, y 向上)
+
+    返回:
+        strokes (list[np.ndarray]), advance (float): atlas.write_atlas 所需的格式
     """
-    chars = get_font_chars(font_path, font_number)
-    for c in tqdm(chars, desc="Processing characters"):
+    (ox, oy), em, advance = glyph_metrics(font_path, c, img_size, font_number)
+    strokes = [np.stack([(s[:, 0] - ox) / em, (oy - s[:, 1]) / em], axis=1)
+               for s in glyph_strokes(skel, pruned)]
+    return strokes, advance
+
+
+def _process_chunk(font_path, chars, img_size, font_number, save_dir, save_png=False):
+    # 进程池中的工作单元: 处理一批字符, 返回完成/失败的码位和各阶段耗时
+    # 整批渲染后一次调用 safe_skeletonize_batch, 之后逐字剪枝、提取笔画 (含 glyph_metrics, 单独计时);
+    # 笔画写成一个图集分片 (strokes/<首码位>.atlas), 全部完成后由 run 合并
+    timings = dict.fromkeys(STAGES, 0.)
+    done, failed = [], {}
+    glyphs = {}
+    rendered, bitmaps = [], []
+    t0 = time.perf_counter()
+    for c in chars:
+        try:
+            bitmaps.append(render_char_to_bitmap(font_path, c, img_size, font_number))
+            rendered.append(c)
+        except Exception as e:
+            failed[ord(c)] = str(e)
+    t1 = time.perf_counter()
+    skels = safe_skeletonize_batch(bitmaps) if bitmaps else []
+    t2 = time.perf_counter()
+    timings["render"] += t1 - t0
+    timings["skeletonize"] += t2 - t1
+
+    for c, bitmap, skel in zip(rendered, bitmaps, skels):
         try:
-            bitmap = render_char_to_bitmap(font_path, c, img_size, font_number)
-            skel = safe_skeletonize(bitmap)
-            skel = remove_short_branches_any_dir(skel,15)
-            if save_dir:
-                os.makedirs(save_dir, exist_ok=True)
-                skel_dir = os.path.join(save_dir, "skeleton")
-                img_dir = os.path.join(save_dir, "glyph")
-                os.makedirs(skel_dir, exist_ok=True)
-                os.makedirs(img_dir, exist_ok=True)
-                char_safe = c
-                for ch in ['/', '\\', ':', '*', '?', '"', '<', '>', '|']:
-                    char_safe = char_safe.replace(ch, '_')
-                fname = f"{char_safe}_glyph.png"
-                skelf = f"{char_safe}_skeleton.png"
-                Image.fromarray(bitmap).save(os.path.join(img_dir, fname))
-                Image.fromarray(skel).save(os.path.join(skel_dir, skelf))
+            t2 = time.perf_counter()
+            pruned = remove_short_branches_any_dir(skel, 15)
+            t3 = time.perf_counter()
+            glyphs[ord(c)] = char_strokes(font_path, c, skel, pruned, img_size, font_number)
+            t4 = time.perf_counter()
+            if save_dir and save_png:
+                _save_char(save_dir, c, bitmap, pruned)
+            timings["prune"] += t3 - t2
+            timings["strokes"] += t4 - t3
+            timings["save"] += time.perf_counter() - t4
+            done.append(ord(c))
         except Exception as e:
-            print(f"Failed to render char {c}: {e}")
+            failed[ord(c)] = str(e)
+    if save_dir and glyphs:
+        t3 = time.perf_counter()
+        atlas.write_atlas(os.path.join(save_dir, "strokes", f"{min(glyphs):06x}.atlas"), glyphs)
+        timings["save"] += time.perf_counter() - t3
+    return done, failed, timings
+
+
+def _read_manifest(path, header):
+    # 读取已完成的码位; 参数不一致的清单不能续跑
+    finished = set()
+    if not os.path.exists(path):
+        return finished
+    with open(path, "r", encoding="utf-8") as f:
+        for i, line in enumerate(f):
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # 中断时写了一半的最后一行
+            if i == 0:
+                if record != header:
+                    raise ValueError(f"Manifest {path} was written for {record}, not {header}")
+                continue
+            finished.update(record.get("done", []))
+    return finished
+
+
+def run(font_path, img_size=256, font_number=0, save_dir=None, workers=None, chunk_size=64, save_png=False):
+    """
+    遍历字体里的字符，把每个字符渲染成图像
+
+    参数:
+        workers (int): 进程数, 默认 CPU 核数; 1 表示在当前进程中串行处理
+        chunk_size (int): 每个任务包含的字符数
+        save_png (bool): 另外为每个字符保存字形图和骨架图 (调试用, 文件数量很多)
+    设置了 save_dir 时会写入 manifest.jsonl 记录已完成的字符, 中断后再次运行只处理剩余字符。
+    全部完成后各分片合并为 save_dir/strokes.atlas, control 可直接把它当作字体使用。
+    """
+    chars = sorted(get_font_chars(font_path, font_number))
+    manifest = None
+    if save_dir:
+        os.makedirs(os.path.join(save_dir, "strokes"), exist_ok=True)
+        if save_png:
+            os.makedirs(os.path.join(save_dir, "skeleton"), exist_ok=True)
+            os.makedirs(os.path.join(save_dir, "glyph"), exist_ok=True)
+        manifest = os.path.join(save_dir, MANIFEST)
+        header = {"font": os.path.abspath(font_path), "font_number": font_number, "img_size": img_size}
+        finished = _read_manifest(manifest, header)
+        if finished:
+            print(f"Resuming: {len(finished)} characters already done")
+        chars = [c for c in chars if ord(c) not in finished]
+        if not os.path.exists(manifest):
+            with open(manifest, "w", encoding="utf-8") as f:
+                f.write(json.dumps(header) + "\n")
+
+    chunks = [chars[i:i + chunk_size] for i in range(0, len(chars), chunk_size)]
+    workers = workers or os.cpu_count() or 1
+    totals = dict.fromkeys(STAGES, 0.)
+    n_done = 0
+    start = time.perf_counter()
+
+    def collect(result, bar):
+        nonlocal n_done
+        done, failed, timings = result
+        for cp, err in failed.items():
+            print(f"Failed to render char {chr(cp)}: {err}")
+        for stage in STAGES:
+            totals[stage] += timings[stage]
+        n_done += len(done)
+        if manifest:
+            with open(manifest, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"done": done}) + "\n")
+        bar.update(len(done) + len(failed))
+
+    with tqdm(total=len(chars), desc="Processing characters") as bar:
+        if workers == 1:
+            for chunk in chunks:
+                collect(_process_chunk(font_path, chunk, img_size, font_number, save_dir, save_png), bar)
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = [pool.submit(_process_chunk, font_path, chunk, img_size, font_number, save_dir,
+                                       save_png) for chunk in chunks]
+                for future in as_completed(futures):
+                    collect(future.result(), bar)
+
+    wall = time.perf_counter() - start
+    print(f"{n_done} characters in {wall:.1f}s ({n_done / wall if wall else 0:.1f} chars/s, {workers} workers)")
+    for stage in STAGES:
+        if totals[stage] > 0:
+            print(f"  {stage:<12} {n_done / totals[stage]:10.1f} chars/s per worker ({totals[stage]:.1f}s CPU)")
+    if save_dir:
+        path = merge_atlas(save_dir)
+        print(f"Stroke atlas: {path} ({os.path.getsize(path) / 1024:.0f} KiB)")
+    return totals
+
+
+def merge_atlas(save_dir):
+    """把 save_dir/strokes 下的分片 (包括之前中断的运行留下的) 合并为 save_dir/strokes.atlas"""
+    shard_dir = os.path.join(save_dir, "strokes")
+    glyphs = {}
+    for name in sorted(os.listdir(shard_dir)):
+        if name.endswith(".atlas"):
+            glyphs.update(atlas.read_glyphs(os.path.join(shard_dir, name)))
+    path = os.path.join(save_dir, ATLAS)
+    atlas.write_atlas(path, glyphs)
+    return path
 
 
 # ========== 测试 ==========
@@ -0,0 +1,195 @@
+import itertools
+
+import numpy as np
+
+MOVETO = 1
+LINETO = 2
+CLOSEPOLY = 79
+# 圆弧不是 matplotlib Path 指令, 用 G2/G3 对应的自定义编码表示, 圆心另存
+ARC_CW = 102
+ARC_CCW = 103
+
+
+def gcode_header(feedrate):
+    return [
+        "G21 ; 设置单位为毫米",
+        "G90 ; 使用绝对坐标",
+        f"G1 F{feedrate} ; 设置进给速度",
+    ]
+
+
+def gcode_footer():
+    return ["M2 ; 程序结束"]
+
+
+def pen_state(codes, start_down=False):
+    """
+    每个顶点处理之前的落笔状态
+
+    MOVETO 落笔, CLOSEPOLY 抬笔, 其余指令不改变状态。
+    用最近一次状态事件的下标做前向累积, 一次求出全部顶点的状态。
+    start_down 为第一个顶点之前的状态 (分段输出时接上一段)。
+    """
+    codes = np.asarray(codes)
+    n = len(codes)
+    is_event = (codes == MOVETO) | (codes == CLOSEPOLY)
+    last_event = np.where(is_event, np.arange(n), -1)
+    np.maximum.accumulate(last_event, out=last_event)
+    down_after = np.full(n, start_down, dtype=bool)
+    has_event = last_event >= 0
+    down_after[has_event] = codes[last_event[has_event]] == MOVETO
+    down_before = np.empty(n, dtype=bool)
+    down_before[:1] = start_down
+    down_before[1:] = down_after[:-1]
+    return down_before, down_after
+
+
+def emit_body(vertices, codes, z_safe=5, z_draw=-1, centers=None, start_down=False, previous=None):
+    """
+    把 Path 的 vertices/codes 转成 G-code 正文 (不含文件头尾)
+
+    逐顶点的分支判断换成按 codes 分类的数组运算: 每个顶点选一个行模板,
+    拼成整篇模板后用一次 % 格式化填入全部坐标。输出与逐行循环逐字节一致。
+    centers 为圆弧圆心 (绝对坐标), 与 ARC_CW/ARC_CCW 顶点对应, 输出为 G2/G3。
+    start_down 表示开始时笔已落下, previous 为上一段最后的位置 (接着上一段输出时, 用于圆弧的 I/J)。
+
+    返回:
+        body (str): 以换行分隔的 G-code, 没有可输出内容时为空串
+        pen_down (bool): 结束时笔是否仍处于落下状态
+    """
+    vertices = np.asarray(vertices, dtype=float).reshape(-1, 2)
+    codes = np.asarray(codes)
+    if len(codes) == 0:
+        return "", start_down
+
+    down_before, down_after = pen_state(codes, start_down)
+    pen_up = f"G0 Z{z_safe}".replace("%", "%%")
+    pen_down = f"G1 Z{z_draw}".replace("%", "%%")
+    templates = np.array([
+        "",
+        f"G0 X%.3f Y%.3f\n{pen_down}",
+        f"{pen_up}\nG0 X%.3f Y%.3f\n{pen_down}",
+        "G1 X%.3f Y%.3f",
+        pen_up,
+        "G2 X%.3f Y%.3f I%.3f J%.3f",
+        "G3 X%.3f Y%.3f I%.3f J%.3f",
+    ], dtype=object)
+
+    kind = np.zeros(len(codes), dtype=np.intp)
+    kind[codes == MOVETO] = 1
+    kind[(codes == MOVETO) & down_before] = 2
+    kind[codes == LINETO] = 3
+    kind[(codes == CLOSEPOLY) & down_before] = 4
+    kind[codes == ARC_CW] = 5
+    kind[codes == ARC_CCW] = 6
+
+    emitted = kind > 0
+    if not emitted.any():
+        return "", bool(down_after[-1])
+    template = "\n".join(templates[kind[emitted]])
+    with_xy = emitted & (kind != 4)
+    if not (kind >= 5).any():
+        values = vertices[with_xy].ravel()
+    elif centers is None:
+        raise ValueError("arc codes require centers")
+    else:
+        # 圆弧行额外带 I/J: 圆心相对起点 (前一个顶点) 的偏移
+        starts = np.roll(vertices, 1, axis=0)
+        if previous is not None:
+            starts[0] = previous
+        offsets = np.asarray(centers, dtype=float) - starts
+        rows = np.hstack([vertices, offsets])[with_xy]
+        used = np.ones(rows.shape, dtype=bool)
+        used[:, 2:] = (kind[with_xy] >= 5)[:, None]
+        values = rows[used]
+    body = template % tuple(values.tolist())
+    return body, bool(down_after[-1])
+
+
+def emit_gcode(vertices, codes, feedrate=1000, z_safe=5, z_draw=-1, centers=None):
+    """
+    生成完整 G-code 文本 (文件头 + 正文 + 抬笔 + 程序结束)
+    """
+    gcode = gcode_header(feedrate)
+    body, pen_down = emit_body(vertices, codes, z_safe, z_draw, centers)
+    if body:
+        gcode.append(body)
+    if pen_down:
+        gcode.append(f"G0 Z{z_safe}")
+    gcode.extend(gcode_footer())
+    return "\n".join(gcode)
+
+
+def iter_toolpath(tp, z_safe=5, z_draw=-1, chunk=4096):
+    """
+    由 toolpath 刀路逐段产出 G-code (分段方式同 control.text_to_gcode_iter), "\n".join 后即完整程序
+
+    每段最多 chunk 行刀路, 落笔状态跨段延续; 进给速度变化处插入一行 G1 F。
+    上传时边输出边发送, 不需要先生成整篇文本。
+    """
+    return iter_toolpaths([tp], z_safe, z_draw, chunk)
+
+
+def iter_toolpaths(parts, z_safe=5, z_draw=-1, chunk=4096, feedrate=None, emitter=None):
+    """
+    由依次产出的多段刀路 (如每行文字一段) 逐段产出 G-code, 输出与拼接后交给 iter_toolpath 相同
+
+    落笔状态、上一点位置和进给速度跨段延续。feedrate 为文件头的进给速度, 默认取第一段刀路的。
+    emitter 可以替换每段的输出 (签名同 emit_part, 如 line_cache 按行复用输出过的文本),
+    此时 parts 的元素由它解释, 必须给出 feedrate。
+    """
+    parts = iter(parts)
+    pending = []
+    if feedrate is None:
+        for tp in parts:
+            pending.append(tp)
+            if len(tp):
+                feedrate = tp["feed"][0]
+                break
+        else:
+            feedrate = 1000
+    emitter = emitter or emit_part
+    state = (False, None, float(feedrate))
+    yield "\n".join(gcode_header(f"{state[2]:g}"))
+    for part in itertools.chain(pending, parts):
+        chunks, state = emitter(part, z_safe, z_draw, chunk, state)
+        yield from chunks
+    if state[0]:
+        yield f"G0 Z{z_safe}"
+    yield "\n".join(gcode_footer())
+
+
+def emit_part(tp, z_safe=5, z_draw=-1, chunk=4096, state=(False, None, 1000.)):
+    """
+    iter_toolpaths 的一步: 一段刀路的 G-code
+
+    参数:
+        state: (笔是否落下, 上一点位置 (x, y) 或 None, 当前进给速度), 接着上一段输出
+
+    返回:
+        chunks (tuple[str]): 以换行分隔的 G-code 块, 每块最多 chunk 行刀路; state: 这一段结束时的状态
+    """
+    if not len(tp):
+        return (), state
+    down, previous, current = state
+    # 按进给速度分段 (与上一段最后的速度比较), 再按 chunk 切开; 进给速度变化处插入一行 G1 F
+    feed = tp["feed"]
+    cuts = np.flatnonzero(feed != np.r_[current, feed[:-1]])
+    bounds = np.unique(np.r_[0, cuts, np.arange(0, len(tp), chunk), len(tp)])
+    change = set(cuts.tolist())
+    chunks = []
+    for lo, hi in zip(bounds[:-1].tolist(), bounds[1:].tolist()):
+        part = tp[lo:hi]
+        arcs = (part["op"] == ARC_CW) | (part["op"] == ARC_CCW)
+        body, down = emit_body(part["xy"], part["op"], z_safe, z_draw, part["center"] if arcs.any() else None,
+                               start_down=down, previous=tp["xy"][lo - 1] if lo else previous)
+        if lo in change:
+            body = f"G1 F{feed[lo]:g}\n{body}" if body else f"G1 F{feed[lo]:g}"
+        if body:
+            chunks.append(body)
+    return tuple(chunks), (down, tuple(tp["xy"][-1].tolist()), float(feed[-1]))
+
+
+def emit_toolpath(tp, z_safe=5, z_draw=-1):
+    """toolpath 刀路 -> 完整 G-code 文本; 进给速度全篇相同时与 emit_gcode 的输出一致"""
+    return "\n".join(iter_toolpath(tp, z_safe, z_draw))
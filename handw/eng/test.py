@@ -1,40 +1,28 @@
-import matplotlib.pyplot as plt
+import os
+import sys
 
-def plot_unipen_trajectory(file_path, invert_y=False, show=True):
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import unipen
+
+
+def plot_unipen_trajectory(file_path, invert_y=False, show=True, cols=20):
     """
     绘制 UNIPEN 输出的笔迹路径文件（output_rawxy / output_namedxy 格式）。
 
+    样本从编译好的样本库缓存中读取 (见 unipen.load), 文件中的全部样本画在同一张网格图里。
+
     参数:
         file_path (str): 笔迹路径文件路径
         invert_y (bool): 是否翻转 Y 轴（UNIPEN 坐标原点在左上角）
         show (bool): 是否立即显示图像
+        cols (int): 每行格数
     """
-    with open(file_path, 'r') as f:
-        lines = f.readlines()
-
-    for line in lines:
-        line = line.strip()
-        if not line:
-            continue
-        
-        # 分离标签和坐标
-        parts = line.split()
-        label = parts[0]  # 标签
-        coords = parts[1:]
-        
-        # 将坐标转换为浮点数
-        xs = [float(coords[i]) for i in range(0, len(coords), 2)]
-        ys = [float(coords[i+1]) for i in range(0, len(coords), 2)]
-        
-        # 绘制轨迹
-        plt.figure(figsize=(6,6))
-        plt.plot(xs, ys)
-        plt.title(label)
-        if invert_y:
-            plt.gca().invert_yaxis()
-        plt.axis('equal')
-        if show:
-            plt.show()
+    folder = os.path.dirname(os.path.abspath(file_path))
+    library = unipen.load(folder)
+    return unipen.plot_grid(library, library.by_file(file_path), cols=cols, invert_y=invert_y, show=show)
+
 
 # 使用示例
-plot_unipen_trajectory("unipen/statis/a_samples.txt")
+if __name__ == "__main__":
+    plot_unipen_trajectory("unipen/statis/A_samples.txt")
@@ -0,0 +1,398 @@
+"""
+加工时间估算: 按 GRBL 的运动规划方式模拟一段 G-code 的执行时间
+
+GRBL 把每条直线运动作为一个 block, 圆弧按 $12 (arc_tolerance) 切成短弦; 相邻 block 的
+衔接速度受拐角的 junction deviation ($11) 限制, block 内按各轴加速度 ($120-$122) 做梯形
+加减速, 速度不超过 F 和各轴最大速度 ($110-$112)。
+
+前向/反向两遍限速是 v² 上的递推 v²[i] = min(cap[i], v²[i-1] + 2·a·d),
+写成 v²[i] - S[i] = min(cap[i] - S[i], v²[i-1] - S[i-1]) (S 为 2·a·d 的累积和) 后就是
+np.minimum.accumulate, 整段程序一次向量化算完。规划缓冲区 (16 个 block) 的影响近似为:
+每个 block 的进入速度必须能在其后缓冲区内的 block 中停下。串口发送跟不上 (缓冲区饿死) 不计。
+
+用法:
+    python estimate.py exam.gcode
+"""
+import math
+import re
+import sys
+
+import numpy as np
+
+import emit
+import toolpath
+
+# GRBL 出厂默认值偏保守, 这里取常见写字机的设置, 可以用 settings_from_dump 读取 $$ 的输出
+DEFAULT_SETTINGS = {
+    "max_rate": (5000., 5000., 1000.),   # $110-$112, mm/min
+    "acceleration": (500., 500., 200.),  # $120-$122, mm/s²
+    "junction_deviation": 0.01,          # $11, mm
+    "arc_tolerance": 0.002,              # $12, mm
+}
+# GRBL 的 BLOCK_BUFFER_SIZE, 正在执行的那个 block 之外最多规划 BLOCK_BUFFER_SIZE - 1 个
+BLOCK_BUFFER_SIZE = 16
+
+RAPID, LINEAR, ARC_CW, ARC_CCW = 0, 1, 2, 3
+
+_COMMENT = re.compile(r"\(.*?\)|;.*")
+_WORD = re.compile(r"([A-Z])\s*([-+]?(?:\d+\.?\d*|\.\d+))")
+_SETTING = re.compile(r"^\$(\d+)\s*=\s*([-+]?[\d.]+)")
+
+
+def settings_from_dump(text, base=None):
+    """
+    从 GRBL $$ 的输出 ($110=5000.000 这样的行) 读取规划相关的设置, 没列出的项沿用 base
+    """
+    settings = dict(DEFAULT_SETTINGS if base is None else base)
+    values = {}
+    for line in text.splitlines():
+        m = _SETTING.match(line.strip())
+        if m:
+            values[int(m.group(1))] = float(m.group(2))
+    for key, first in (("max_rate", 110), ("acceleration", 120)):
+        settings[key] = tuple(values.get(first + i, settings[key][i]) for i in range(3))
+    settings["junction_deviation"] = values.get(11, settings["junction_deviation"])
+    settings["arc_tolerance"] = values.get(12, settings["arc_tolerance"])
+    return settings
+
+
+def _source_lines(gcode, is_file):
+    # 保留空行, 报告中的行号与文件一致
+    if is_file:
+        with open(gcode, "r", encoding="utf-8") as f:
+            return f.read().splitlines()
+    if isinstance(gcode, str):
+        return gcode.splitlines()
+    if isinstance(gcode, list):
+        return [l for chunk in gcode for l in chunk.splitlines()]
+    return "\n".join(gcode).splitlines()
+
+
+def parse_gcode(lines, start=(0., 0., 0.)):
+    """
+    解释 G-code 的运动指令 (G0/G1/G2/G3/G4, G20/G21, G90/G91, F), 其余指令忽略
+
+    返回:
+        dict: 每个运动一项的数组
+            line (n,) 源代码行下标; motion (n,) RAPID/LINEAR/ARC_CW/ARC_CCW;
+            start/end (n, 3) 起止点 (mm); feed (n,) mm/min; center (n, 2) 圆弧圆心;
+            dwell: [(行下标, 秒)]
+    """
+    pos = np.asarray(start, dtype=float).copy()
+    motion, feed, scale, relative = RAPID, 0., 1., False
+    rows, dwell = [], []
+    for i, raw in enumerate(lines):
+        words = _WORD.findall(_COMMENT.sub("", raw).upper())
+        if not words:
+            continue
+        axes, offsets, moved = {}, {}, False
+        dwell_p = None
+        for letter, value in words:
+            v = float(value)
+            if letter == "G":
+                if v in (0, 1, 2, 3):
+                    motion = int(v)
+                elif v == 4:
+                    dwell_p = 0.
+                elif v == 20:
+                    scale = 25.4
+                elif v == 21:
+                    scale = 1.
+                elif v == 90:
+                    relative = False
+                elif v == 91:
+                    relative = True
+            elif letter == "F":
+                feed = v * scale
+            elif letter in "XYZ":
+                axes["XYZ".index(letter)] = v * scale
+                moved = True
+            elif letter in "IJ":
+                offsets[letter] = v * scale
+            elif letter == "P" and dwell_p is not None:
+                dwell_p = v
+        if dwell_p is not None:
+            dwell.append((i, dwell_p))
+            continue
+        if not moved:
+            continue
+        end = pos.copy()
+        for axis, v in axes.items():
+            end[axis] = pos[axis] + v if relative else v
+        if motion != RAPID and feed <= 0:
+            raise ValueError(f"Line {i + 1} '{raw.strip()}': feed rate is not set")
+        center = (pos[0] + offsets.get("I", 0.), pos[1] + offsets.get("J", 0.))
+        rows.append((i, motion, *pos, *end, feed, *center))
+        pos = end
+    data = np.array(rows, dtype=float).reshape(-1, 11)
+    return {
+        "line": data[:, 0].astype(np.intp),
+        "motion": data[:, 1].astype(np.intp),
+        "start": data[:, 2:5],
+        "end": data[:, 5:8],
+        "feed": data[:, 8],
+        "center": data[:, 9:11],
+        "dwell": dwell,
+    }
+
+
+def program_from_toolpath(tp, z_safe=5, z_draw=-1, start=(0., 0., 0.)):
+    """
+    toolpath 刀路 -> parse_gcode 格式的运动列表, 与 emit 对同一刀路输出的 G-code 逐条对应, 不经过文本
+
+    line 为刀路的行下标
+    """
+    op = tp["op"]
+    n = len(op)
+    down_before, down_after = emit.pen_state(op)
+    move = op == emit.MOVETO
+    draw = np.isin(op, (emit.LINETO, emit.ARC_CW, emit.ARC_CCW))
+    lift = (op == emit.CLOSEPOLY) & down_before
+    # MOVETO: (抬笔) -> G0 XY -> 落笔; 直线/圆弧一条; 落笔状态下的 CLOSEPOLY 抬笔
+    counts = np.where(move, 2 + down_before, 0) + draw + lift
+    row = np.repeat(np.arange(n), counts)
+    sub = np.arange(len(row)) - np.repeat(np.cumsum(counts) - counts, counts)
+    # 步骤类型: 0 抬笔, 1 移动 XY, 2 落笔
+    step = np.where(move[row], sub + 1 - down_before[row], np.where(draw[row], 1, 0))
+    if n and down_after[-1]:
+        row, step = np.r_[row, n - 1], np.r_[step, 0]  # 结束时抬笔
+
+    m = len(row)
+    idx = np.arange(m)
+    xy_step = step == 1
+    last_xy = np.maximum.accumulate(np.where(xy_step, idx, -1)) if m else idx
+    z_step = ~xy_step
+    last_z = np.maximum.accumulate(np.where(z_step, idx, -1)) if m else idx
+    z_value = np.where(step == 0, float(z_safe), float(z_draw))
+    end = np.empty((m, 3))
+    end[:, :2] = np.where((last_xy >= 0)[:, None], tp["xy"][row[np.maximum(last_xy, 0)]], start[:2])
+    end[:, 2] = np.where(last_z >= 0, z_value[np.maximum(last_z, 0)], start[2])
+    begin = np.empty_like(end)
+    begin[:1] = start
+    begin[1:] = end[:-1]
+
+    ops = op[row]
+    motion = np.where(step == 0, RAPID, np.where(step == 2, LINEAR, np.where(move[row], RAPID, LINEAR)))
+    motion = np.where(xy_step & (ops == emit.ARC_CW), ARC_CW, motion)
+    motion = np.where(xy_step & (ops == emit.ARC_CCW), ARC_CCW, motion)
+    return {
+        "line": row,
+        "motion": motion,
+        "start": begin,
+        "end": end,
+        "feed": tp["feed"][row].astype(float),
+        "center": tp["center"][row],
+        "dwell": [],
+    }
+
+
+def split_arcs(program, arc_tolerance=DEFAULT_SETTINGS["arc_tolerance"]):
+    """
+    按 GRBL mc_arc 的分段数把圆弧切成短弦, 返回全部直线 block
+
+    返回:
+        start, end (n, 3); feed (n,) mm/min, G0 为 inf; line (n,) 源代码行下标
+    """
+    motion = program["motion"]
+    feed = np.where(motion == RAPID, np.inf, program["feed"])
+    is_arc = (motion == ARC_CW) | (motion == ARC_CCW)
+    if not is_arc.any():
+        return program["start"], program["end"], feed, program["line"]
+
+    start, end, center = program["start"][is_arc], program["end"][is_arc], program["center"][is_arc]
+    r0 = start[:, :2] - center
+    r1 = end[:, :2] - center
+    radius = np.hypot(r0[:, 0], r0[:, 1])
+    travel = np.arctan2(r0[:, 0] * r1[:, 1] - r0[:, 1] * r1[:, 0], (r0 * r1).sum(axis=1))
+    cw = motion[is_arc] == ARC_CW
+    eps = 5e-7  # ARC_ANGULAR_TRAVEL_EPSILON
+    travel = np.where(cw & (travel >= -eps), travel - 2 * np.pi, travel)
+    travel = np.where(~cw & (travel <= eps), travel + 2 * np.pi, travel)
+    chord = np.sqrt(np.maximum(arc_tolerance * (2 * radius - arc_tolerance), 1e-12))
+    segments = np.maximum(np.floor(np.abs(0.5 * travel * radius) / chord), 1).astype(np.intp)
+
+    # 每段圆弧展开为 segments 个点 (最后一个就是终点), 圆弧以外的运动各占一个点
+    counts = np.ones(len(motion), dtype=np.intp)
+    counts[is_arc] = segments
+    owner = np.repeat(np.arange(len(motion)), counts)
+    step = np.arange(len(owner)) - np.repeat(np.cumsum(counts) - counts, counts) + 1
+    ends = program["end"][owner].copy()
+    arc_of = np.cumsum(is_arc) - 1
+    on_arc = is_arc[owner]
+    a = arc_of[owner[on_arc]]
+    frac = step[on_arc] / segments[a]
+    theta = np.arctan2(r0[a, 1], r0[a, 0]) + travel[a] * frac
+    inner = frac < 1
+    pts = np.column_stack([center[a, 0] + radius[a] * np.cos(theta),
+                           center[a, 1] + radius[a] * np.sin(theta),
+                           start[a, 2] + (end[a, 2] - start[a, 2]) * frac])
+    arc_ends = ends[on_arc]
+    arc_ends[inner] = pts[inner]
+    ends[on_arc] = arc_ends
+    starts = np.empty_like(ends)
+    starts[1:] = ends[:-1]
+    starts[0] = program["start"][0]
+    # 每段运动的第一个点从该运动自己的起点开始
+    first = np.cumsum(counts) - counts
+    starts[first] = program["start"]
+    return starts, ends, feed[owner], program["line"][owner]
+
+
+def plan(start, end, feed, settings=None, buffer_blocks=BLOCK_BUFFER_SIZE):
+    """
+    对直线 block 序列做 GRBL 式的速度规划
+
+    参数:
+        start, end (n, 3): block 起止点 (mm), 长度为 0 的 block 应事先去掉
+        feed (n,): 要求的进给速度 (mm/min), inf 表示 G0 快速移动
+        buffer_blocks (int): 规划缓冲区大小, None 表示整段程序一起规划
+
+    返回:
+        dict: length, nominal (mm/s), entry, exit, peak (mm/s), accel (mm/s²), seconds (n,)
+    """
+    settings = DEFAULT_SETTINGS if settings is None else settings
+    max_accel = np.asarray(settings["acceleration"], dtype=float)
+    max_rate = np.asarray(settings["max_rate"], dtype=float) / 60
+    delta = end - start
+    length = np.linalg.norm(delta, axis=1)
+    n = len(length)
+    unit = delta / length[:, None]
+    with np.errstate(divide="ignore"):
+        inv = 1 / np.abs(unit)
+    # 各轴限制折算到运动方向上
+    accel = np.min(max_accel * inv, axis=1)
+    nominal = np.minimum(feed / 60, np.min(max_rate * inv, axis=1))
+
+    # cap[i]: 第 i 个 block 进入速度的平方上限, cap[n] 为结束时的速度 (0)
+    cap = np.zeros(n + 1)
+    if n > 1:
+        prev, cur = unit[:-1], unit[1:]
+        cos = -(prev * cur).sum(axis=1)
+        junction = cur - prev
+        norm = np.linalg.norm(junction, axis=1, keepdims=True)
+        junction = np.divide(junction, norm, out=np.zeros_like(junction), where=norm > 0)
+        with np.errstate(divide="ignore"):
+            junction_accel = np.min(max_accel / np.abs(junction), axis=1)
+        sin_half = np.sqrt(np.clip(0.5 * (1 - cos), 0, 1))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            v2 = junction_accel * settings["junction_deviation"] * sin_half / (1 - sin_half)
+        v2 = np.where(cos > 0.999999, 0., np.where(cos < -0.999999, np.inf, v2))
+        cap[1:n] = np.minimum(v2, np.minimum(nominal[:-1], nominal[1:]) ** 2)
+
+    gain = np.zeros(n + 1)  # S: 2·a·d 的累积和
+    np.cumsum(2 * accel * length, out=gain[1:])
+    if buffer_blocks:
+        # 进入 block i 时缓冲区里只有 i 之后的 buffer_blocks - 1 个 block, 末尾必须能停下
+        reach = np.minimum(np.arange(n + 1) + buffer_blocks - 1, n)
+        cap = np.minimum(cap, gain[reach] - gain)
+    forward = gain + np.minimum.accumulate(cap - gain)
+    backward = np.minimum.accumulate((cap + gain)[::-1])[::-1] - gain
+    v = np.sqrt(np.maximum(np.minimum(forward, backward), 0))
+    entry, exit_ = v[:-1], v[1:]
+
+    # 梯形加减速; 达不到额定速度时为三角形
+    peak = np.minimum(nominal, np.sqrt((2 * accel * length + entry ** 2 + exit_ ** 2) / 2))
+    ramp_up = (peak ** 2 - entry ** 2) / (2 * accel)
+    ramp_down = (peak ** 2 - exit_ ** 2) / (2 * accel)
+    cruise = np.maximum(length - ramp_up - ramp_down, 0)
+    seconds = (peak - entry) / accel + (peak - exit_) / accel + cruise / peak
+    return {"length": length, "nominal": nominal, "entry": entry, "exit": exit_,
+            "peak": peak, "accel": accel, "seconds": seconds}
+
+
+def estimate(gcode, is_file=True, settings=None, pen_z=0., buffer_blocks=BLOCK_BUFFER_SIZE, top=10,
+             z_safe=5, z_draw=-1):
+    """
+    估算 G-code 的执行时间
+
+    参数:
+        gcode: 文件路径 (is_file=True), 或 G-code 文本、行列表、text_to_gcode_iter 这样的生成器;
+            也可以是 toolpath 刀路, 此时按 emit 会输出的运动直接估算 (z_safe/z_draw 同 emit), 不生成文本
+        settings (dict): 机器设置, 见 DEFAULT_SETTINGS / settings_from_dump
+        pen_z (float): Z 低于此值时视为落笔
+        top (int): 报告中列出的限速最严重的 block 数
+
+    返回:
+        dict: seconds 总时间; draw/travel/pen/dwell 落笔绘制、抬笔空走、抬落笔 (Z 运动)、
+            暂停的秒数; draw_mm/travel_mm 距离; blocks block 数; limited 未达到 F 的 block 数;
+            limiting [{line, text, length, feed, peak, lost, reason}] 按损失时间降序
+            (刀路的 line 为行号, 从 1 开始, text 为空)
+    """
+    settings = DEFAULT_SETTINGS if settings is None else settings
+    if toolpath.is_toolpath(gcode):
+        lines = None
+        program = program_from_toolpath(gcode, z_safe, z_draw)
+    else:
+        lines = _source_lines(gcode, is_file)
+        program = parse_gcode(lines)
+    start, end, feed, line = split_arcs(program, settings["arc_tolerance"])
+    keep = np.any(np.abs(end - start) > 1e-9, axis=1)  # GRBL 丢弃长度为 0 的运动
+    start, end, feed, line = start[keep], end[keep], feed[keep], line[keep]
+    blocks = plan(start, end, feed, settings, buffer_blocks)
+    seconds = blocks["seconds"]
+
+    z_move = end[:, 2] != start[:, 2]
+    down = ~z_move & (end[:, 2] < pen_z)
+    up = ~z_move & ~down
+    dwell = sum(p for _, p in program["dwell"])
+
+    # 按要求的 F (G0 按最大速度) 匀速走完需要的时间, 与规划结果之差即加减速和拐角损失的时间
+    requested = np.where(np.isinf(feed), blocks["nominal"], feed / 60)
+    ideal = blocks["length"] / requested
+    lost = seconds - ideal
+    reached = blocks["peak"] >= blocks["nominal"] * 0.999
+    limited = ~reached | (blocks["nominal"] < requested * 0.999)
+    reason = np.where(~reached, "short", np.where(blocks["nominal"] < requested * 0.999, "max_rate", "junction"))
+
+    limiting = []
+    for i in np.argsort(-lost)[:top].tolist():
+        if lost[i] <= 0:
+            break
+        limiting.append({"line": int(line[i]) + 1, "text": lines[line[i]].strip() if lines else "",
+                         "length": float(blocks["length"][i]), "feed": float(requested[i] * 60),
+                         "peak": float(blocks["peak"][i] * 60), "lost": float(lost[i]),
+                         "reason": str(reason[i])})
+    return {
+        "seconds": float(seconds.sum() + dwell),
+        "draw": float(seconds[down].sum()),
+        "travel": float(seconds[up].sum()),
+        "pen": float(seconds[z_move].sum()),
+        "dwell": float(dwell),
+        "draw_mm": float(blocks["length"][down].sum()),
+        "travel_mm": float(blocks["length"][up].sum()),
+        "blocks": int(len(seconds)),
+        "limited": int(limited.sum()),
+        "lost": float(np.maximum(lost, 0).sum()),
+        "limiting": limiting,
+    }
+
+
+def format_duration(seconds):
+    minutes, sec = divmod(int(math.ceil(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{sec:02d}" if hours else f"{minutes}:{sec:02d}"
+
+
+def format_report(report):
+    total = report["seconds"] or 1.
+    rows = [
+        f"Estimated time: {format_duration(report['seconds'])} ({report['seconds']:.1f}s, "
+        f"{report['blocks']} blocks)",
+        f"  pen down : {report['draw']:8.1f}s {report['draw'] / total:6.1%}  {report['draw_mm']:,.0f} mm",
+        f"  pen up   : {report['travel']:8.1f}s {report['travel'] / total:6.1%}  {report['travel_mm']:,.0f} mm",
+        f"  pen lift : {report['pen']:8.1f}s {report['pen'] / total:6.1%}",
+    ]
+    if report["dwell"]:
+        rows.append(f"  dwell    : {report['dwell']:8.1f}s {report['dwell'] / total:6.1%}")
+    rows.append(f"  {report['limited']} blocks below requested feed, {report['lost']:.1f}s lost to "
+                f"acceleration and corners")
+    for item in report["limiting"]:
+        rows.append(f"    line {item['line']:>6} {item['reason']:<8} {item['length']:7.3f} mm "
+                    f"peak {item['peak']:6.0f}/{item['feed']:.0f} mm/min  -{item['lost']:.3f}s  {item['text']}")
+    return "\n".join(rows)
+
+
+if __name__ == "__main__":
+    for path in sys.argv[1:] or ["exam.gcode"]:
+        print(path)
+        print(format_report(estimate(path)))
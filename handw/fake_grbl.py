@@ -0,0 +1,139 @@
+"""
+基于 pty 的 GRBL 模拟器, 用于在没有写字机的情况下测试串口发送
+
+用法:
+    with FakeGrbl(line_time=0.001) as fake:
+        upload_gcode_to_grbl(fake.port, 115200, gcode, is_file=False)
+        print(fake.received, fake.overflow)
+"""
+import os
+import pty
+import re
+import select
+import threading
+import time
+import tty
+from collections import deque
+
+import grbl
+
+_AXIS = re.compile(r"([XYZ])(-?\d*\.?\d+)")
+
+
+class FakeGrbl:
+    """
+    模拟 GRBL 的串口行为
+
+    按 RX 缓冲区 -> 规划器队列 -> 执行 的顺序处理: 行从接收缓冲区进入规划器时回复 ok,
+    规划器满时行停留在接收缓冲区; 与 GRBL 的环形缓冲区一样最多存 rx_buffer_size - 1 字节,
+    达到 rx_buffer_size 记为溢出。
+    支持实时命令 ? (状态报告)、! (暂停)、~ (继续)、Ctrl-X (软复位, 清空缓冲区和规划器)。
+
+    参数:
+        rx_buffer_size (int): 接收缓冲区大小 (字节)
+        planner_size (int): 规划器队列长度
+        line_time (float): 每个运动段的模拟执行时间 (秒)
+        fail_after (int): 收到这么多行后关闭端口, 模拟设备掉线
+    """
+
+    def __init__(self, rx_buffer_size=grbl.RX_BUFFER_SIZE, planner_size=15, line_time=0.0, fail_after=None):
+        self.rx_buffer_size = rx_buffer_size
+        self.planner_size = planner_size
+        self.line_time = line_time
+        self.fail_after = fail_after
+        self.received = []
+        self.overflow = False
+        self.position = [0.0, 0.0, 0.0]
+        self.hold = False
+        self.resets = 0
+        self._planner = deque()
+        self._master, self._slave = pty.openpty()
+        tty.setraw(self._slave)
+        self.port = os.ttyname(self._slave)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def start(self):
+        self._thread.start()
+
+    def close(self):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout=2)
+        self._close_master()
+        if self._slave >= 0:
+            os.close(self._slave)
+            self._slave = -1
+
+    def _close_master(self):
+        if self._master >= 0:
+            os.close(self._master)
+            self._master = -1
+
+    def _reply(self, text):
+        os.write(self._master, (text + "\r\n").encode())
+
+    def _status(self):
+        # 模拟的运动段暂停时立刻停住, 进给保持总是已完成 (Hold:0)
+        state = "Hold:0" if self.hold else ("Run" if self._planner else "Idle")
+        x, y, z = self.position
+        return f"<{state}|MPos:{x:.3f},{y:.3f},{z:.3f}|FS:0,0>"
+
+    def _run(self):
+        rx = bytearray()
+        next_done = 0.
+        while not self._stop.is_set():
+            ready, _, _ = select.select([self._master], [], [], 0.001)
+            if ready:
+                try:
+                    data = os.read(self._master, 4096)
+                except OSError:
+                    break
+                for byte in data:
+                    ch = bytes([byte])
+                    if ch == b"?":
+                        self._reply(self._status())
+                    elif ch == b"!":
+                        self.hold = True
+                    elif ch == b"~":
+                        self.hold = False
+                    elif ch == b"\x18":
+                        rx.clear()
+                        self._planner.clear()
+                        self.hold = False
+                        self.resets += 1
+                        self._reply("Grbl 1.1h ['$' for help]")
+                    else:
+                        rx.append(byte)
+                if len(rx) >= self.rx_buffer_size:
+                    self.overflow = True
+
+            # 接收缓冲区中的完整行进入规划器
+            while b"\n" in rx and len(self._planner) < self.planner_size:
+                end = rx.index(b"\n")
+                line = rx[:end].decode(errors="ignore").strip()
+                del rx[:end + 1]
+                if not line:
+                    continue
+                self.received.append(line)
+                if self.fail_after is not None and len(self.received) >= self.fail_after:
+                    self._stop.set()
+                    self._close_master()
+                    return
+                self._planner.append(line)
+                self._reply("ok" if line[0] in "GMFSTN$XYZIJKRP" else "error:20")
+
+            # 按模拟时间执行规划器中的运动段
+            now = time.perf_counter()
+            if self._planner and not self.hold and now >= next_done:
+                line = self._planner.popleft()
+                for axis, value in _AXIS.findall(line):
+                    self.position["XYZ".index(axis)] = float(value)
+                next_done = now + self.line_time
@@ -0,0 +1,149 @@
+"""
+字体索引: 扫描字体目录, 记录每个字体文件中各 face 的名称, 结果持久化到缓存文件
+
+目录按 mtime 判断是否需要重新列出文件, 字体文件按 (mtime, size) 判断是否需要重新解析,
+未变化时只做 stat, 不打开字体。.ttc/.otc 字体集合中的每个 face 单独记录 face 索引。
+"""
+import json
+import os
+from collections import namedtuple
+
+CACHE_VERSION = 1
+SUFFIXES = (".ttf", ".otf", ".ttc", ".otc", ".atlas")
+
+FontFace = namedtuple("FontFace", ["path", "face_index", "family", "style", "full_name"])
+
+
+def default_cache_file():
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "handw", "font_index.json")
+
+
+def read_faces(path):
+    """
+    读取字体文件中每个 face 的名称
+
+    返回:
+        list[dict]: face, family, style, full_name; 图集 (.atlas) 没有 name 表, 用文件名
+    """
+    # 缓存命中时不需要 fontTools, 只在真正解析字体时导入
+    from fontTools.ttLib import TTCollection, TTFont
+
+    stem = os.path.splitext(os.path.basename(path))[0]
+    if path.lower().endswith(".atlas"):
+        return [{"face": 0, "family": stem, "style": "Regular", "full_name": stem}]
+    if path.lower().endswith((".ttc", ".otc")):
+        source = TTCollection(path, lazy=True)
+        fonts = source.fonts
+    else:
+        source = TTFont(path, lazy=True)
+        fonts = [source]
+    faces = []
+    try:
+        # 集合中的各 face 共用一个文件句柄, 读完全部再关闭
+        for i, font in enumerate(fonts):
+            name = font["name"]
+            family = name.getBestFamilyName() or stem
+            style = name.getBestSubFamilyName() or "Regular"
+            faces.append({"face": i, "family": family, "style": style,
+                          "full_name": name.getBestFullName() or f"{family} {style}"})
+    finally:
+        source.close()
+    return faces
+
+
+class FontIndex:
+    """
+    持久化的字体索引
+
+    参数:
+        cache_file (str): 缓存文件路径, None 使用 ~/.cache/handw/font_index.json, "" 表示不落盘
+    """
+
+    def __init__(self, cache_file=None):
+        self.cache_file = default_cache_file() if cache_file is None else cache_file
+        self.dirs = {}   # 目录 -> {"mtime", "files", "subdirs"}
+        self.files = {}  # 字体文件 -> {"mtime", "size", "faces"}
+        self.parsed = 0  # 本次运行解析过的文件数
+        self._dirty = False
+        self._load()
+
+    def _load(self):
+        if not self.cache_file or not os.path.exists(self.cache_file):
+            return
+        try:
+            with open(self.cache_file, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return  # 损坏的缓存当作没有
+        if data.get("version") == CACHE_VERSION:
+            self.dirs = data.get("dirs", {})
+            self.files = data.get("files", {})
+
+    def save(self):
+        if not self.cache_file or not self._dirty:
+            return
+        os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
+        tmp = self.cache_file + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"version": CACHE_VERSION, "dirs": self.dirs, "files": self.files}, f)
+        os.replace(tmp, self.cache_file)
+        self._dirty = False
+
+    def _list_dir(self, folder):
+        # 目录 mtime 不变时文件增删都不会发生, 直接用上次的列表
+        try:
+            mtime = os.stat(folder).st_mtime
+        except OSError:
+            return [], []
+        entry = self.dirs.get(folder)
+        if entry is None or entry["mtime"] != mtime:
+            files, subdirs = [], []
+            with os.scandir(folder) as it:
+                for e in it:
+                    if e.is_dir():
+                        subdirs.append(e.path)
+                    elif e.name.lower().endswith(SUFFIXES):
+                        files.append(e.path)
+            entry = {"mtime": mtime, "files": sorted(files), "subdirs": sorted(subdirs)}
+            self.dirs[folder] = entry
+            self._dirty = True
+        return entry["files"], entry["subdirs"]
+
+    def faces_of(self, path):
+        """单个字体文件的 face 列表, (mtime, size) 不变时直接用缓存"""
+        path = os.path.abspath(path)
+        try:
+            st = os.stat(path)
+        except OSError:
+            return []
+        entry = self.files.get(path)
+        if entry is None or entry["mtime"] != st.st_mtime or entry["size"] != st.st_size:
+            try:
+                faces = read_faces(path)
+            except Exception:
+                faces = []  # 无法解析的文件也记下, 不必每次重试
+            entry = {"mtime": st.st_mtime, "size": st.st_size, "faces": faces}
+            self.files[path] = entry
+            self.parsed += 1
+            self._dirty = True
+        return [FontFace(path, f["face"], f["family"], f["style"], f["full_name"]) for f in entry["faces"]]
+
+    def scan(self, folders):
+        """
+        递归扫描目录, 返回全部 FontFace (按路径、face 索引排序), 并写回缓存文件
+        """
+        faces = []
+        pending = [os.path.abspath(f) for f in folders if f]
+        seen = set()
+        while pending:
+            folder = pending.pop()
+            if folder in seen:
+                continue
+            seen.add(folder)
+            files, subdirs = self._list_dir(folder)
+            for path in files:
+                faces.extend(self.faces_of(path))
+            pending.extend(subdirs)
+        self.save()
+        return sorted(faces, key=lambda f: (f.path, f.face_index))
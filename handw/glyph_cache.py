@@ -0,0 +1,192 @@
+import os
+import hashlib
+import threading
+import warnings
+from collections import OrderedDict, namedtuple
+from functools import lru_cache
+
+import numpy as np
+from matplotlib import ft2font
+from matplotlib.font_manager import FontProperties, findfont
+
+try:
+    _NO_HINTING = ft2font.LoadFlags.NO_HINTING
+    _KERNING_DEFAULT = ft2font.Kerning.DEFAULT
+except AttributeError:  # matplotlib < 3.10
+    _NO_HINTING = ft2font.LOAD_NO_HINTING
+    _KERNING_DEFAULT = ft2font.KERNING_DEFAULT
+
+# 新版 matplotlib 用 libraqm 排版: 前进宽度取 horiAdvance, 字距不做取整;
+# 旧版取 linearHoriAdvance 与默认字距。按安装版本选择, 保证与 TextPath 位置一致
+_RAQM = hasattr(ft2font.FT2Font, "_layout")
+if _RAQM:
+    _KERNING_DEFAULT = ft2font.Kerning.UNFITTED
+
+# 与 matplotlib TextToPath 一致: 字形统一在 100pt / 72dpi 下取轮廓再按字号缩放
+FONT_SCALE = 100.
+DPI = 72
+
+Glyph = namedtuple("Glyph", ["vertices", "codes", "advance", "index"])
+
+
+# FT2Font 的 load_char/load_glyph -> get_path 依赖对象内部状态, 生成线程和上传线程不能交错调用
+_font_lock = threading.RLock()
+
+
+@lru_cache(maxsize=32)
+def _load_font(font_file, face_index=0):
+    # 自己打开的 FT2Font, 不用 matplotlib get_font 的共享对象: 其他文字渲染会改掉共享对象的字号
+    if not os.path.exists(font_file):
+        # 与 TextPath 一样接受家族名 (如 "DejaVu Sans"), 由 matplotlib 查找对应的字体文件
+        font_file = findfont(FontProperties(family=font_file))
+    font = ft2font.FT2Font(font_file, face_index=face_index)
+    font.set_size(FONT_SCALE, DPI)
+    return font
+
+
+class GlyphCache:
+    """
+    字形轮廓缓存 (LRU)
+
+    键为 (字体文件, face 索引, 字符, 字号), 值为字形原点处的 vertices/codes
+    以及前进宽度。排版时只需按偏移平移缓存数组, 不再重复调用 TextPath。
+
+    参数:
+        maxsize (int): 内存中最多保留的字形数, 超出按最近最少使用淘汰
+        cache_dir (str): 可选的磁盘缓存目录, 每个字形保存为一个 .npz 文件
+    """
+
+    def __init__(self, maxsize=4096, cache_dir=None):
+        self.maxsize = maxsize
+        self.cache_dir = cache_dir
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        self._entries.clear()
+        self.hits = self.misses = 0
+
+    def get(self, font_file, face_index, char, size):
+        key = (font_file, face_index, char, float(size))
+        glyph = self._entries.get(key)
+        if glyph is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return glyph
+
+        self.misses += 1
+        disk_file = self._disk_file(key)
+        if disk_file and os.path.exists(disk_file):
+            with np.load(disk_file) as data:
+                glyph = Glyph(data["vertices"], data["codes"],
+                              float(data["advance"]), int(data["index"]))
+        else:
+            glyph = self._render(font_file, face_index, char, size)
+            if disk_file:
+                np.savez(disk_file, vertices=glyph.vertices, codes=glyph.codes,
+                         advance=glyph.advance, index=glyph.index)
+
+        self._entries[key] = glyph
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+        return glyph
+
+    def kerning(self, font_file, face_index, left, right, size):
+        """两个字形索引之间的字距调整量 (已按字号缩放)"""
+        if not left or not right:
+            return 0.
+        font = _load_font(font_file, face_index)
+        with _font_lock:
+            kern = font.get_kerning(left, right, _KERNING_DEFAULT)
+        return kern / 64. * size / FONT_SCALE
+
+    def _disk_file(self, key):
+        if not self.cache_dir:
+            return None
+        font_file, face_index, char, size = key
+        # 字体文件被替换后 mtime 变化, 自动落到新的缓存文件
+        mtime = os.path.getmtime(font_file) if os.path.exists(font_file) else 0
+        digest = hashlib.sha1(repr((os.path.abspath(font_file), mtime, face_index, char, size))
+                              .encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, f"{digest}.npz")
+
+    @staticmethod
+    def _render(font_file, face_index, char, size):
+        font = _load_font(font_file, face_index)
+        with _font_lock:
+            index = font.get_char_index(ord(char))
+            if index == 0:
+                # 字体中没有这个字符: 与 TextPath 一样警告后继续, 画 .notdef 字形 (通常是方框)
+                warnings.warn(f"Glyph {ord(char)} ({char!r}) missing from font {font.fname}")
+                ft_glyph = font.load_glyph(0, flags=_NO_HINTING)
+            else:
+                ft_glyph = font.load_char(ord(char), flags=_NO_HINTING)
+            verts, codes = font.get_path()
+            horizontal = ft_glyph.horiAdvance if _RAQM else ft_glyph.linearHoriAdvance
+        scale = size / FONT_SCALE
+        vertices = np.asarray(verts, dtype=float).reshape(-1, 2) * scale
+        codes = np.asarray(codes, dtype=np.uint8)
+        advance = horizontal / (64. if _RAQM else 65536.) * scale
+        return Glyph(vertices, codes, advance, index)
+
+
+_default_cache = GlyphCache()
+
+
+def default_cache():
+    return _default_cache
+
+
+def layout_line(line, font_file, size, x=0., y=0., face_index=0, cache=None):
+    """
+    用缓存字形排版单行文本
+
+    参数:
+        line (str): 单行文本 (不含换行)
+        font_file (str): 字体文件路径
+        size (float): 字号
+        x, y (float): 行起点
+        face_index (int): .ttc 字体集合中的 face 索引
+        cache (GlyphCache): 字形缓存, 默认使用模块级共享缓存
+
+    返回:
+        vertices (np.ndarray), codes (np.ndarray)
+    """
+    if cache is None:
+        cache = _default_cache
+    verts, codes = [], []
+    pen_x = x
+    prev_index = 0
+    for char in line:
+        glyph = cache.get(font_file, face_index, char, size)
+        pen_x += cache.kerning(font_file, face_index, prev_index, glyph.index, size)
+        if len(glyph.codes):
+            verts.append(glyph.vertices + (pen_x, y))
+            codes.append(glyph.codes)
+        pen_x += glyph.advance
+        prev_index = glyph.index
+
+    if not verts:
+        return np.empty((0, 2)), np.empty(0, dtype=np.uint8)
+    return np.concatenate(verts), np.concatenate(codes)
+
+
+def line_advances(line, font_file, size, face_index=0, cache=None):
+    """
+    单行中每个字符的前进宽度 (含与前一字符的字距), 之和等于 layout_line 排版后的行宽
+    """
+    if cache is None:
+        cache = _default_cache
+    advances = np.empty(len(line))
+    prev_index = 0
+    for i, char in enumerate(line):
+        glyph = cache.get(font_file, face_index, char, size)
+        advances[i] = glyph.advance + cache.kerning(font_file, face_index, prev_index, glyph.index, size)
+        prev_index = glyph.index
+    return advances
@@ -0,0 +1,294 @@
+import os
+import threading
+import time
+from collections import deque
+
+# GRBL 串口接收缓冲区大小 (字节), 见 GRBL 源码 RX_BUFFER_SIZE;
+# 环形缓冲区留一个空位区分空和满, 实际最多存 RX_BUFFER_SIZE - 1 字节
+RX_BUFFER_SIZE = 128
+
+
+def iter_gcode_lines(gcode, is_file=True):
+    """
+    逐行产出 G-code, 去掉空行和 ( 开头的注释行
+
+    参数:
+        gcode (str|iterable): G-code 文件路径 (is_file=True), 或 G-code 文本、行列表、
+            逐段产出多行文本的生成器 (is_file=False)
+    """
+    if is_file:
+        if not os.path.exists(gcode):
+            raise FileNotFoundError(f"G-code file not found: {gcode}")
+        with open(gcode, "r", encoding="utf-8") as f:
+            for line in f:
+                l = line.strip()
+                if l and not l.startswith("("):
+                    yield l
+        return
+    if isinstance(gcode, str):
+        gcode = [gcode]
+    elif not hasattr(gcode, "__iter__"):
+        raise ValueError("gcode must be str, list or iterable when is_file=False")
+
+    for chunk in gcode:
+        for line in chunk.splitlines():
+            l = line.strip()
+            if not l or l.startswith("("):  # 跳过空行和注释
+                continue
+            yield l
+
+
+def read_gcode_lines(gcode, is_file=True):
+    """读取全部 G-code 行 (已去掉空行和注释), 参数同 iter_gcode_lines"""
+    return list(iter_gcode_lines(gcode, is_file))
+
+
+def open_grbl(port, baudrate, wake_delay=2):
+    """打开串口并唤醒 GRBL, 清空上电时的欢迎信息"""
+    import serial  # 只有真正连接写字机时才需要 pyserial
+
+    ser = serial.Serial(port, baudrate, timeout=1)
+    time.sleep(wake_delay)  # 等待 GRBL 上电复位
+
+    # 重置并清空缓冲
+    ser.write(b"\r\n\r\n")
+    time.sleep(wake_delay)
+    ser.reset_input_buffer()
+    return ser
+
+
+class StreamJob:
+    """
+    流式发送的控制句柄, 可在其他线程 (如 GUI) 中暂停、继续或取消正在进行的发送
+    """
+
+    def __init__(self):
+        self._paused = threading.Event()
+        self._cancelled = threading.Event()
+
+    def pause(self):
+        self._paused.set()
+
+    def resume(self):
+        self._paused.clear()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    @property
+    def paused(self):
+        return self._paused.is_set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+
+def parse_status(report):
+    """
+    解析 ? 状态报告, 如 <Idle|MPos:0.000,0.000,0.000|FS:0,0>
+
+    返回:
+        dict: state 以及各字段; MPos/WPos/WCO 等坐标字段转为 float 元组
+    """
+    fields = report.strip().strip("<>").split("|")
+    status = {"state": fields[0]}
+    for field in fields[1:]:
+        key, _, value = field.partition(":")
+        try:
+            status[key] = tuple(float(v) for v in value.split(","))
+        except ValueError:
+            status[key] = value
+    return status
+
+
+class _Replies:
+    # 读取 GRBL 回复; 需要时按间隔发送 ? 并把状态报告交给 on_status
+    def __init__(self, ser, on_status=None, status_interval=0.25):
+        self.ser = ser
+        self.on_status = on_status
+        self.status_interval = status_interval
+        self._last_poll = 0.
+        if on_status and getattr(ser, "timeout", None) and ser.timeout > status_interval:
+            # readline 超时不能长于查询间隔, 否则暂停或长距离运动时状态更新会停顿
+            ser.timeout = status_interval
+
+    def poll_status(self):
+        now = time.perf_counter()
+        if self.on_status and now - self._last_poll >= self.status_interval:
+            self.ser.write(b"?")  # 实时命令, 不占接收缓冲区
+            self._last_poll = now
+
+    def next(self):
+        """读取一行; 是 ok/error 时返回该回复, 否则返回 None"""
+        self.poll_status()
+        reply = self.ser.readline().decode(errors="ignore").strip()
+        if not reply:
+            return None
+        if reply.startswith("<"):
+            if self.on_status:
+                self.on_status(parse_status(reply))
+            return None
+        lower = reply.lower()
+        if lower == "ok" or lower.startswith("error"):
+            return reply
+        if lower.startswith("alarm"):
+            raise RuntimeError(f"GRBL alarm: {reply}")
+        return None  # [MSG:...] 等其他消息
+
+
+def wait_for_state(ser, states, timeout, interval=0.05):
+    """
+    按 interval 发送 ? 直到状态报告为 states 之一
+
+    返回:
+        str: 达到的状态; timeout 秒内没有达到时返回 None
+    """
+    deadline = time.perf_counter() + timeout
+    last_poll = 0.
+    while True:
+        now = time.perf_counter()
+        if now >= deadline:
+            return None
+        if now - last_poll >= interval:
+            ser.write(b"?")
+            last_poll = now
+        reply = ser.readline().decode(errors="ignore").strip()
+        if reply.startswith("<"):
+            state = parse_status(reply)["state"]
+            if state in states:
+                return state
+
+
+def _wait_ok(ser, timeout):
+    # 等待一行命令的 ok/error, 超时返回 None
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        reply = ser.readline().decode(errors="ignore").strip().lower()
+        if reply == "ok" or reply.startswith("error"):
+            return reply
+    return None
+
+
+def stop_machine(ser, z_safe=5, timeout=5.):
+    """
+    中止运动并抬笔
+
+    先 ! 进给保持, 用 ? 等到减速停稳 (Hold:0, 或规划器已空的 Idle) 再软复位, 停稳后复位不会丢位置、
+    不触发 ALARM; 等不到时 timeout 秒后照样复位。复位后控制器处于 Alarm (锁定) 时发送 $X 解锁,
+    解锁后发送 G0 Z<z_safe> 抬笔, 免得笔停在纸上。
+
+    返回:
+        bool: 是否已抬笔
+    """
+    ser.write(b"!")
+    wait_for_state(ser, ("Hold:0", "Idle"), timeout)
+    ser.write(b"\x18")
+    state = wait_for_state(ser, ("Idle", "Alarm"), timeout)
+    if state == "Alarm":
+        ser.write(b"$X\n")
+        _wait_ok(ser, timeout)
+        state = wait_for_state(ser, ("Idle",), timeout)
+    if state != "Idle":
+        return False
+    ser.write(f"G0 Z{z_safe}\n".encode())
+    return _wait_ok(ser, timeout) == "ok"
+
+
+def stream_gcode(ser, lines, rx_buffer_size=RX_BUFFER_SIZE, progress=None, job=None, on_status=None,
+                 status_interval=0.25, z_safe=5):
+    """
+    按 GRBL 的字符计数协议流式发送 G-code
+
+    记录已发送但尚未收到 ok 的每行字节数, 只要新行放得进控制器的接收缓冲区就继续发送,
+    缓冲区满时才等待回复。这样 GRBL 的规划器始终有排队的运动段, 密集的短 G1 不会停顿。
+
+    参数:
+        ser: 已打开的串口 (或任何提供 write/readline 的对象)
+        lines (list|iterable): 已清理的 G-code 行; 可以是生成器, 边生成边发送
+        rx_buffer_size (int): 控制器接收缓冲区大小 (字节)
+        progress (callable): 每收到一个回复调用 progress(done, total), 行数未知时 total 为 None
+        job (StreamJob): 暂停/继续/取消控制; 暂停发送 ! (进给保持), 继续发送 ~, 取消时停稳后软复位并抬笔 (见 stop_machine)
+        on_status (callable): 给出时每 status_interval 秒发送 ? 并以解析后的状态调用 on_status(dict)
+        z_safe (float): 取消后抬笔的高度
+
+    返回:
+        dict: lines, seconds, lines_per_sec, errors (行号, 行, 回复), cancelled; 取消时另有 pen_up (是否已抬笔)
+    """
+    in_flight = deque()
+    buffered = 0
+    acked = 0
+    errors = []
+    total = len(lines) if hasattr(lines, "__len__") else None
+    replies = _Replies(ser, on_status, status_interval)
+    start = time.perf_counter()
+
+    def handle(reply):
+        nonlocal buffered, acked
+        line_no, line, size = in_flight.popleft()
+        buffered -= size
+        acked += 1
+        if reply.lower().startswith("error"):
+            errors.append((line_no, line, reply))
+        if progress:
+            progress(acked, total)
+
+    def hold():
+        # 暂停期间继续读取回复, 规划器里剩余的行仍会回 ok
+        ser.write(b"!")
+        while job.paused and not job.cancelled:
+            reply = replies.next()
+            if reply is not None and in_flight:
+                handle(reply)
+        if not job.cancelled:
+            ser.write(b"~")
+
+    cancelled = False
+    source = iter(lines)
+    line_no = 0
+    line = cmd = None
+    while True:
+        if job and job.paused:
+            hold()
+        if job and job.cancelled:
+            cancelled = True
+            break
+        if cmd is None:
+            line = next(source, None)
+            if line is None:
+                break
+            cmd = (line + "\n").encode("utf-8")
+        # 控制器缓冲区放不下这一行时 (最多 rx_buffer_size - 1 字节), 先读回复腾出空间
+        if in_flight and buffered + len(cmd) >= rx_buffer_size:
+            reply = replies.next()
+            if reply is not None:
+                handle(reply)
+            continue
+        ser.write(cmd)
+        in_flight.append((line_no, line, len(cmd)))
+        buffered += len(cmd)
+        line_no += 1
+        cmd = None
+
+    while in_flight and not cancelled:
+        if job and job.cancelled:
+            cancelled = True
+            break
+        reply = replies.next()
+        if reply is not None:
+            handle(reply)
+
+    stats = {"cancelled": cancelled}
+    if cancelled:
+        stats["pen_up"] = stop_machine(ser, z_safe)
+
+    seconds = time.perf_counter() - start
+    stats.update(lines=acked, seconds=seconds, lines_per_sec=acked / seconds if seconds > 0 else float("inf"),
+                 errors=errors)
+    return stats
+
+
+def send_gcode(ser, lines, progress=None, job=None, on_status=None, z_safe=5):
+    """逐行发送, 每行等到 ok 再发下一行 (兼容不支持流式的控制器)"""
+    return stream_gcode(ser, lines, rx_buffer_size=0, progress=progress, job=job, on_status=on_status,
+                        z_safe=z_safe)
@@ -4,7 +4,7 @@ from docx import Document
 import matplotlib.pyplot as plt
 from matplotlib.textpath import TextPath
 from matplotlib.font_manager import FontProperties
-from control import text_to_gcode, preview_text_path, export_gcode_to_file, get_font_support
+from control import text_to_gcode, preview_text_path, export_gcode_to_file, get_font_support, resolve_font
 import utils as ul
 import os
 from functools import partial
@@ -35,8 +35,8 @@ def preview_text(text_widget):
         messagebox.showwarning("Warning", "Text area is empty!")
         return
     font_name = font_box.get()
-    font_file = get_font_support().get(font_name)
-    gcode, text_path = text_to_gcode(text, font_name=font_file)
+    font_file, face_index = resolve_font(font_name)
+    gcode, text_path = text_to_gcode(text, font_name=font_file, face_index=face_index)
     preview_text_path(text_path)
 
 def export_gcode():
@@ -45,8 +45,8 @@ def export_gcode():
         messagebox.showwarning("Warning", "Text area is empty!")
         return
     font_name = font_box.get()
-    font_file = get_font_support().get(font_name)
-    gcode, _ = text_to_gcode(text, font_name=font_file)
+    font_file, face_index = resolve_font(font_name)
+    gcode, _ = text_to_gcode(text, font_name=font_file, face_index=face_index)
 
     filename = filedialog.asksaveasfilename(defaultextension=".gcode", filetypes=[("G-code Files", "*.gcode")])
     if not filename:
@@ -1,14 +1,12 @@
 import sys
+from PyQt5.QtCore import QTimer
 from PyQt5.QtWidgets import (
     QApplication, QWidget, QVBoxLayout, QHBoxLayout,
     QPushButton, QTextEdit, QComboBox, QFileDialog, QMessageBox,
-    QLabel, QLineEdit
+    QLabel, QLineEdit, QProgressBar
 )
-from docx import Document 
-from control import text_to_gcode, export_gcode_to_file, get_font_support, upload_gcode_to_grbl
-from qt_show import PreviewWindow
-import serial
-import serial.tools.list_ports
+from control import export_gcode_to_file, get_font_support, resolve_font
+from qt_jobs import FunctionThread, UploadThread
 
 class GCodeGenerator(QWidget):
     def __init__(self):
@@ -20,7 +18,7 @@ class GCodeGenerator(QWidget):
         main_layout = QVBoxLayout()
         top_layout = QHBoxLayout()
 
-        self.preview_window = PreviewWindow()
+        self.preview_window = None  # 第一次预览时创建, 预览窗口依赖的 matplotlib 到那时才导入
         # open files button
         btn_load = QPushButton("open files")
         btn_load.clicked.connect(self.load_text_file)
@@ -75,16 +73,55 @@ class GCodeGenerator(QWidget):
 
         main_layout.addLayout(serial_layout)
 
+        # 后台任务: 进度、暂停/继续、取消与机器位置
+        job_layout = QHBoxLayout()
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setValue(0)
+        job_layout.addWidget(self.progress_bar)
+
+        self.btn_pause = QPushButton("Pause")
+        self.btn_pause.setEnabled(False)
+        self.btn_pause.clicked.connect(self.toggle_pause)
+        job_layout.addWidget(self.btn_pause)
+
+        self.btn_cancel = QPushButton("Cancel")
+        self.btn_cancel.setEnabled(False)
+        self.btn_cancel.clicked.connect(self.cancel_upload)
+        job_layout.addWidget(self.btn_cancel)
+
+        self.status_label = QLabel("Idle")
+        self.status_label.setMinimumWidth(260)
+        job_layout.addWidget(self.status_label)
+
+        main_layout.addLayout(job_layout)
+
         # text editor
         self.text_widget = QTextEdit()
         self.text_widget.setFontFamily("Microsoft YaHei")
         self.text_widget.setFontPointSize(14)
+        self.text_widget.textChanged.connect(self._text_changed)
         main_layout.addWidget(self.text_widget)
 
+        # 预览窗口打开时, 停止输入一会儿就自动刷新预览
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.setSingleShot(True)
+        self.refresh_timer.setInterval(300)
+        self.refresh_timer.timeout.connect(self._refresh_preview)
+
         
 
 
         self.setLayout(main_layout)
+        self.gen_thread = None
+        self.upload_thread = None
+        self.line_cache = None  # 按行缓存的 G-code 片段, 第一次生成时创建
+        self.uploaded_lines = None  # 总行数未知时已确认的行数
+
+    def _line_cache(self):
+        if self.line_cache is None:
+            from line_cache import LineCache
+            self.line_cache = LineCache()
+        return self.line_cache
 
     def load_text_file(self):
         file_path, _ = QFileDialog.getOpenFileName(
@@ -103,6 +140,7 @@ class GCodeGenerator(QWidget):
                 text_content = f.read()
             self.text_widget.setPlainText(text_content)
         elif file_path.endswith(".docx"):
+            # from docx import Document
             # doc = Document(file_path)
             # text_content = "\n".join([para.text for para in doc.paragraphs])
             import mammoth
@@ -116,22 +154,64 @@ class GCodeGenerator(QWidget):
     def change_font(self, font_name):
         selected_font = font_name or self.font_box.currentText()
         self.text_widget.setFontFamily(selected_font)
+        self._text_changed()
+
+    def _text_changed(self):
+        if self.preview_window is not None and self.preview_window.isVisible():
+            self.refresh_timer.start()
+
+    def _refresh_preview(self):
+        if self.preview_window is not None and self.preview_window.isVisible():
+            self.generate_gode(lambda _, text_path: self.preview_window.draw_path(text_path, fit=False),
+                               quiet=True)
 
-    def generate_gode(self):
+    def generate_gode(self, on_done, quiet=False):
+        """
+        在后台线程生成 G-code, 完成后在 GUI 线程调用 on_done(gcode, text_path)
+
+        只有改动过的行重新生成, 其余行用 line_cache 中的片段; quiet=True 时 (自动刷新预览) 不弹警告
+        """
         text = self.text_widget.toPlainText().rstrip()
         if not text:
-            QMessageBox.warning(self, "Warning", "Text area is empty!")
+            if not quiet:
+                QMessageBox.warning(self, "Warning", "Text area is empty!")
+            return
+        if self.gen_thread is not None and self.gen_thread.isRunning():
+            if quiet:
+                self.refresh_timer.start()  # 上一次还没生成完, 稍后再试
+            return
+        if self._uploading():
+            # 上传线程正在从 line_cache 边生成边发送, 不再同时生成; 自动刷新等上传结束后补上
+            if not quiet:
+                QMessageBox.warning(self, "Warning", "An upload is running, try again when it finishes.")
             return
 
         font_name = self.font_box.currentText()
-        font_file = get_font_support().get(font_name)
-
-        gcode, text_path = text_to_gcode(text, font_name=font_file)
-        return gcode, text_path
+        font_file, face_index = resolve_font(font_name)
+
+        self.status_label.setText("Generating G-code...")
+        self.progress_bar.setRange(0, 0)  # 生成期间显示忙碌动画
+        self.gen_thread = FunctionThread(self._line_cache().generate, text, font_name=font_file,
+                                         face_index=face_index, parent=self)
+        self.gen_thread.succeeded.connect(lambda result: self._generation_done(result, on_done))
+        self.gen_thread.failed.connect(self._generation_failed)
+        self.gen_thread.start()
+
+    def _generation_done(self, result, on_done):
+        self.progress_bar.setRange(0, 100)
+        self.status_label.setText("Idle")
+        gcode, text_path = result
+        on_done(gcode, text_path)
+
+    def _generation_failed(self, message):
+        self.progress_bar.setRange(0, 100)
+        self.status_label.setText("Idle")
+        QMessageBox.critical(self, "Error", f"Failed to generate G-code:\n{message}")
 
     def export_gcode(self):
-        gcode, _  = self.generate_gode()
+        self.generate_gode(self._save_gcode)
 
+    def _save_gcode(self, gcode, _):
         filename, _ = QFileDialog.getSaveFileName(
             self,
             "Save G-code File",
@@ -145,30 +225,112 @@ class GCodeGenerator(QWidget):
         QMessageBox.information(self, "Success", f"G-code saved to:\n{filename}")
 
     def preview_text(self):
-        _, text_path = self.generate_gode()
+        self.generate_gode(self._show_preview)
+
+    def _show_preview(self, _, text_path):
+        if self.preview_window is None:
+            from qt_show import PreviewWindow
+            self.preview_window = PreviewWindow()
         self.preview_window.draw_path(text_path)
         self.preview_window.show()
 
     def refresh_ports(self):
+        import serial.tools.list_ports
         self.port_box.clear()
         ports = [p.device for p in serial.tools.list_ports.comports()]
         if not ports:
             ports = ["No Ports Found"]
         self.port_box.addItems(ports)
 
+    def _uploading(self):
+        return self.upload_thread is not None and self.upload_thread.isRunning()
+
     def upload_to_grbl(self):
+        if self._uploading():
+            QMessageBox.warning(self, "Warning", "An upload is already running!")
+            return
+        if self.gen_thread is not None and self.gen_thread.isRunning():
+            QMessageBox.warning(self, "Warning", "G-code is still being generated, try again in a moment.")
+            return
+        text = self.text_widget.toPlainText().rstrip()
+        if not text:
+            QMessageBox.warning(self, "Warning", "Text area is empty!")
+            return
         port = self.port_box.currentText().strip()
         baudrate = int(self.baudrate_box.currentText().strip())
-        gcode, _  = self.generate_gode()
-
-        if not gcode.strip():
-            QMessageBox.warning(self, "Warning", "G-code is empty!")
+        font_file, face_index = resolve_font(self.font_box.currentText())
+
+        cache = self._line_cache()
+        if cache.cached(text, font_name=font_file, face_index=face_index):
+            # 预览过的文字直接拼出整篇, 总行数已知, 可以显示百分比
+            gcode, _ = cache.generate(text, font_name=font_file, face_index=face_index)
+        else:
+            # 边生成边发送: 第一行文字生成完就开始上传; 总行数未知, 进度条保持忙碌, 状态栏显示已发送行数
+            gcode = cache.iter_gcode(text, font_name=font_file, face_index=face_index)
+        self.uploaded_lines = None
+        self.progress_bar.setRange(0, 0)
+        self.status_label.setText("Connecting...")
+        self.upload_thread = UploadThread(port, baudrate, gcode, parent=self)
+        self.upload_thread.progress.connect(self._upload_progress)
+        self.upload_thread.status.connect(self._upload_status)
+        self.upload_thread.succeeded.connect(self._upload_done)
+        self.upload_thread.failed.connect(self._upload_failed)
+        self.upload_thread.finished.connect(self._upload_finished)
+        self.btn_pause.setText("Pause")
+        self.btn_pause.setEnabled(True)
+        self.btn_cancel.setEnabled(True)
+        self.upload_thread.start()
+
+    def toggle_pause(self):
+        if self.upload_thread is None:
+            return
+        if self.upload_thread.job.paused:
+            self.upload_thread.resume()
+            self.btn_pause.setText("Pause")
+        else:
+            self.upload_thread.pause()
+            self.btn_pause.setText("Resume")
+
+    def cancel_upload(self):
+        if self.upload_thread is not None:
+            self.upload_thread.cancel()
+
+    def _upload_progress(self, done, total):
+        if total:
+            self.progress_bar.setRange(0, 100)
+            self.progress_bar.setValue(done * 100 // total)
+        else:
+            self.uploaded_lines = done
+
+    def _upload_status(self, status):
+        x, y, z = status.get("MPos", status.get("WPos", (0, 0, 0)))[:3]
+        text = f"{status['state']}  X{x:.3f} Y{y:.3f} Z{z:.3f}"
+        if self.uploaded_lines is not None:
+            text += f"  {self.uploaded_lines} lines"
+        self.status_label.setText(text)
+
+    def _upload_done(self, stats):
+        if stats["cancelled"]:
+            message = f"Upload cancelled after {stats['lines']} lines."
+            if not stats["pen_up"]:
+                message += "\nThe controller did not come back after the reset, the pen may still be down."
+            QMessageBox.information(self, "Cancelled", message)
             return
-        try:
-            upload_gcode_to_grbl(port, baudrate, gcode, is_file=False)
-            QMessageBox.information(self, "Success", "G-code uploaded successfully.")
-        except Exception as e:
-            QMessageBox.critical(self, "Error", f"Failed to upload G-code:\n{e}")
+        self.progress_bar.setRange(0, 100)
+        self.progress_bar.setValue(100)
+        QMessageBox.information(
+            self, "Success",
+            f"G-code uploaded successfully.\n{stats['lines']} lines, {stats['lines_per_sec']:.0f} lines/s")
+
+    def _upload_failed(self, message):
+        QMessageBox.critical(self, "Error", f"Failed to upload G-code:\n{message}")
+
+    def _upload_finished(self):
+        self.progress_bar.setRange(0, 100)
+        self.btn_pause.setEnabled(False)
+        self.btn_cancel.setEnabled(False)
+        self.status_label.setText("Idle")
+        self._text_changed()  # 上传期间跳过的预览刷新
 
 def main():
     app = QApplication(sys.argv)
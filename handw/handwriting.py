@@ -0,0 +1,336 @@
+"""
+手写体: 用 UNIPEN 真实笔迹 (见 unipen 模块) 排版文字
+
+UNIPEN 样本每个都平移到重心、缩放到单位方差, 不带大小和基线信息。编译时按字符类别
+(大写、x 高度小写、升部、降部、标点……) 把每个样本缩放、平移到 em 单位下的字框里,
+左边缘对齐 x=0、基线在 y=0, 结果写成一个按字符索引的变体库; 排版时只做查表、抽样和平移,
+整行一次拼接, 不逐点处理。
+
+文件布局 (小端, 各段按 8 字节对齐):
+    header    HEADER_DTYPE, 1 条
+    index     INDEX_DTYPE, 每个字符一条, 按码位升序: 变体起点、个数、前进宽度
+    variants  VARIANT_DTYPE, 每个变体: 点的起点与点数、宽度、风格特征 (倾斜, 宽度) 的标准分
+    points    float32 (n, 2), em 单位
+
+变体选择:
+    style=None      在全部变体中随机挑选
+    style=(s, w)    在风格特征最接近 (s, w) 的 NEAREST 个变体中随机挑选;
+                    s 为倾斜、w 为宽窄, 都是该字符所有变体中的标准分, (0, 0) 即最常见的写法
+随机数由行文字和 seed 决定, 同一行每次排出的结果相同 (预览、行缓存与导出一致)。
+"""
+import hashlib
+import mmap
+import os
+from functools import lru_cache
+
+import numpy as np
+
+import emit
+import unipen
+
+MAGIC = b"HWHAND01"
+VERSION = 1
+HEADER_DTYPE = np.dtype([("magic", "S8"), ("version", "<u4"), ("n_labels", "<u4"), ("n_variants", "<u4"),
+                         ("n_points", "<u4")])
+INDEX_DTYPE = np.dtype([("codepoint", "<u4"), ("first", "<u4"), ("count", "<u4"), ("advance", "<f4")])
+VARIANT_DTYPE = np.dtype([("start", "<u4"), ("count", "<u4"), ("width", "<f4"), ("style", "<f4", (2,))])
+
+MAX_VARIANTS = 1000
+NEAREST = 8
+DEFAULT_STYLE = (0., 0.)
+# 字间距、空格和库里没有的字符的前进宽度 (em)
+LETTER_SPACING = 0.1
+SPACE_ADVANCE = 0.35
+MISSING_ADVANCE = 0.5
+
+# 字框 (下沿, 上沿, 最大宽度), em 单位, 基线 y=0; 样本等比缩放到放得进字框, 在字框内竖直居中
+CAP_HEIGHT, X_HEIGHT, ASCENDER, DESCENDER = 0.7, 0.45, 0.72, -0.22
+_DEFAULT_BOX = (0., CAP_HEIGHT, 0.9)
+_BOXES = {}
+for _chars, _box in (
+        ("acemnorsuvwxz", (0., X_HEIGHT, 0.9)),
+        ("bdhkl", (0., ASCENDER, 0.9)),
+        ("f", (DESCENDER / 2, ASCENDER, 0.6)),
+        ("t", (0., 0.6, 0.6)),
+        ("i", (0., 0.66, 0.3)),
+        ("gpqy", (DESCENDER, X_HEIGHT, 0.9)),
+        ("j", (DESCENDER, 0.66, 0.45)),
+        (".", (0., 0.07, 0.1)),
+        (",", (-0.12, 0.08, 0.12)),
+        (":", (0., 0.42, 0.12)),
+        (";", (-0.12, 0.42, 0.15)),
+        ("'`", (0.5, ASCENDER, 0.12)),
+        ('"', (0.5, ASCENDER, 0.25)),
+        ("()[]{}|", (-0.15, 0.78, 0.3)),
+        ("/\\", (-0.1, ASCENDER, 0.5)),
+        ("_", (-0.12, -0.05, 0.5)),
+        ("-", (0.2, 0.3, 0.35)),
+        ("~", (0.22, 0.4, 0.5)),
+        ("=+<>", (0.1, 0.5, 0.45)),
+        ("*^", (0.4, ASCENDER, 0.35)),
+):
+    for _char in _chars:
+        _BOXES[_char] = _box
+
+
+def label_box(char):
+    """字符的字框 (下沿, 上沿, 最大宽度), em 单位"""
+    return _BOXES.get(char, _DEFAULT_BOX)
+
+
+def _aligned(n):
+    return (n + 7) & ~7
+
+
+def default_path(folder=unipen.DEFAULT_FOLDER):
+    """变体库与样本库缓存放在一起: statis -> statis.hand"""
+    return os.path.normpath(folder) + ".hand"
+
+
+def is_handwriting(font_name):
+    return isinstance(font_name, str) and font_name.lower().endswith(".hand")
+
+
+def normalize(samples, char):
+    """
+    一个字符的一批样本缩放、平移到字框
+
+    参数:
+        samples (list[np.ndarray]): 每个为 (k, 2) 的轨迹, k >= 1
+
+    返回:
+        points (np.ndarray): 首尾相接的 (n, 2) float32, em 单位, 左边缘 x=0, 基线 y=0
+        counts, widths (np.ndarray): 每个样本的点数与宽度
+    """
+    bottom, top, max_width = label_box(char)
+    counts = np.array([len(s) for s in samples])
+    points = np.concatenate(samples).astype(float)
+    first = np.r_[0, np.cumsum(counts)[:-1]]
+    low = np.minimum.reduceat(points, first)
+    size = np.maximum.reduceat(points, first) - low
+    scale = np.minimum((top - bottom) / np.maximum(size[:, 1], 1e-9), max_width / np.maximum(size[:, 0], 1e-9))
+    offset = np.column_stack([np.zeros(len(counts)), (bottom + top - size[:, 1] * scale) / 2])
+    owner = np.repeat(np.arange(len(counts)), counts)
+    points = (points - low[owner]) * scale[owner, None] + offset[owner]
+    return points.astype(np.float32), counts, (size[:, 0] * scale).astype(np.float32)
+
+
+def _style_features(points, counts, widths):
+    # 倾斜: x 对 y 的回归斜率; 宽窄: 宽度相对该字符的中位数; 都换成稳健的标准分
+    first = np.r_[0, np.cumsum(counts)[:-1]]
+    owner = np.repeat(np.arange(len(counts)), counts)
+    mean = np.add.reduceat(points.astype(float), first) / counts[:, None]
+    d = points - mean[owner]
+    var_y = np.add.reduceat(d[:, 1] ** 2, first)
+    slant = np.add.reduceat(d[:, 0] * d[:, 1], first) / np.maximum(var_y, 1e-12)
+    features = np.column_stack([slant, widths / max(float(np.median(widths)), 1e-9)])
+    center = np.median(features, axis=0)
+    spread = np.median(np.abs(features - center), axis=0) * 1.4826
+    return ((features - center) / np.where(spread > 1e-9, spread, 1.)).astype(np.float32)
+
+
+def compile_handwriting(library=None, path=None, max_variants=MAX_VARIANTS, seed=0):
+    """
+    由样本库编译变体库
+
+    参数:
+        library (unipen.UnipenLibrary): 省略时 unipen.load()
+        path (str): 输出文件, 省略时见 default_path
+        max_variants (int): 每个字符最多保留的变体数, 超出时随机抽取
+
+    返回:
+        str: 变体库文件路径
+    """
+    library = library or unipen.load()
+    path = path or os.path.splitext(library.path)[0] + ".hand"
+    rng = np.random.default_rng(seed)
+    index, variants, points = [], [], []
+    n_points = 0
+    for label in sorted((c for c in library.labels if len(c) == 1 and not c.isspace()), key=ord):
+        samples = library.samples[library.by_label(label)]
+        # 按文件和按标签的样本文件里是同一批笔迹, 共用同一段点的只取一次
+        _, unique = np.unique(samples["start"], return_index=True)
+        samples = samples[np.sort(unique)]
+        samples = samples[samples["count"] > 0]
+        if not len(samples):
+            continue
+        if len(samples) > max_variants:
+            samples = samples[np.sort(rng.choice(len(samples), max_variants, replace=False))]
+        trajectories = [library.points[s:s + c] for s, c in zip(samples["start"].tolist(),
+                                                                samples["count"].tolist())]
+        label_points, counts, widths = normalize(trajectories, label)
+        table = np.zeros(len(counts), dtype=VARIANT_DTYPE)
+        table["start"] = n_points + np.r_[0, np.cumsum(counts)[:-1]]
+        table["count"] = counts
+        table["width"] = widths
+        table["style"] = _style_features(label_points, counts, widths)
+        index.append((ord(label), sum(len(v) for v in variants), len(table),
+                      float(np.median(widths)) + LETTER_SPACING))
+        variants.append(table)
+        points.append(label_points)
+        n_points += len(label_points)
+
+    index = np.array(index, dtype=INDEX_DTYPE)
+    variants = np.concatenate(variants) if variants else np.zeros(0, dtype=VARIANT_DTYPE)
+    points = np.concatenate(points) if points else np.empty((0, 2), dtype=np.float32)
+    header = np.zeros(1, dtype=HEADER_DTYPE)
+    header[0] = (MAGIC, VERSION, len(index), len(variants), len(points))
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        for section in (header, index, variants, points.astype("<f4")):
+            data = section.tobytes()
+            f.write(data)
+            f.write(b"\0" * (_aligned(len(data)) - len(data)))
+    # 先写临时文件再替换, 正在读取旧变体库的进程不受影响
+    os.replace(tmp, path)
+    return path
+
+
+class Handwriting:
+    """
+    只读打开变体库
+
+    用法:
+        hand = Handwriting("statis.hand")
+        vertices, codes = hand.layout(line, size=8, style=(1., 0.))
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        header = np.frombuffer(self._mm, dtype=HEADER_DTYPE, count=1)[0]
+        if header["magic"] != MAGIC or header["version"] != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} handwriting library")
+        n_labels, n_variants, n_points = (int(header[k]) for k in ("n_labels", "n_variants", "n_points"))
+        offset = _aligned(HEADER_DTYPE.itemsize)
+        self.index = np.frombuffer(self._mm, dtype=INDEX_DTYPE, count=n_labels, offset=offset)
+        offset += _aligned(self.index.nbytes)
+        self.variants = np.frombuffer(self._mm, dtype=VARIANT_DTYPE, count=n_variants, offset=offset)
+        offset += _aligned(self.variants.nbytes)
+        self.points = np.frombuffer(self._mm, dtype="<f4", count=2 * n_points, offset=offset).reshape(-1, 2)
+        # 码位 -> 行号; 行号 len(index) 表示库里没有的字符
+        self._rows = {chr(cp): i for i, cp in enumerate(self.index["codepoint"].tolist())}
+        self._advance = np.r_[self.index["advance"], MISSING_ADVANCE].astype(float)
+        self._first = np.r_[self.index["first"], 0].astype(np.int64)
+        self._count = np.r_[self.index["count"], 0].astype(np.int64)
+        self._candidates = {}
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, char):
+        return char in self._rows
+
+    def _row_of(self, line):
+        missing = len(self.index)
+        return np.fromiter((self._rows.get(c, missing) for c in line), dtype=np.intp, count=len(line))
+
+    def advances(self, line):
+        """每个字符的前进宽度 (em); 只取决于字符, 与挑中的变体无关, 排版换行与绘制一致"""
+        advances = self._advance[self._row_of(line)]
+        advances[np.fromiter((c.isspace() for c in line), dtype=bool, count=len(line))] = SPACE_ADVANCE
+        return advances
+
+    def candidates(self, style):
+        """
+        每个字符风格最接近 style 的变体 (相对字符第一个变体的序号)
+
+        返回:
+            np.ndarray: (len(index) + 1, NEAREST), 变体不足 NEAREST 个时循环填满
+        """
+        key = tuple(float(s) for s in style)
+        table = self._candidates.get(key)
+        if table is None:
+            table = np.zeros((len(self.index) + 1, NEAREST), dtype=np.int64)
+            for row, (first, count) in enumerate(zip(self._first[:-1].tolist(), self._count[:-1].tolist())):
+                distance = np.square(self.variants["style"][first:first + count] - key).sum(axis=1)
+                order = np.argsort(distance, kind="stable")[:NEAREST]
+                table[row] = np.resize(order, NEAREST)
+            self._candidates[key] = table
+        return table
+
+    def choose(self, line, style=DEFAULT_STYLE, seed=0):
+        """
+        为一行的每个字符挑选变体
+
+        返回:
+            np.ndarray: 变体号, 库里没有的字符为 -1
+        """
+        rows = self._row_of(line)
+        digest = hashlib.blake2b(f"{seed}\0{line}".encode("utf-8"), digest_size=8).digest()
+        rng = np.random.default_rng(int.from_bytes(digest, "little"))
+        count = self._count[rows]
+        if style is None:
+            pick = (rng.random(len(rows)) * count).astype(np.int64)
+        else:
+            pick = self.candidates(style)[rows, rng.integers(0, NEAREST, len(rows))]
+        return np.where(count > 0, self._first[rows] + pick, -1)
+
+    def layout(self, line, size, x=0., y=0., style=DEFAULT_STYLE, seed=0):
+        """
+        排版单行: 每个变体居中放在该字符的前进宽度里
+
+        返回:
+            vertices (np.ndarray), codes (np.ndarray): 只含 MOVETO/LINETO
+        """
+        advances = self.advances(line)
+        chosen = self.choose(line, style, seed)
+        drawn = np.flatnonzero(chosen >= 0)
+        if not len(drawn):
+            return np.empty((0, 2)), np.empty(0, dtype=np.uint8)
+        variants = self.variants[chosen[drawn]]
+        counts = variants["count"].astype(np.int64)
+        starts = variants["start"].astype(np.int64)
+        # 所有被选中变体的点一次取出
+        heads = np.r_[0, np.cumsum(counts)[:-1]]
+        take = np.repeat(starts - heads, counts) + np.arange(counts.sum())
+        pen_x = x + (np.r_[0., np.cumsum(advances)[:-1]][drawn] + (advances[drawn] - variants["width"]) / 2) * size
+        vertices = self.points[take].astype(float) * size
+        vertices += np.repeat(np.column_stack([pen_x, np.full(len(drawn), float(y))]), counts, axis=0)
+        codes = np.full(len(vertices), emit.LINETO, dtype=np.uint8)
+        codes[heads] = emit.MOVETO
+        return vertices, codes
+
+    def close(self):
+        # 仍有视图引用映射时不能关闭, 交给垃圾回收
+        try:
+            self._mm.close()
+        except BufferError:
+            pass
+
+
+def load(folder=unipen.DEFAULT_FOLDER, path=None):
+    """打开变体库; 不存在或比样本库缓存旧时重新编译"""
+    library = unipen.load(folder)
+    path = path or default_path(folder)
+    if not os.path.exists(path) or os.path.getmtime(path) < os.path.getmtime(library.path):
+        compile_handwriting(library, path)
+    return Handwriting(path)
+
+
+@lru_cache(maxsize=8)
+def open_handwriting(font_name):
+    # .hand 文件直接打开, 其他字体名 (handwriting 模式下) 使用默认变体库
+    if is_handwriting(font_name):
+        return Handwriting(font_name)
+    return load()
+
+
+def line_advances(line, font_name, size, face_index=0, cache=None):
+    """单行中每个字符的前进宽度, 参数与 layout_line 相同"""
+    return open_handwriting(font_name).advances(line) * size
+
+
+def layout_line(line, font_name, size, x=0., y=0., face_index=0, cache=None, style=DEFAULT_STYLE, seed=0):
+    """
+    用手写变体排版单行, 参数与 glyph_cache.layout_line 相同 (face_index/cache 不使用)
+
+    参数:
+        font_name (str): .hand 变体库; 其他名字使用默认变体库 (见 load)
+        style, seed: 见模块说明
+
+    返回:
+        vertices (np.ndarray), codes (np.ndarray): 只含 MOVETO/LINETO, 每个字符一笔
+    """
+    return open_handwriting(font_name).layout(line, size, x, y, style, seed)
@@ -0,0 +1,176 @@
+"""
+页面排版: 纸张尺寸、页边距、自动换行 (含中日韩文字) 与分页
+
+坐标以页面左下角为原点, x 向右, y 向上, 单位 mm; 每行给出基线起点, 交给各字体后端的
+layout_line 排成路径。这里只决定每行放哪些字、放在哪里, 不依赖具体字体:
+字宽由调用方提供的 measure(text) -> 每个字符的前进宽度 给出。
+
+换行规则:
+    - 空白之后可以断行, 行尾空白不计宽度、不绘制;
+    - 中日韩文字 (汉字、假名、谚文、全角符号) 前后都可以断行;
+    - 避头尾: 句号、逗号、右括号等不出现在行首, 左括号、左引号等不出现在行尾;
+    - 单个词比整行还宽时按字符强制断开。
+文本中的 "\\n" 分段, "\\f" 强制分页。
+"""
+from collections import namedtuple
+
+import numpy as np
+
+PAGE_SIZES = {
+    "A3": (297., 420.),
+    "A4": (210., 297.),
+    "A5": (148., 210.),
+    "B5": (176., 250.),
+    "Letter": (215.9, 279.4),
+}
+
+# 行首禁则 / 行尾禁则
+NO_START = set("、。，．,.:;：；？！?!)]}）］｝〕〉》」』】〙〗〟’”»ゝゞ々ーぁぃぅぇぉっゃゅょゎァィゥェォッャュョヮヵヶ…‥%％")
+NO_END = set("([{（［｛〔〈《「『【〘〖〝‘“«$￥")
+
+# 视为中日韩 (可在任意两字之间断行) 的码位区间, [起, 止)
+_WIDE_RANGES = np.array([
+    (0x1100, 0x1200),    # 谚文字母
+    (0x2e80, 0xa000),    # 部首、标点、假名、注音、CJK 统一汉字
+    (0xa960, 0xa980),
+    (0xac00, 0xd7b0),    # 谚文音节
+    (0xf900, 0xfb00),    # 兼容汉字
+    (0xfe30, 0xfe50),    # 竖排/兼容标点
+    (0xff00, 0xff61),    # 全角 ASCII 与标点
+    (0xffe0, 0xffe7),
+    (0x20000, 0x40000),  # 扩展 B 以后
+]).ravel()
+
+Page = namedtuple("Page", ["number", "size", "lines"])  # lines: ((text, x, y), ...) 基线起点
+
+
+def page_size(size):
+    """纸张名称 ("A4", "a4-landscape") 或 (宽, 高) -> (宽, 高) mm"""
+    if not isinstance(size, str):
+        width, height = size
+        return float(width), float(height)
+    name, _, orient = size.partition("-")
+    for key, dims in PAGE_SIZES.items():
+        if key.lower() == name.lower():
+            return dims[::-1] if orient.lower() == "landscape" else dims
+    raise ValueError(f"Unknown page size {size!r}, expected one of {list(PAGE_SIZES)} or (width, height)")
+
+
+def _margins(margins):
+    # 一个数或 (上, 右, 下, 左), 与 CSS 的顺序相同
+    if np.isscalar(margins):
+        return (float(margins),) * 4
+    top, right, bottom, left = margins
+    return float(top), float(right), float(bottom), float(left)
+
+
+def _codepoints(text):
+    return np.frombuffer(text.encode("utf-32-le"), dtype="<u4")
+
+
+def is_wide(text):
+    """每个字符是否为中日韩文字"""
+    return np.searchsorted(_WIDE_RANGES, _codepoints(text), side="right") % 2 == 1
+
+
+def break_opportunities(text):
+    """
+    返回:
+        np.ndarray: 长度 len(text) + 1, 第 i 项表示能否在第 i 个字符之前断行 (末尾总是可以)
+    """
+    n = len(text)
+    allow = np.zeros(n + 1, dtype=bool)
+    allow[n] = True
+    if n < 2:
+        return allow
+    chars = np.array(list(text))
+    space = np.char.isspace(chars)
+    wide = is_wide(text)
+    no_start = np.fromiter((c in NO_START for c in text), dtype=bool, count=n)
+    no_end = np.fromiter((c in NO_END for c in text), dtype=bool, count=n)
+    prev, cur = slice(0, -1), slice(1, None)
+    hyphen = (chars[prev] == "-") & np.char.isalnum(chars[cur])
+    ok = (space[prev] | wide[prev] | wide[cur] | hyphen) & ~space[cur]
+    ok &= ~no_start[cur] & ~no_end[prev]
+    allow[1:n] = ok
+    return allow
+
+
+def wrap(text, advances, width):
+    """
+    贪心换行: 每行放入尽量多的字, 在最后一个放得下的断行点断开
+
+    参数:
+        text (str): 一段文字 (不含换行)
+        advances (np.ndarray): 每个字符的前进宽度
+        width (float): 行宽
+
+    返回:
+        list[(start, end)]: 每行在 text 中的下标范围, end 已去掉行尾空白; 空段落为一个空行
+    """
+    n = len(text)
+    if not n:
+        return [(0, 0)]
+    cum = np.zeros(n + 1)
+    np.cumsum(advances, out=cum[1:])
+    space = np.char.isspace(np.array(list(text)))
+    # trim[b]: 在 b 处断行时去掉行尾空白后的行末
+    trim = np.zeros(n + 1, dtype=np.intp)
+    trim[1:] = np.maximum.accumulate(np.where(space, 0, np.arange(1, n + 1)))
+    cand = np.flatnonzero(break_opportunities(text))
+    # 行首固定时, 在各断行点断开的行宽随断行点单调不减, 可以二分查找
+    reach = cum[trim[cand]]
+    eps = 1e-9
+
+    lines = []
+    start = 0
+    while start < n:
+        limit = cum[start] + width + eps
+        k = int(np.searchsorted(reach, limit, side="right")) - 1
+        end = int(cand[k]) if k >= 0 else 0
+        if end > start and trim[end] > start:
+            lines.append((start, int(trim[end])))
+        else:
+            # 没有放得下的断行点: 按字符断开, 每行至少一个字
+            end = max(start + 1, int(np.searchsorted(cum, limit, side="right")) - 1)
+            lines.append((start, end))
+        start = end
+        while start < n and space[start]:
+            start += 1
+    return lines
+
+
+def paginate(text, measure, font_size=20., size="A4", margins=20., line_spacing=1.2):
+    """
+    排版整篇文字
+
+    参数:
+        measure (callable): measure(str) -> 每个字符的前进宽度 (np.ndarray), 与字体后端的排版一致
+        font_size (float): 字号 (mm, 即 em 大小)
+        size: 纸张, 见 page_size
+        margins: 页边距 (mm), 一个数或 (上, 右, 下, 左)
+        line_spacing (float): 行距, 字号的倍数
+
+    返回:
+        list[Page]: 第一行基线在上边距之下一个字号处, 之后每行下移 font_size * line_spacing
+    """
+    page_w, page_h = page_size(size)
+    top, right, bottom, left = _margins(margins)
+    width = page_w - left - right
+    pitch = font_size * line_spacing
+    first = page_h - top - font_size
+    per_page = int(np.floor((first - bottom) / pitch + 1e-9)) + 1
+    if width <= 0 or first < bottom:
+        raise ValueError(f"Margins {margins} leave no room for {font_size} mm text on a {page_w}x{page_h} page")
+
+    pages = []
+    for section in text.split("\f"):
+        rows = []
+        for paragraph in section.split("\n"):
+            advances = measure(paragraph) if paragraph else np.empty(0)
+            rows.extend(paragraph[s:e] for s, e in wrap(paragraph, advances, width))
+        for i in range(0, max(len(rows), 1), per_page):
+            chunk = rows[i:i + per_page]
+            lines = tuple((row, left, first - k * pitch) for k, row in enumerate(chunk))
+            pages.append(Page(len(pages) + 1, (page_w, page_h), lines))
+    return pages
@@ -0,0 +1,117 @@
+"""
+按行缓存的刀路片段, 编辑器中改一个字只重新生成改动的那一行
+
+每行文字由 control.line_toolpath 在原点处排版并生成刀路 (toolpath, 含展开曲线、简化和笔画重排),
+键为行文字和所有影响刀路的参数; 组装整篇时用 toolpath.translate 平移到该行的位置, 再交给
+emit.iter_toolpaths 输出。生成方式与 control.text_to_gcode_iter 完全相同, 输出逐字节一致。
+同一行在同一位置、同样的起始状态下输出过的 G-code 也留着, 行没有移动时直接复用。
+"""
+import threading
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+from matplotlib.path import Path
+
+import control
+import emit
+import toolpath
+
+Fragment = namedtuple("Fragment", ["vertices", "codes", "tp", "bodies"])
+
+
+class LineCache:
+    """
+    行片段缓存
+
+    参数:
+        maxsize (int): 最多保留的行数, 超出按最近最少使用淘汰
+
+    用法:
+        cache = LineCache()
+        gcode, text_path = cache.generate(text, font_name=font_file)   # 与 text_to_gcode 的返回值相同
+    """
+
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        # 预览线程和上传线程可能同时使用: 缓存字典和每个片段输出过的 G-code (bodies) 都在锁内读写
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+    def fragment(self, line, font_size=20, font_name="DejaVu Sans", feedrate=1000, tolerance=0.05, arcs=False,
+                 optimize=False, mode="outline", face_index=0, simplify=0.):
+        """单行在原点 (0, 0) 处的路径与刀路, 见 control.line_toolpath"""
+        key = (line, font_size, font_name, feedrate, tolerance, arcs, optimize, mode, face_index, simplify)
+        with self._lock:
+            fragment = self._entries.get(key)
+            if fragment is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return fragment
+            self.misses += 1
+
+        fragment = Fragment(*control.line_toolpath(line, font_size, font_name, feedrate, tolerance, arcs, optimize,
+                                                   mode, face_index, simplify), {})
+        with self._lock:
+            self._entries[key] = fragment
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return fragment
+
+    def cached(self, text, font_size=20, font_name="DejaVu Sans", feedrate=1000, tolerance=0.05, arcs=False,
+               optimize=False, mode="outline", face_index=0, simplify=0.):
+        """text 的每一行是否都已在缓存中 (此时 generate 很快)"""
+        options = (font_size, font_name, feedrate, tolerance, arcs, optimize, mode, face_index, simplify)
+        with self._lock:
+            return all((line,) + options in self._entries for line in text.split("\n"))
+
+    def _fragments(self, text, font_size, *options):
+        # 每行的基线 y 与片段
+        for i, line in enumerate(text.split("\n")):
+            yield -i * font_size * control.LINE_SPACING, self.fragment(line, font_size, *options)
+
+    def _emit_part(self, part, z_safe, z_draw, chunk, state):
+        # emit.iter_toolpaths 的一步: 该行在 y 处、从 state 接着输出的 G-code, 只留最近一次
+        fragment, y = part
+        key = (y, z_safe, z_draw, chunk, state)
+        with self._lock:
+            emitted = fragment.bodies.get(key)
+        if emitted is None:
+            emitted = emit.emit_part(toolpath.translate(fragment.tp, 0., y), z_safe, z_draw, chunk, state)
+            with self._lock:
+                fragment.bodies.clear()
+                fragment.bodies[key] = emitted
+        return emitted
+
+    def iter_gcode(self, text, font_size=20, font_name="DejaVu Sans", feedrate=1000, z_safe=5, z_draw=-1,
+                   tolerance=0.05, arcs=False, optimize=False, mode="outline", face_index=0, simplify=0.):
+        """逐段产出 G-code, 参数与输出同 control.text_to_gcode_iter"""
+        fragments = self._fragments(text, font_size, font_name, feedrate, tolerance, arcs, optimize, mode,
+                                    face_index, simplify)
+        parts = ((fragment, y) for y, fragment in fragments)
+        yield from emit.iter_toolpaths(parts, z_safe, z_draw, feedrate=feedrate, emitter=self._emit_part)
+
+    def generate(self, text, font_size=20, font_name="DejaVu Sans", feedrate=1000, z_safe=5, z_draw=-1,
+                 tolerance=0.05, arcs=False, optimize=False, mode="outline", face_index=0, simplify=0.):
+        """
+        整篇 G-code 和预览路径, 参数与返回值同 control.text_to_gcode
+
+        返回:
+            gcode (str), text_path (matplotlib.path.Path)
+        """
+        fragments = list(self._fragments(text, font_size, font_name, feedrate, tolerance, arcs, optimize, mode,
+                                         face_index, simplify))
+        parts = ((fragment, y) for y, fragment in fragments)
+        gcode = "\n".join(emit.iter_toolpaths(parts, z_safe, z_draw, feedrate=feedrate, emitter=self._emit_part))
+        vertices = [fragment.vertices + (0., y) for y, fragment in fragments]
+        codes = [fragment.codes for _, fragment in fragments]
+        return gcode, Path(np.concatenate(vertices), np.concatenate(codes))
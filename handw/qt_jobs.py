@@ -0,0 +1,74 @@
+from PyQt5.QtCore import QThread, pyqtSignal
+import grbl
+from control import upload_gcode_to_grbl
+
+
+class FunctionThread(QThread):
+    """在后台线程执行耗时函数 (如生成 G-code), 结果通过信号回到 GUI 线程"""
+    succeeded = pyqtSignal(object)
+    failed = pyqtSignal(str)
+
+    def __init__(self, func, *args, parent=None, **kwargs):
+        super().__init__(parent)
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+
+    def run(self):
+        try:
+            result = self.func(*self.args, **self.kwargs)
+        except Exception as e:
+            self.failed.emit(str(e))
+            return
+        self.succeeded.emit(result)
+
+
+class UploadThread(QThread):
+    """
+    在后台线程上传 G-code, 支持暂停/继续/取消, 并定期回报机器状态
+
+    信号:
+        progress(done, total): 已确认行数, 按百分比节流; gcode 为生成器时总行数未知, total 为 0
+        status(dict): ? 状态报告, 含 state 与 MPos
+        succeeded(dict): 上传统计
+        failed(str): 错误信息
+    """
+    progress = pyqtSignal(int, int)
+    status = pyqtSignal(dict)
+    succeeded = pyqtSignal(dict)
+    failed = pyqtSignal(str)
+
+    def __init__(self, port, baudrate, gcode, parent=None):
+        super().__init__(parent)
+        self.port = port
+        self.baudrate = baudrate
+        self.gcode = gcode
+        self.job = grbl.StreamJob()
+        self._last_percent = -1
+
+    def pause(self):
+        self.job.pause()
+
+    def resume(self):
+        self.job.resume()
+
+    def cancel(self):
+        # 只设置取消: 暂停中的 hold() 看到取消后直接退出, 不会先发 ~ 恢复运动
+        self.job.cancel()
+
+    def _progress(self, done, total):
+        # 每行都发信号会塞满事件队列, 只在百分比变化 (总数未知时每 100 行) 时通知
+        step = done * 100 // total if total else done // 100
+        if step != self._last_percent:
+            self._last_percent = step
+            self.progress.emit(done, total or 0)
+
+    def run(self):
+        try:
+            stats = upload_gcode_to_grbl(self.port, self.baudrate, self.gcode, is_file=False,
+                                         progress=self._progress, job=self.job,
+                                         on_status=self.status.emit)
+        except Exception as e:
+            self.failed.emit(str(e))
+            return
+        self.succeeded.emit(stats)
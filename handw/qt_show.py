@@ -1,34 +1,269 @@
-from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
-from matplotlib.figure import Figure
-from matplotlib.patches import PathPatch
-from PyQt5.QtWidgets import (
-    QApplication, QWidget, QVBoxLayout, QHBoxLayout,
-    QPushButton, QTextEdit, QComboBox, QFileDialog, QMessageBox
-)
+import hashlib
+import math
+
+import numpy as np
+from PyQt5.QtCore import Qt, QPointF, QRectF
+from PyQt5.QtGui import QColor, QPainter, QPainterPath, QPen, QPolygonF, QTransform
+from PyQt5.QtWidgets import QWidget, QVBoxLayout
+
+import curves
+import emit
+import toolpath
+
+TILE = 40.        # 分块边长 (mm), 按轮廓组的位置分块, 只绘制可见的块
+BASE_TOL = 0.02   # 第 0 级细节的抽稀容差 (mm)
+LEVELS = 8        # 每级容差是上一级的 4 倍
+CURVE_TOL = 0.05  # 预览时曲线展开的容差 (mm)
+
+
+def _polygon(points):
+    # 直接写入 QPolygonF 的内存, 不逐点构造 QPointF
+    poly = QPolygonF(len(points))
+    ptr = poly.data()
+    ptr.setsize(len(points) * 16)
+    np.frombuffer(ptr, dtype=np.float64).reshape(-1, 2)[:] = points
+    return poly
+
+
+def decimate(vertices, codes, tol):
+    """
+    按 tol 网格抽稀: 落在同一网格的相邻点只保留一个, 每笔的起点、终点和 CLOSEPOLY 总是保留
+    """
+    if tol <= 0 or len(codes) < 3:
+        return vertices, codes
+    q = np.floor(vertices / tol)
+    keep = np.ones(len(codes), dtype=bool)
+    keep[1:] = np.any(q[1:] != q[:-1], axis=1)
+    keep |= codes != emit.LINETO
+    keep[:-1] |= codes[1:] != emit.LINETO
+    keep[-1] = True
+    return vertices[keep], codes[keep]
+
+
+class _Tile:
+    # 一个分块: 展开后的顶点与各级细节的 QPainterPath (用到时才构建)
+    def __init__(self, vertices, codes):
+        self.vertices = vertices
+        self.codes = codes
+        lo = vertices.min(axis=0)
+        hi = vertices.max(axis=0)
+        # 外扩一点, 单点或水平/竖直的笔画也有非空的包围盒
+        self.rect = QRectF(lo[0], lo[1], hi[0] - lo[0], hi[1] - lo[1]).adjusted(-0.5, -0.5, 0.5, 0.5)
+        self.paths = {}
+
+    def path(self, level):
+        path = self.paths.get(level)
+        if path is None:
+            tol = BASE_TOL * 4 ** level if level else 0.
+            vertices, codes = decimate(self.vertices, self.codes, tol)
+            path = QPainterPath()
+            path.setFillRule(Qt.WindingFill)
+            heads = np.r_[np.flatnonzero(codes == emit.MOVETO), len(codes)]
+            for lo, hi in zip(heads[:-1].tolist(), heads[1:].tolist()):
+                drawn = codes[lo:hi] != emit.CLOSEPOLY
+                path.addPolygon(_polygon(vertices[lo:hi][drawn]))
+                if not drawn.all():
+                    path.closeSubpath()
+            self.paths[level] = path
+        return path
+
+
+def _outline_groups(vertices, heads):
+    # 连续且包围盒相交的笔画归为一组: 字形的外轮廓与其中的内孔总在同一组, 必须放进同一块填充
+    lo = np.minimum.reduceat(vertices, heads)
+    hi = np.maximum.reduceat(vertices, heads)
+    group = np.empty(len(heads), dtype=np.int64)
+    group_lo, group_hi = [], []
+    for i, (a, b) in enumerate(zip(lo.tolist(), hi.tolist())):
+        if group_lo and (a[0] <= group_hi[-1][0] and a[1] <= group_hi[-1][1]
+                         and b[0] >= group_lo[-1][0] and b[1] >= group_lo[-1][1]):
+            group_lo[-1] = [min(a[0], group_lo[-1][0]), min(a[1], group_lo[-1][1])]
+            group_hi[-1] = [max(b[0], group_hi[-1][0]), max(b[1], group_hi[-1][1])]
+        else:
+            group_lo.append(a)
+            group_hi.append(b)
+        group[i] = len(group_lo) - 1
+    return group, np.array(group_lo)
+
+
+def split_tiles(vertices, codes):
+    """
+    按轮廓组 (外轮廓连同其内孔) 包围盒左下角所在的 TILE 网格分块
+
+    返回:
+        dict: 内容哈希 -> (vertices, codes); 内容不变的块哈希不变, 重新预览时直接复用缓存的路径
+    """
+    strokes = np.cumsum(codes == emit.MOVETO) - 1
+    valid = strokes >= 0
+    vertices, codes, strokes = vertices[valid], codes[valid], strokes[valid]
+    if not len(codes):
+        return {}
+    heads = np.flatnonzero(codes == emit.MOVETO)
+    group_of_stroke, group_lo = _outline_groups(vertices, heads)
+    keys = np.floor(group_lo / TILE).astype(np.int64)
+    tile_of_group = np.unique(keys, axis=0, return_inverse=True)[1].ravel()
+    tile = tile_of_group[group_of_stroke][strokes]
+    order = np.argsort(tile, kind="stable")
+    bounds = np.r_[0, np.flatnonzero(np.diff(tile[order])) + 1, len(order)]
+    tiles = {}
+    for lo, hi in zip(bounds[:-1], bounds[1:]):
+        idx = order[lo:hi]
+        v, c = vertices[idx], codes[idx]
+        digest = hashlib.sha1(v.tobytes() + c.tobytes()).hexdigest()
+        tiles[digest] = (v, c)
+    return tiles
+
+
+class PathCanvas(QWidget):
+    """
+    用 QPainterPath 绘制路径预览, 支持滚轮缩放、拖动平移、双击复位
+
+    文档按 TILE 分块, 每块按缩放级别缓存抽稀后的 QPainterPath: 一个屏幕像素内的细节不画,
+    不可见的块跳过。平移/缩放只是换变换矩阵重绘缓存的路径; 重新预览时内容没变的块沿用旧缓存。
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.tiles = {}
+        self.fill = True
+        self.bounds = QRectF()
+        self.scale = 1.
+        self.offset = QPointF()
+        self._drag = None
+        self.setMinimumSize(200, 200)
+
+    def set_path(self, vertices, codes, fit=True):
+        """fit=False 时保持当前的缩放和平移 (编辑时自动刷新)"""
+        vertices = np.asarray(vertices, dtype=float).reshape(-1, 2)
+        codes = np.asarray(codes, dtype=np.uint8)
+        # 预览只需要折线, 曲线一次展开; 轮廓 (含 CLOSEPOLY) 填充, 单线笔画只描线
+        vertices, codes = curves.flatten(vertices, codes, CURVE_TOL)
+        self.fill = bool((codes == emit.CLOSEPOLY).any())
+        old = self.tiles
+        self.tiles = {}
+        for digest, (v, c) in split_tiles(vertices, codes).items():
+            self.tiles[digest] = old.get(digest) or _Tile(v, c)
+        if len(vertices):
+            lo = vertices.min(axis=0)
+            hi = vertices.max(axis=0)
+            self.bounds = QRectF(lo[0], lo[1], hi[0] - lo[0], hi[1] - lo[1])
+        else:
+            self.bounds = QRectF()
+        if fit:
+            self.fit()
+        else:
+            self.update()
+
+    def fit(self):
+        # 整个文档放进窗口, 四周留 10mm
+        rect = self.bounds.adjusted(-10, -10, 10, 10)
+        if rect.width() <= 0 or rect.height() <= 0:
+            self.scale, self.offset = 1., QPointF()
+        else:
+            self.scale = min(self.width() / rect.width(), self.height() / rect.height())
+            self.offset = QPointF(
+                (self.width() - rect.width() * self.scale) / 2 - rect.left() * self.scale,
+                (self.height() - rect.height() * self.scale) / 2 + rect.bottom() * self.scale)
+        self.update()
+
+    def transform(self):
+        # 世界坐标 (mm, y 向上) -> 屏幕像素 (y 向下)
+        return QTransform(self.scale, 0, 0, -self.scale, self.offset.x(), self.offset.y())
+
+    def level(self):
+        # 抽稀容差不超过半个像素
+        tol = 0.5 / self.scale
+        if tol < BASE_TOL * 4:
+            return 0
+        return min(LEVELS - 1, int(math.log(tol / BASE_TOL, 4)))
+
+    def visible_rect(self):
+        inverse, _ = self.transform().inverted()
+        return inverse.mapRect(QRectF(self.rect()))
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), Qt.white)
+        painter.setTransform(self.transform())
+        view = self.visible_rect()
+        self._draw_grid(painter, view)
+
+        pen = QPen(Qt.black)
+        pen.setCosmetic(True)  # 线宽按屏幕像素, 不随缩放变化
+        painter.setPen(pen)
+        painter.setBrush(Qt.black if self.fill else Qt.NoBrush)
+        level = self.level()
+        for tile in self.tiles.values():
+            if tile.rect.intersects(view):
+                painter.drawPath(tile.path(level))
+        painter.end()
+
+    def _draw_grid(self, painter, view):
+        # 10mm 网格, 太密时按 10 倍放宽
+        step = 10.
+        while step * self.scale < 8:
+            step *= 10
+        pen = QPen(QColor(225, 225, 225))
+        pen.setCosmetic(True)
+        painter.setPen(pen)
+        x = math.floor(view.left() / step) * step
+        while x <= view.right():
+            painter.drawLine(QPointF(x, view.top()), QPointF(x, view.bottom()))
+            x += step
+        y = math.floor(view.top() / step) * step
+        while y <= view.bottom():
+            painter.drawLine(QPointF(view.left(), y), QPointF(view.right(), y))
+            y += step
+
+    def wheelEvent(self, event):
+        factor = 1.25 ** (event.angleDelta().y() / 120)
+        pos = event.pos()
+        # 以光标为中心缩放
+        self.offset = QPointF(pos.x() - (pos.x() - self.offset.x()) * factor,
+                              pos.y() - (pos.y() - self.offset.y()) * factor)
+        self.scale *= factor
+        self.update()
+
+    def mousePressEvent(self, event):
+        if event.button() == Qt.LeftButton:
+            self._drag = event.pos()
+
+    def mouseMoveEvent(self, event):
+        if self._drag is not None:
+            delta = event.pos() - self._drag
+            self._drag = event.pos()
+            self.offset += QPointF(delta)
+            self.update()
+
+    def mouseReleaseEvent(self, event):
+        self._drag = None
+
+    def mouseDoubleClickEvent(self, event):
+        self.fit()
+
+
 class PreviewWindow(QWidget):
     def __init__(self, parent=None):
         super().__init__(parent)
         self.setWindowTitle("Text Path Preview (G-code will follow this path)")
         self.resize(600, 600)
 
-        self.figure = Figure()
-        self.canvas = FigureCanvas(self.figure)
+        self.canvas = PathCanvas()
 
         layout = QVBoxLayout()
         layout.addWidget(self.canvas)
         self.setLayout(layout)
 
-        # self.draw_path(text_path)
-
-    def draw_path(self, text_path):
-        self.figure.clf()
-        ax = self.figure.add_subplot(111)
-        patch = PathPatch(text_path, facecolor='black', edgecolor='black', lw=1)
-        ax.add_patch(patch)
+    def draw_path(self, text_path, fit=True):
+        """
+        text_path: 带 vertices/codes 的路径 (如 matplotlib Path), 或 toolpath 刀路;
+        fit=False 时保持当前视图
+        """
+        if toolpath.is_toolpath(text_path):
+            self.canvas.set_path(text_path["xy"], text_path["op"], fit)
+        else:
+            self.canvas.set_path(text_path.vertices, text_path.codes, fit)
 
-        ax.set_xlim(text_path.vertices[:, 0].min() - 10, text_path.vertices[:, 0].max() + 10)
-        ax.set_ylim(text_path.vertices[:, 1].min() - 10, text_path.vertices[:, 1].max() + 10)
-        ax.set_aspect('equal')
-        # ax.invert_yaxis()  # CNC 视角通常是向下为正
-        ax.grid(True)
-        self.canvas.draw()
\ No newline at end of file
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.canvas.fit()
@@ -0,0 +1,286 @@
+"""
+多台写字机的打印队列: 一个 asyncio 事件循环把文档/页面分发到多个串口, 各机器同时发送
+
+每台机器一个 worker 协程, 空闲时从队列中取一个自己没有失败过的任务; 串口收发仍用
+grbl.stream_gcode (字符计数流式发送), 在该机器专用的线程中执行, 不阻塞事件循环。
+任务在一台机器上失败 (串口断开、ALARM、长时间没有回复) 时放回队列, 交给其他机器重试,
+失败的机器重新连接后继续接任务, 连续失败 max_failures 次后停用。
+结束时汇总每台机器的任务数、行数、忙碌时间和利用率。
+
+用法:
+    machines = [Machine("left", "/dev/ttyUSB0"), Machine("right", "/dev/ttyUSB1")]
+    results, spooler = spool([("letter-1", gcode1), ("letter-2", gcode2)], machines)
+    print(format_report(results, spooler))
+
+没有写字机时可以用 fake_grbl.FakeGrbl 的 pty 端口代替 (wake_delay=0)。
+"""
+import asyncio
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import emit
+import grbl
+import toolpath
+
+
+class Machine:
+    """
+    一台写字机及其统计
+
+    参数:
+        name (str): 显示名称
+        port (str): 串口
+        wake_delay (float): 打开串口后等待 GRBL 复位的时间 (秒), 见 grbl.open_grbl
+        max_failures (int): 连续失败这么多次后停用
+    """
+
+    def __init__(self, name, port, baudrate=115200, wake_delay=2, streaming=True, max_failures=2):
+        self.name = name
+        self.port = port
+        self.baudrate = baudrate
+        self.wake_delay = wake_delay
+        self.streaming = streaming
+        self.max_failures = max_failures
+        self.state = "idle"  # idle / busy / offline
+        self.jobs = 0
+        self.lines = 0
+        self.failures = 0
+        self.busy = 0.
+        self._consecutive = 0
+        self._ser = None
+
+    def __repr__(self):
+        return f"Machine({self.name!r}, {self.port!r}, state={self.state!r})"
+
+    def _run(self, lines, progress, handle):
+        # 在机器的专用线程中执行: 按需连接, 出错时断开, 下一个任务重新连接
+        try:
+            if self._ser is None:
+                self._ser = grbl.open_grbl(self.port, self.baudrate, self.wake_delay)
+            send = grbl.stream_gcode if self.streaming else grbl.send_gcode
+            return send(self._ser, lines, progress=progress, job=handle)
+        except BaseException:
+            self._disconnect()
+            raise
+
+    def _disconnect(self):
+        if self._ser is not None:
+            try:
+                self._ser.close()
+            except Exception:
+                pass
+            self._ser = None
+
+
+class Job:
+    """一个打印任务: name 用于报告, gcode 为文本/行列表/文件路径 (is_file=True) 或 toolpath 刀路"""
+
+    def __init__(self, name, gcode, is_file=False):
+        self.name = name
+        self.gcode = gcode
+        self.is_file = is_file
+        self.failed_on = []  # 失败过的机器名
+        self.errors = []     # 每次失败的原因
+        self.result = None
+
+    def lines(self):
+        if toolpath.is_toolpath(self.gcode):
+            return grbl.read_gcode_lines(emit.iter_toolpath(self.gcode), is_file=False)
+        return grbl.read_gcode_lines(self.gcode, self.is_file)
+
+
+class StallError(RuntimeError):
+    pass
+
+
+class Spooler:
+    """
+    参数:
+        machines (list[Machine])
+        max_attempts (int): 每个任务最多尝试的次数 (每次换一台机器)
+        stall_timeout (float): 这么多秒没有收到任何回复视为机器失去响应
+        log (callable): 进度信息输出
+    """
+
+    def __init__(self, machines, max_attempts=3, stall_timeout=30., log=print):
+        if len({m.name for m in machines}) != len(machines):
+            raise ValueError("Machine names must be unique")
+        self.machines = list(machines)
+        self.max_attempts = max_attempts
+        self.stall_timeout = stall_timeout
+        self.log = log
+        self._jobs = []
+        self._pending = deque()
+        self._cond = None
+        self._closed = False
+        self._executor = None
+        self._unfinished = 0
+
+    def submit(self, name, gcode, is_file=False):
+        """加入一个任务; 可在 run 之前或运行中调用"""
+        job = Job(name, gcode, is_file)
+        self._jobs.append(job)
+        self._pending.append(job)
+        self._unfinished += 1
+        if self._cond is not None:
+            asyncio.get_running_loop().create_task(self._notify())
+        return job
+
+    def submit_pages(self, text, name="page", **options):
+        """整篇文字分页 (见 control.text_to_pages_gcode), 每页一个任务"""
+        import control
+
+        return [self.submit(f"{name}-{number:03d}", gcode)
+                for number, gcode in control.text_to_pages_gcode(text, **options)]
+
+    async def _notify(self):
+        async with self._cond:
+            self._cond.notify_all()
+
+    def _live(self):
+        return [m for m in self.machines if m.state != "offline"]
+
+    def _take(self, machine):
+        # 第一个这台机器没有失败过的任务; 其他在线机器都失败过的任务也可以再试
+        others = {m.name for m in self._live()} - {machine.name}
+        for job in self._pending:
+            if machine.name not in job.failed_on or others <= set(job.failed_on):
+                self._pending.remove(job)
+                return job
+        return None
+
+    def _give_up(self, job):
+        job.result = {"job": job.name, "machine": None, "attempts": len(job.failed_on), "stats": None,
+                      "error": "; ".join(job.errors) or "no machine available"}
+        self._unfinished -= 1
+        self.log(f"[spool] {job.name} failed after {len(job.failed_on)} attempts: {job.result['error']}")
+
+    async def _stream(self, machine, job):
+        loop = asyncio.get_running_loop()
+        lines = job.lines()
+        handle = grbl.StreamJob()
+        last_reply = [time.perf_counter()]
+
+        def progress(done, total):
+            last_reply[0] = time.perf_counter()
+
+        work = loop.run_in_executor(self._executor, machine._run, lines, progress, handle)
+        while True:
+            done, _ = await asyncio.wait({work}, timeout=min(1., self.stall_timeout / 4))
+            if done:
+                stats = work.result()
+                if stats["cancelled"]:
+                    raise StallError(f"no reply for {self.stall_timeout:g} s")
+                return stats, len(lines)
+            if time.perf_counter() - last_reply[0] > self.stall_timeout:
+                handle.cancel()
+
+    async def _worker(self, machine):
+        while True:
+            async with self._cond:
+                job = None
+                while not self._closed and machine.state != "offline":
+                    job = self._take(machine)
+                    if job is not None or self._unfinished == 0:
+                        break
+                    await self._cond.wait()
+                if job is None:
+                    return
+
+            machine.state = "busy"
+            start = time.perf_counter()
+            try:
+                stats, n_lines = await self._stream(machine, job)
+            except Exception as e:
+                machine.busy += time.perf_counter() - start
+                machine.failures += 1
+                machine._consecutive += 1
+                machine._disconnect()
+                job.failed_on.append(machine.name)
+                job.errors.append(f"{machine.name}: {type(e).__name__}: {e}")
+                self.log(f"[spool] {job.name} failed on {machine.name}: {e}")
+                machine.state = "offline" if machine._consecutive >= machine.max_failures else "idle"
+                async with self._cond:
+                    if len(job.failed_on) >= self.max_attempts or not self._live():
+                        self._give_up(job)
+                    else:
+                        self._pending.appendleft(job)
+                    if not self._live():
+                        while self._pending:
+                            self._give_up(self._pending.popleft())
+                    self._cond.notify_all()
+                continue
+
+            machine.busy += time.perf_counter() - start
+            machine.jobs += 1
+            machine.lines += stats["lines"]
+            machine._consecutive = 0
+            machine.state = "idle"
+            job.result = {"job": job.name, "machine": machine.name, "attempts": len(job.failed_on) + 1,
+                          "stats": stats, "error": None}
+            self.log(f"[spool] {job.name} done on {machine.name}: {n_lines} lines in {stats['seconds']:.1f}s")
+            async with self._cond:
+                self._unfinished -= 1
+                self._cond.notify_all()
+
+    async def run(self):
+        """
+        处理队列直到所有任务完成或失败
+
+        返回:
+            list[dict]: 每个任务的结果 (job, machine, attempts, stats, error), 按提交顺序
+        """
+        self._cond = asyncio.Condition()
+        self._closed = False
+        self._executor = ThreadPoolExecutor(max(1, len(self.machines)), thread_name_prefix="spool")
+        self._started = time.perf_counter()
+        try:
+            await asyncio.gather(*(self._worker(m) for m in self.machines))
+        finally:
+            self._closed = True
+            for machine in self.machines:
+                machine._disconnect()
+            self._executor.shutdown(wait=True)
+            self.elapsed = time.perf_counter() - self._started
+        for job in self._pending:
+            self._give_up(job)
+        self._pending.clear()
+        return [job.result for job in self._jobs]
+
+    def utilization(self):
+        """每台机器: jobs, lines, failures, busy (秒), utilization (忙碌时间 / 总时间), state"""
+        elapsed = getattr(self, "elapsed", None) or 1e-9
+        return {m.name: {"jobs": m.jobs, "lines": m.lines, "failures": m.failures, "busy": m.busy,
+                         "utilization": m.busy / elapsed, "state": m.state} for m in self.machines}
+
+
+def spool(jobs, machines, **kwargs):
+    """
+    同步入口: 处理 jobs 中的全部任务
+
+    参数:
+        jobs: [(name, gcode), ...] 或 [(name, gcode, is_file), ...]
+        machines (list[Machine])
+        kwargs: 传给 Spooler
+
+    返回:
+        results (list[dict]), spooler (Spooler)
+    """
+    spooler = Spooler(machines, **kwargs)
+    for job in jobs:
+        spooler.submit(*job)
+    results = asyncio.run(spooler.run())
+    return results, spooler
+
+
+def format_report(results, spooler):
+    done = sum(r["error"] is None for r in results)
+    lines = [f"{done}/{len(results)} jobs done in {spooler.elapsed:.1f} s"]
+    for name, u in spooler.utilization().items():
+        lines.append(f"  {name:<12} {u['jobs']:4d} jobs {u['lines']:8d} lines  busy {u['busy']:7.1f} s  "
+                     f"{u['utilization']:6.1%}  failures {u['failures']}  {u['state']}")
+    for r in results:
+        if r["error"] is not None:
+            lines.append(f"  FAILED {r['job']}: {r['error']}")
+    return "\n".join(lines)
@@ -0,0 +1,56 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import compact
+
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _compact(lines):
+    compactor = compact.Compactor()
+    out = list(compactor.compact(lines))
+    same, reason = compact.verify(lines, out)
+    assert same, reason
+    return out, compactor
+
+
+def test_relative_section():
+    # G91 下的轴是增量: 0 增量省略, 非 0 增量即使与上一行相同也要写; 回到 G90 后按累计的位置比较
+    lines = ["G90", "G1 X1.000 Y2.000 F1000", "G91", "G1 X1.000 Y0.000", "G1 X1.000 Y0.000",
+             "G1 X0.000 Y0.000", "G90", "G1 X3.000 Y2.000", "G1 X5.000 Y2.000"]
+    out, _ = _compact(lines)
+    assert out == ["G90", "F1000G1X1Y2", "G91", "X1", "X1", "G90", "X5"]
+
+
+def test_full_circle_keeps_an_axis():
+    # 终点与起点相同的整圆不能省掉全部轴, 否则 GRBL 报 error:26
+    lines = ["G90", "G0 X10.000 Y0.000", "G2 X10.000 Y0.000 I-5.000 J0.000 F500", "G3 X10.000 Y0.000 I-5.000 J0.000"]
+    out, _ = _compact(lines)
+    assert out == ["G90", "G0X10Y0", "F500G2X10I-5J0", "G3X10I-5J0"]
+
+
+def test_unit_switch_forgets_position_and_feed():
+    lines = ["G21", "G1 X25.400 F100", "G1 X25.400 F100", "G20", "G1 X1.000 F100", "G21", "G1 X25.400"]
+    out, _ = _compact(lines)
+    assert out == ["G21", "F100G1X25.4", "G20", "F100X1", "G21", "X25.4"]
+
+
+def test_unknown_g_code_resets_position():
+    lines = ["G1 X1.000 Y1.000 F500", "G28", "G1 X1.000 Y1.000", "G1 X1.000 Y1.000"]
+    out, _ = _compact(lines)
+    assert out == ["F500G1X1Y1", "G28", "X1Y1"]
+
+
+def test_source_line():
+    lines = ["(header)", "G21", "", "G1 X0.000 Y0.000 F500", "G1 X0.000 Y0.000", "G1 X5.000"]
+    out, compactor = _compact(lines)
+    assert out == ["G21", "F500G1X0Y0", "X5"]
+    assert [compactor.source_line(i) for i in range(len(out))] == [1, 3, 5]
+
+
+def test_exam_round_trip():
+    text, report = compact.compact_gcode(os.path.join(HERE, "exam.gcode"), is_file=True, check=True)
+    assert report["bytes_after"] < report["bytes_before"]
+    assert report["lines_after"] == len(text.splitlines())
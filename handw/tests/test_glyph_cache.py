@@ -0,0 +1,50 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import glyph_cache
+
+FONT = "DejaVu Sans"
+MISSING = "这"  # DejaVu Sans 没有汉字
+
+
+def test_missing_glyph_warns_and_keeps_going():
+    cache = glyph_cache.GlyphCache()
+    with pytest.warns(UserWarning, match="missing from font"):
+        glyph = cache.get(FONT, 0, MISSING, 10.)
+    assert glyph.index == 0
+    assert glyph.advance > 0
+
+    verts, codes = glyph_cache.layout_line("a" + MISSING + "b", FONT, 10., cache=cache)
+    plain, _ = glyph_cache.layout_line("ab", FONT, 10., cache=cache)
+    assert len(verts) == len(codes) > len(plain)
+    advances = glyph_cache.line_advances("a" + MISSING + "b", FONT, 10., cache=cache)
+    assert advances[1] == glyph.advance
+
+
+def test_missing_glyph_in_gcode():
+    import control
+
+    with pytest.warns(UserWarning):
+        gcode, _ = control.text_to_gcode("a" + MISSING + "b", font_size=10, font_name=FONT)
+    assert "G1" in gcode
+
+
+def test_matplotlib_render_does_not_change_glyph_scale():
+    # matplotlib 的文字渲染会改共享字体对象的字号, 之后未命中的字形仍要按正确的字号取轮廓
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    expected = glyph_cache.GlyphCache().get(FONT, 0, "b", 10.)
+    fig = plt.figure()
+    fig.suptitle("Text Path Preview")
+    fig.canvas.draw()
+    plt.close(fig)
+
+    glyph = glyph_cache.GlyphCache().get(FONT, 0, "b", 10.)
+    assert glyph.advance == expected.advance
+    assert (glyph.vertices == expected.vertices).all()
@@ -0,0 +1,47 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import grbl
+from fake_grbl import FakeGrbl
+
+
+def test_stream_never_fills_rx_ring():
+    # 每行 16 字节, 8 行正好 128 字节: GRBL 的 128 字节环形缓冲区只能存 127 字节
+    lines = [f"G1 X{i % 10}.000 Y2.00" for i in range(40)]
+    assert all(len(line) + 1 == 16 for line in lines)
+    # 规划器只有一格且执行很慢, 未回复的行都停留在接收缓冲区
+    with FakeGrbl(planner_size=1, line_time=0.02) as fake:
+        ser = grbl.open_grbl(fake.port, 115200, wake_delay=0)
+        try:
+            stats = grbl.stream_gcode(ser, lines)
+        finally:
+            ser.close()
+        assert not fake.overflow
+        assert fake.received == lines
+    assert stats["lines"] == len(lines)
+    assert not stats["errors"]
+
+
+def test_cancel_stops_then_lifts_pen():
+    lines = ["G1 Z-1"] + [f"G1 X{i}.000 Y2.000" for i in range(60)]
+    job = grbl.StreamJob()
+
+    def progress(done, total):
+        if done == 10:
+            job.cancel()
+
+    with FakeGrbl(line_time=0.02) as fake:
+        ser = grbl.open_grbl(fake.port, 115200, wake_delay=0)
+        try:
+            stats = grbl.stream_gcode(ser, lines, progress=progress, job=job, z_safe=5)
+        finally:
+            ser.close()
+        assert fake.resets == 1
+        assert fake.received[-1] == "G0 Z5"
+        time.sleep(0.05)
+        assert fake.position[2] == 5.
+    assert stats["cancelled"] and stats["pen_up"]
+    assert stats["lines"] < len(lines)
@@ -0,0 +1,48 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import spooler
+from fake_grbl import FakeGrbl
+
+GCODE = "\n".join(f"G1 X{i % 10}.000 Y1.000" for i in range(30))
+
+
+def _spool(jobs, fakes, **kwargs):
+    machines = [spooler.Machine(name, fake.port, wake_delay=0) for name, fake in fakes]
+    return spooler.spool(jobs, machines, log=lambda message: None, **kwargs)
+
+
+def test_two_machines_share_the_queue():
+    jobs = [(f"job-{i}", GCODE) for i in range(6)]
+    with FakeGrbl(line_time=0.005) as left, FakeGrbl(line_time=0.005) as right:
+        results, spool = _spool(jobs, [("left", left), ("right", right)])
+        assert len(left.received) + len(right.received) == 6 * 30
+    assert [r["job"] for r in results] == [name for name, _ in jobs]
+    assert all(r["error"] is None and r["attempts"] == 1 for r in results)
+    usage = spool.utilization()
+    assert usage["left"]["jobs"] >= 1 and usage["right"]["jobs"] >= 1
+    assert usage["left"]["lines"] + usage["right"]["lines"] == 6 * 30
+
+
+def test_failed_job_is_retried_on_the_other_machine():
+    # bad 收到 5 行后断开, 它拿到的任务交给 good 重做; 连续失败两次后 bad 停用
+    jobs = [(f"job-{i}", GCODE) for i in range(3)]
+    with FakeGrbl(line_time=0.001, fail_after=5) as bad, FakeGrbl(line_time=0.001) as good:
+        results, spool = _spool(jobs, [("bad", bad), ("good", good)])
+    assert all(r["error"] is None and r["machine"] == "good" for r in results)
+    assert results[0]["attempts"] == 2
+    usage = spool.utilization()
+    assert usage["bad"]["failures"] == 2 and usage["bad"]["state"] == "offline"
+    assert usage["good"]["jobs"] == 3
+
+
+def test_stalled_machine_trips_stall_timeout():
+    # 规划器只有一格且一段要执行很久: 回复两个 ok 后再无回复
+    with FakeGrbl(planner_size=1, line_time=1000) as stuck, FakeGrbl(line_time=0.001) as good:
+        results, spool = _spool([("job", GCODE)], [("stuck", stuck), ("good", good)], stall_timeout=0.5)
+        assert stuck.resets == 1
+    result, = results
+    assert result["machine"] == "good" and result["attempts"] == 2
+    assert spool.utilization()["stuck"]["failures"] == 1
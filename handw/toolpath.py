@@ -0,0 +1,122 @@
+"""
+刀路中间表示: 一个结构化数组贯穿生成、简化、笔画重排、预览、时间估算、导出和上传
+
+每行是一条路径指令:
+    op      uint8   emit.MOVETO (抬笔移到此处后落笔) / LINETO / CLOSEPOLY (抬笔) / ARC_CW / ARC_CCW
+    xy      (2,) f8 目标点 (mm)
+    center  (2,) f8 圆弧圆心 (绝对坐标), 非圆弧为 NaN
+    feed    f4      落笔运动的进给速度 (mm/min)
+
+tp["xy"]、tp["op"]、tp["center"] 都是原数组的视图, 直接交给 curves / travel / emit / 预览使用,
+各阶段之间不再转换成 G-code 文本或 Python 元组; G-code 文本只在 emit 输出时产生。
+"""
+import numpy as np
+
+import curves
+import emit
+import travel
+
+DTYPE = np.dtype([("xy", "<f8", (2,)), ("center", "<f8", (2,)), ("feed", "<f4"), ("op", "u1")], align=True)
+
+
+def empty(n=0):
+    tp = np.zeros(n, dtype=DTYPE)
+    tp["center"] = np.nan
+    return tp
+
+
+def is_toolpath(obj):
+    return isinstance(obj, np.ndarray) and obj.dtype == DTYPE
+
+
+def from_path(vertices, codes, centers=None, feed=1000.):
+    """(vertices, codes[, centers]) 路径 -> 刀路; feed 为一个数或逐行的数组"""
+    codes = np.asarray(codes)
+    tp = empty(len(codes))
+    tp["xy"] = np.asarray(vertices, dtype=float).reshape(-1, 2)
+    tp["op"] = codes
+    if centers is not None:
+        tp["center"] = centers
+    tp["feed"] = feed
+    return tp
+
+
+def from_strokes(strokes, feed=1000.):
+    """折线列表 (每个为 (k, 2) 数组) -> 刀路, 每笔以 MOVETO 开始"""
+    strokes = [np.asarray(s, dtype=float).reshape(-1, 2) for s in strokes if len(s)]
+    if not strokes:
+        return empty()
+    lengths = [len(s) for s in strokes]
+    codes = np.full(sum(lengths), emit.LINETO, dtype=np.uint8)
+    codes[np.cumsum([0] + lengths[:-1])] = emit.MOVETO
+    return from_path(np.concatenate(strokes), codes, feed=feed)
+
+
+def centers_of(tp):
+    """圆心视图, 没有圆弧时为 None (emit/travel 的约定)"""
+    arcs = (tp["op"] == emit.ARC_CW) | (tp["op"] == emit.ARC_CCW)
+    return tp["center"] if arcs.any() else None
+
+
+def flatten(tp, tolerance=0.05, arcs=False):
+    """
+    曲线展开为折线 (arcs=True 时拟合为圆弧), 进给速度按笔画沿用
+
+    没有曲线时原样返回, 不复制
+    """
+    vertices, codes = tp["xy"], tp["op"]
+    if not np.isin(codes, (curves.CURVE3, curves.CURVE4)).any():
+        return tp
+    if arcs:
+        vertices, codes, centers = curves.fit_arcs(vertices, codes, tolerance)
+    else:
+        vertices, codes = curves.flatten(vertices, codes, tolerance)
+        centers = None
+    return from_path(vertices, codes, centers, _stroke_feed(tp, codes))
+
+
+def _stroke_feed(tp, codes):
+    # 展开/拟合不改变笔画数, 新的每一行沿用所在笔画第一行的进给速度
+    feed = tp["feed"]
+    if not len(feed) or (feed == feed[0]).all():
+        return feed[0] if len(feed) else 0.
+    by_stroke = np.r_[feed[0], feed[tp["op"] == emit.MOVETO]]
+    return by_stroke[np.cumsum(codes == emit.MOVETO)]
+
+
+def simplify(tp, tolerance=0.05):
+    """RDP 简化 (见 curves.simplify), 只删 LINETO 行"""
+    if tolerance <= 0:
+        return tp
+    return tp[curves.simplify_mask(tp["xy"], tp["op"], tolerance)]
+
+
+def optimize(tp, start=(0, 0), **kwargs):
+    """
+    重排笔画以减少抬笔空走 (见 travel.optimize_travel)
+
+    返回:
+        tp, report
+    """
+    vertices, codes, centers, report = travel.optimize_travel(tp["xy"], tp["op"], centers_of(tp),
+                                                              start=start, **kwargs)
+    index = report.pop("index")
+    if index is None:
+        return tp, report
+    out = tp[index]
+    out["op"] = codes
+    if centers is not None:
+        out["center"] = centers
+    return out, report
+
+
+def translate(tp, dx=0., dy=0.):
+    out = tp.copy()
+    out["xy"] += (dx, dy)
+    out["center"] += (dx, dy)
+    return out
+
+
+def concatenate(parts):
+    parts = [p for p in parts if len(p)]
+    return np.concatenate(parts) if parts else empty()
@@ -0,0 +1,238 @@
+import math
+from collections import defaultdict
+
+import numpy as np
+import emit
+
+_FLIP = {emit.ARC_CW: emit.ARC_CCW, emit.ARC_CCW: emit.ARC_CW}
+
+
+def pen_up_distance(vertices, codes, start=(0, 0)):
+    """
+    抬笔空走总距离: 每个 MOVETO 之前笔所在位置到 MOVETO 目标点的距离之和
+
+    CLOSEPOLY 只抬笔不移动, 笔停在它之前最后一个绘制点。
+    """
+    vertices = np.asarray(vertices, dtype=float).reshape(-1, 2)
+    codes = np.asarray(codes)
+    moves = np.flatnonzero(codes == emit.MOVETO)
+    if not len(moves):
+        return 0.
+    idx = np.arange(len(codes))
+    last = np.where(codes != emit.CLOSEPOLY, idx, -1)
+    np.maximum.accumulate(last, out=last)
+    prev = np.full(len(moves), -1)
+    prev[moves > 0] = last[moves[moves > 0] - 1]
+    origin = np.where((prev >= 0)[:, None], vertices[np.maximum(prev, 0)], np.asarray(start, dtype=float))
+    return float(np.linalg.norm(vertices[moves] - origin, axis=1).sum())
+
+
+def split_strokes(codes):
+    """
+    按 MOVETO 切分笔画
+
+    返回:
+        bounds (np.ndarray): (k, 2) 每个笔画在顶点数组中的 [起, 止) 下标
+        last (np.ndarray): 每个笔画最后一个绘制点 (非 CLOSEPOLY) 的下标
+        reversible (np.ndarray): 笔画能否反向绘制 (只含直线/圆弧, CLOSEPOLY 只在末尾)
+    """
+    codes = np.asarray(codes)
+    n = len(codes)
+    heads = np.flatnonzero(codes == emit.MOVETO)
+    bounds = np.stack([heads, np.r_[heads[1:], n][:len(heads)]], axis=1)
+
+    idx = np.arange(n)
+    drawn = np.where(codes != emit.CLOSEPOLY, idx, -1)
+    np.maximum.accumulate(drawn, out=drawn)
+    last = drawn[bounds[:, 1] - 1]
+
+    plain = np.r_[0, np.cumsum(np.isin(codes, (emit.LINETO, emit.ARC_CW, emit.ARC_CCW)))]
+    closes = np.r_[0, np.cumsum(codes == emit.CLOSEPOLY)]
+    lo, hi = bounds.T
+    # MOVETO 之后到最后绘制点全是直线/圆弧, 其后只剩 CLOSEPOLY
+    reversible = ((plain[last + 1] - plain[lo + 1] == last - lo)
+                  & (closes[hi] - closes[last + 1] == hi - last - 1))
+    return bounds, last, reversible
+
+
+class _GridIndex:
+    # 均匀网格最近邻索引, 支持删除; 每次查询按环向外扩展直到不可能更近
+    def __init__(self, points):
+        self.points = points.tolist()
+        n = len(points)
+        lo = points.min(axis=0)
+        hi = points.max(axis=0)
+        area = max(float(np.prod(hi - lo)), 1e-9)
+        self.cell = max(math.sqrt(2 * area / n), 1e-6)
+        self.lo = lo
+        keys = np.floor((points - lo) / self.cell).astype(int)
+        self.max_ring = int(keys.max()) + 1
+        self.cells = defaultdict(set)
+        for i, key in enumerate(map(tuple, keys.tolist())):
+            self.cells[key].add(i)
+        self.keys = keys.tolist()
+
+    def remove(self, i):
+        self.cells[tuple(self.keys[i])].discard(i)
+
+    def _ring(self, cx, cy, r):
+        if r == 0:
+            yield cx, cy
+            return
+        for x in range(cx - r, cx + r + 1):
+            yield x, cy - r
+            yield x, cy + r
+        for y in range(cy - r + 1, cy + r):
+            yield cx - r, y
+            yield cx + r, y
+
+    def nearest(self, x, y):
+        cx = int(math.floor((x - self.lo[0]) / self.cell))
+        cy = int(math.floor((y - self.lo[1]) / self.cell))
+        reach = self.max_ring + max(abs(cx), abs(cy))
+        best, best_d2 = -1, math.inf
+        for r in range(reach + 1):
+            for key in self._ring(cx, cy, r):
+                ids = self.cells.get(key)
+                if not ids:
+                    continue
+                for i in ids:
+                    px, py = self.points[i]
+                    d2 = (px - x) ** 2 + (py - y) ** 2
+                    if d2 < best_d2:
+                        best, best_d2 = i, d2
+            # 第 r+1 环上的点距离至少为 r * cell
+            if best >= 0 and best_d2 <= (r * self.cell) ** 2:
+                break
+        return best
+
+
+def _nearest_order(heads, tails, flippable, start):
+    # 贪心最近邻: 每个笔画在索引中放入起点 (可反向时再放入终点)
+    m = len(heads)
+    points = np.concatenate([heads, tails[flippable]])
+    owner = np.r_[np.arange(m), np.flatnonzero(flippable)]
+    side = np.r_[np.zeros(m, dtype=bool), np.ones(int(flippable.sum()), dtype=bool)]
+    partner = {}
+    for p, k in enumerate(owner.tolist()):
+        partner.setdefault(k, []).append(p)
+
+    grid = _GridIndex(points)
+    order = np.empty(m, dtype=np.intp)
+    flipped = np.zeros(m, dtype=bool)
+    x, y = start
+    for pos in range(m):
+        p = grid.nearest(x, y)
+        k = owner[p]
+        order[pos] = k
+        flipped[pos] = side[p]
+        for q in partner[k]:
+            grid.remove(q)
+        x, y = (heads[k] if side[p] else tails[k]).tolist()
+    return order, flipped
+
+
+def _two_opt(heads, tails, flippable, order, flipped, start, window=32, max_passes=4):
+    # 窗口化 2-opt: 反转连续一段笔画 (顺序与方向同时反转), 每种段长整批计算收益
+    m = len(order)
+    start = np.asarray(start, dtype=float)
+    for _ in range(max_passes):
+        improved = 0.
+        for length in range(1, min(window, m) + 1):
+            s = np.where(flipped[:, None], tails[order], heads[order])
+            e = np.where(flipped[:, None], heads[order], tails[order])
+            prev_e = np.vstack([start, e[:-1]])
+            a = np.arange(m - length + 1)
+            b = a + length - 1
+            old = np.linalg.norm(s[a] - prev_e[a], axis=1)
+            new = np.linalg.norm(e[b] - prev_e[a], axis=1)
+            inner = b < m - 1
+            nb = np.minimum(b + 1, m - 1)
+            old += np.where(inner, np.linalg.norm(s[nb] - e[b], axis=1), 0.)
+            new += np.where(inner, np.linalg.norm(s[nb] - s[a], axis=1), 0.)
+            gain = old - new
+            blocked = np.r_[0, np.cumsum(~flippable[order])]
+            ok = (gain > 1e-9) & (blocked[b + 1] - blocked[a] == 0)
+            candidates = np.flatnonzero(ok)
+            if not len(candidates):
+                continue
+            used = np.zeros(m + 1, dtype=bool)
+            for i in candidates[np.argsort(-gain[candidates])].tolist():
+                j = i + length - 1
+                if used[i:j + 2].any():
+                    continue
+                used[i:j + 2] = True
+                order[i:j + 1] = order[i:j + 1][::-1].copy()
+                flipped[i:j + 1] = ~flipped[i:j + 1][::-1]
+                improved += gain[i]
+        if improved <= 1e-6:
+            break
+    return order, flipped
+
+
+def optimize_travel(vertices, codes, centers=None, reverse=True, two_opt=True, start=(0, 0)):
+    """
+    重排笔画以减少抬笔空走 (G0) 距离
+
+    参数:
+        vertices, codes: 展开后的路径 (MOVETO/LINETO/CLOSEPOLY/圆弧)
+        centers: 圆弧圆心, 与 curves.fit_arcs 的输出对应, 没有圆弧时为 None
+        reverse (bool): 允许把开放笔画反向绘制
+        two_opt (bool): 最近邻排序后再做窗口化 2-opt 改进
+        start: 笔的初始位置
+
+    返回:
+        vertices, codes, centers, report: report 含优化前后的抬笔距离 (mm), 以及新顶点在原数组中的
+            下标 index (未重排时为 None)
+    """
+    vertices = np.asarray(vertices, dtype=float).reshape(-1, 2)
+    codes = np.asarray(codes)
+    before = pen_up_distance(vertices, codes, start)
+    bounds, last, reversible = split_strokes(codes)
+    m = len(bounds)
+    if m < 2:
+        report = {"strokes": m, "before": before, "after": before, "index": None}
+        return vertices, codes, centers, report
+
+    heads = vertices[bounds[:, 0]]
+    tails = vertices[last]
+    closed = np.all(heads == tails, axis=1)
+    flippable = (reversible | closed) if reverse else closed
+    order, flipped = _nearest_order(heads, tails, flippable, start)
+    if two_opt and reverse:
+        order, flipped = _two_opt(heads, tails, flippable, order, flipped, start)
+
+    # 只有真正需要反向的笔画才重排顶点, 闭合笔画首尾相同, 保持原方向
+    flipped &= ~closed[order]
+    prefix = np.arange(bounds[0, 0])
+    pieces = [prefix]
+    reversed_pieces = []
+    for k, flip in zip(order.tolist(), flipped.tolist()):
+        lo, hi = bounds[k]
+        if not flip:
+            pieces.append(np.arange(lo, hi))
+            continue
+        body = np.arange(last[k], lo - 1, -1)
+        pieces.append(np.r_[body, np.arange(last[k] + 1, hi)])
+        reversed_pieces.append((len(pieces) - 1, k))
+    index = np.concatenate(pieces)
+    new_vertices = vertices[index]
+    new_codes = codes[index].copy()
+    new_centers = None if centers is None else np.asarray(centers, dtype=float)[index].copy()
+
+    # 反向笔画: 第 j 段 (p[j-1] -> p[j]) 变为 p[j] -> p[j-1], 指令与圆心随段移动, 圆弧方向对调
+    offsets = np.cumsum([0] + [len(p) for p in pieces])
+    for piece, k in reversed_pieces:
+        o = offsets[piece]
+        lo = bounds[k, 0]
+        n_body = last[k] - lo + 1
+        seg_codes = codes[lo + 1:last[k] + 1][::-1]
+        new_codes[o] = emit.MOVETO
+        new_codes[o + 1:o + n_body] = [_FLIP.get(c, c) for c in seg_codes.tolist()]
+        if new_centers is not None:
+            new_centers[o] = np.nan
+            new_centers[o + 1:o + n_body] = centers[lo + 1:last[k] + 1][::-1]
+
+    after = pen_up_distance(new_vertices, new_codes, start)
+    report = {"strokes": m, "before": before, "after": after, "index": index}
+    return new_vertices, new_codes, new_centers, report
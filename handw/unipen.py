@@ -0,0 +1,362 @@
+"""
+UNIPEN 笔迹样本库: eng/unipen/statis/*_samples.txt 整批解析, 编译成一个带索引的二进制缓存
+
+样本文件每行一个样本: "文档号/标签  x y  x y ...", 标签是一个字符 (反斜杠写作 "\\\\"),
+坐标已归一化。statis 下既有按标签分的文件 (a_samples.txt) 也有按文档分的文件, 同一条笔迹
+会出现在两处; 编译时按行内容去重, 重复的样本共用同一段点。
+
+缓存布局 (小端, 各段按 8 字节对齐):
+    header    HEADER_DTYPE, 1 条
+    sources   SOURCE_DTYPE, 每个源文件一条 (按文件名排序): 大小、修改时间、样本起点
+    samples   SAMPLE_DTYPE, 按源文件、行号顺序: 点的起点与点数、标签号、文档号
+    by_label  uint32, 样本号按 (标签, 样本号) 排序
+    labels    uint32, 每个标签在 by_label 中的起点, 末尾多一项为样本数
+    points    float32 (n, 2)
+    names     utf-8 JSON: {"sources": [...], "labels": [...], "documents": [...]}
+
+读取时用 mmap 映射, 各段是 np.frombuffer 视图, 打开只需解析很小的 names; 源文件的大小或
+修改时间有变化时 load 重新编译。
+"""
+import glob
+import hashlib
+import json
+import mmap
+import os
+
+import numpy as np
+
+DEFAULT_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "eng", "unipen", "statis")
+PATTERN = "*_samples.txt"
+
+MAGIC = b"HWUNIPN1"
+VERSION = 1
+HEADER_DTYPE = np.dtype([("magic", "S8"), ("version", "<u4"), ("n_sources", "<u4"), ("n_samples", "<u4"),
+                         ("n_labels", "<u4"), ("n_points", "<u8"), ("names", "<u8")])
+SOURCE_DTYPE = np.dtype([("size", "<u8"), ("mtime", "<i8"), ("first", "<u4"), ("count", "<u4")])
+SAMPLE_DTYPE = np.dtype([("start", "<u8"), ("count", "<u4"), ("label", "<u4"), ("document", "<u4"),
+                         ("source", "<u4")])
+
+_SPACE = np.zeros(256, dtype=bool)
+_SPACE[list(b" \t\r\n\v\f")] = True
+
+
+def _aligned(n):
+    return (n + 7) & ~7
+
+
+def default_cache(folder=DEFAULT_FOLDER):
+    """缓存文件与样本目录同级: statis -> statis.unipen"""
+    return os.path.normpath(folder) + ".unipen"
+
+
+def scan(folder=DEFAULT_FOLDER, pattern=PATTERN):
+    """样本文件列表, 按文件名排序: [(name, size, mtime_ns), ...]"""
+    sources = []
+    for path in glob.glob(os.path.join(glob.escape(folder), pattern)):
+        st = os.stat(path)
+        sources.append((os.path.basename(path), st.st_size, st.st_mtime_ns))
+    sources.sort()
+    return sources
+
+
+def _unescape(label):
+    # 标签中的反斜杠转义: "\\\\" -> "\\", "\\@" -> "@"
+    return label[1:] if len(label) > 1 and label[0] == "\\" else label
+
+
+def parse_samples(data):
+    """
+    解析一个样本文件的全部内容, 整个文件一次交给 NumPy, 不逐个数字转换
+
+    参数:
+        data (bytes): 文件内容
+
+    返回:
+        documents (list[str]), labels (list[str]): 每行的文档号与标签
+        counts (np.ndarray): 每行的点数
+        points (np.ndarray): (n, 2) float32, 各行的点首尾相接
+        bodies (list[bytes]): 每行的坐标部分 (用于去重)
+    """
+    buf = np.frombuffer(data, dtype=np.uint8)
+    newline = np.flatnonzero(buf == ord("\n"))
+    starts = np.r_[0, newline + 1]
+    ends = np.r_[newline, len(buf)]
+
+    # 标签从第一个 "/" 之后开始, 到坐标前的双空格为止 (标签可能是空格, 也可能为空)
+    slash = np.flatnonzero(buf == ord("/"))
+    first = slash[np.minimum(np.searchsorted(slash, starts), len(slash) - 1)] if len(slash) else ends
+    prefixed = (first >= starts) & (first < ends)
+    # 没有前缀的只能是空行
+    for a, b in zip(starts[~prefixed].tolist(), ends[~prefixed].tolist()):
+        if data[a:b].strip():
+            raise ValueError(f"Sample line without 'document/label' prefix: {data[a:b][:40]!r}")
+    starts, ends, slash = starts[prefixed], ends[prefixed], first[prefixed]
+    if not len(starts):
+        return [], [], np.zeros(0, dtype=np.intp), np.empty((0, 2), dtype=np.float32), []
+    gap = np.flatnonzero((buf[:-2] == 32) & (buf[1:-1] == 32) & ~_SPACE[buf[2:]])
+    label_end = gap[np.minimum(np.searchsorted(gap, slash + 1), len(gap) - 1)] if len(gap) else ends
+    label_end = np.where((label_end > slash) & (label_end <= ends), label_end, ends)
+
+    # 抹掉前缀后整个文件就是空白分隔的数字, 每行的数字个数按 "空白之后的非空白" 计数
+    body = buf.copy()
+    width = label_end - starts
+    body[np.repeat(starts - np.r_[0, np.cumsum(width)[:-1]], width) + np.arange(width.sum())] = 32
+    space = _SPACE[body]
+    token = ~space
+    token[1:] &= space[:-1]
+    tokens = np.r_[0, np.cumsum(token, dtype=np.int32)]
+    numbers = tokens[ends] - tokens[starts]
+    if np.any(numbers % 2):
+        raise ValueError("Sample line with an odd number of coordinates")
+    values = np.fromstring(body.tobytes().decode("latin-1"), dtype=np.float32, sep=" ")
+    if len(values) != tokens[-1]:
+        raise ValueError("Malformed coordinates in sample file")
+
+    documents = [data[a:b].decode("utf-8").strip() for a, b in zip(starts.tolist(), slash.tolist())]
+    labels = [_unescape(data[a + 1:b].decode("utf-8")) for a, b in zip(slash.tolist(), label_end.tolist())]
+    bodies = [data[a:b] for a, b in zip(label_end.tolist(), ends.tolist())]
+    return documents, labels, numbers // 2, values.reshape(-1, 2), bodies
+
+
+def compile_library(folder=DEFAULT_FOLDER, cache=None, pattern=PATTERN, sources=None):
+    """
+    解析目录下全部样本文件, 写出缓存
+
+    参数:
+        cache (str): 缓存文件, 默认见 default_cache
+        sources: scan() 的结果, 省略时重新扫描
+
+    返回:
+        str: 缓存文件路径
+    """
+    cache = cache or default_cache(folder)
+    sources = scan(folder, pattern) if sources is None else sources
+    source_table = np.zeros(len(sources), dtype=SOURCE_DTYPE)
+    samples, points = [], []
+    documents, labels = {}, {}
+    seen = {}
+    n_points = n_samples = 0
+    for i, (name, size, mtime) in enumerate(sources):
+        with open(os.path.join(folder, name), "rb") as f:
+            doc_names, label_names, counts, values, bodies = parse_samples(f.read())
+        table = np.zeros(len(counts), dtype=SAMPLE_DTYPE)
+        table["count"] = counts
+        table["source"] = i
+        table["document"] = [documents.setdefault(d, len(documents)) for d in doc_names]
+        table["label"] = [labels.setdefault(c, len(labels)) for c in label_names]
+        # 相同的笔迹只存一份
+        offsets = np.r_[0, np.cumsum(counts)]
+        keep = np.zeros(len(counts), dtype=bool)
+        starts = table["start"]
+        for j, body in enumerate(bodies):
+            key = hashlib.blake2b(body, digest_size=16).digest()
+            start = seen.get(key)
+            if start is None:
+                start = seen[key] = n_points
+                n_points += int(counts[j])
+                keep[j] = True
+            starts[j] = start
+        points.append(values[np.repeat(keep, counts)])
+        source_table[i] = (size, mtime, n_samples, len(table))
+        samples.append(table)
+        n_samples += len(table)
+
+    samples = np.concatenate(samples) if samples else np.zeros(0, dtype=SAMPLE_DTYPE)
+    points = np.concatenate(points) if points else np.empty((0, 2), dtype=np.float32)
+    # 标签按字符排序, 样本表里的标签号换成排序后的序号
+    label_names = sorted(labels)
+    rank = np.empty(len(labels), dtype="<u4")
+    rank[[labels[c] for c in label_names]] = np.arange(len(labels))
+    samples["label"] = rank[samples["label"]]
+    by_label = np.argsort(samples["label"], kind="stable").astype("<u4")
+    label_offsets = np.searchsorted(samples["label"][by_label], np.arange(len(labels) + 1)).astype("<u4")
+    names = json.dumps({"sources": [s[0] for s in sources], "labels": label_names,
+                        "documents": sorted(documents, key=documents.get)}, ensure_ascii=False).encode("utf-8")
+
+    header = np.zeros(1, dtype=HEADER_DTYPE)
+    header[0] = (MAGIC, VERSION, len(source_table), len(samples), len(label_names), len(points), len(names))
+    tmp = cache + ".tmp"
+    with open(tmp, "wb") as f:
+        for section in (header.tobytes(), source_table.tobytes(), samples.tobytes(), by_label.tobytes(),
+                        label_offsets.tobytes(), points.astype("<f4").tobytes(), names):
+            f.write(section)
+            f.write(b"\0" * (_aligned(len(section)) - len(section)))
+    # 先写临时文件再替换, 正在读取旧缓存的进程不受影响
+    os.replace(tmp, cache)
+    return cache
+
+
+class UnipenLibrary:
+    """
+    只读打开编译好的样本库
+
+    用法:
+        lib = load()
+        for i in lib.by_label("a")[:100]:
+            xy = lib.trajectory(i)            # (k, 2) float32, 映射内存的视图
+        plot_grid(lib, lib.by_label("a")[:400])
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        header = np.frombuffer(self._mm, dtype=HEADER_DTYPE, count=1)[0]
+        if header["magic"] != MAGIC or header["version"] != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} UNIPEN cache")
+        n_sources, n_samples, n_labels = (int(header[k]) for k in ("n_sources", "n_samples", "n_labels"))
+        offset = _aligned(HEADER_DTYPE.itemsize)
+        self.sources = np.frombuffer(self._mm, dtype=SOURCE_DTYPE, count=n_sources, offset=offset)
+        offset += _aligned(self.sources.nbytes)
+        self.samples = np.frombuffer(self._mm, dtype=SAMPLE_DTYPE, count=n_samples, offset=offset)
+        offset += _aligned(self.samples.nbytes)
+        self._by_label = np.frombuffer(self._mm, dtype="<u4", count=n_samples, offset=offset)
+        offset += _aligned(self._by_label.nbytes)
+        self.label_offsets = np.frombuffer(self._mm, dtype="<u4", count=n_labels + 1, offset=offset)
+        offset += _aligned(self.label_offsets.nbytes)
+        self.points = np.frombuffer(self._mm, dtype="<f4", count=2 * int(header["n_points"]),
+                                    offset=offset).reshape(-1, 2)
+        offset += _aligned(self.points.nbytes)
+        names = json.loads(self._mm[offset:offset + int(header["names"])].decode("utf-8"))
+        self.source_names = names["sources"]
+        self.labels = names["labels"]
+        self.documents = names["documents"]
+        self._source_index = {name: i for i, name in enumerate(self.source_names)}
+        self._label_index = {label: i for i, label in enumerate(self.labels)}
+
+    def __len__(self):
+        return len(self.samples)
+
+    def matches(self, sources):
+        """缓存是否由这些源文件 (scan() 的结果) 编译而来"""
+        if len(sources) != len(self.sources):
+            return False
+        names = [s[0] for s in sources]
+        stats = np.array([s[1:] for s in sources], dtype=np.int64).reshape(-1, 2)
+        return (names == self.source_names and np.array_equal(stats[:, 0], self.sources["size"])
+                and np.array_equal(stats[:, 1], self.sources["mtime"]))
+
+    def by_label(self, label):
+        """某个标签的全部样本号 (按源文件、行号顺序); 没有时为空数组"""
+        i = self._label_index.get(label)
+        if i is None:
+            return self._by_label[:0]
+        return self._by_label[self.label_offsets[i]:self.label_offsets[i + 1]]
+
+    def by_file(self, name):
+        """某个源文件 (文件名, 如 "a_samples.txt") 的全部样本号"""
+        i = self._source_index.get(os.path.basename(name))
+        if i is None:
+            return np.arange(0, dtype=np.intp)
+        first, count = int(self.sources[i]["first"]), int(self.sources[i]["count"])
+        return np.arange(first, first + count)
+
+    def label(self, i):
+        return self.labels[self.samples[i]["label"]]
+
+    def document(self, i):
+        return self.documents[self.samples[i]["document"]]
+
+    def trajectory(self, i):
+        """第 i 个样本的点, (k, 2) float32 只读视图"""
+        start, count = int(self.samples[i]["start"]), int(self.samples[i]["count"])
+        return self.points[start:start + count]
+
+    def trajectories(self, indices):
+        return [self.trajectory(i) for i in np.asarray(indices).tolist()]
+
+    def close(self):
+        # 仍有视图引用映射时不能关闭, 交给垃圾回收
+        try:
+            self._mm.close()
+        except BufferError:
+            pass
+
+
+def load(folder=DEFAULT_FOLDER, cache=None, pattern=PATTERN):
+    """
+    打开样本库; 缓存不存在或源文件有变化时先重新编译
+
+    返回:
+        UnipenLibrary
+    """
+    cache = cache or default_cache(folder)
+    sources = scan(folder, pattern)
+    if os.path.exists(cache):
+        try:
+            library = UnipenLibrary(cache)
+        except ValueError:
+            library = None
+        if library is not None and library.matches(sources):
+            return library
+        if library is not None:
+            library.close()
+    return UnipenLibrary(compile_library(folder, cache, pattern, sources))
+
+
+def plot_grid(library, indices, cols=20, invert_y=False, titles=True, ax=None, show=True):
+    """
+    在一张图里按网格画出多个样本, 用于一次检查几百个笔迹
+
+    每个样本按自身外接框缩放到一格, 全部笔迹合成一个 LineCollection 绘制。
+
+    参数:
+        library (UnipenLibrary)
+        indices: 样本号
+        cols (int): 每行格数
+        invert_y (bool): 是否翻转 y 轴
+        titles (bool): 是否在格子左上角标出标签
+        ax: matplotlib Axes, 省略时新建图
+
+    返回:
+        matplotlib Axes
+    """
+    import matplotlib.pyplot as plt
+    from matplotlib.collections import LineCollection
+
+    indices = np.asarray(indices, dtype=np.intp)
+    if ax is None:
+        rows = max(1, -(-len(indices) // cols))
+        _, ax = plt.subplots(figsize=(min(cols, len(indices) or 1) * 0.8 + 0.4, rows * 0.8 + 0.4))
+    ax.set_aspect("equal")
+    ax.set_axis_off()
+    if not len(indices):
+        return ax
+
+    lines = library.trajectories(indices)
+    counts = np.array([len(xy) for xy in lines])
+    nonempty = counts > 0
+    if nonempty.any():
+        points = np.concatenate([xy for xy in lines if len(xy)]).astype(float)
+        if invert_y:
+            points[:, 1] *= -1
+        first = np.r_[0, np.cumsum(counts[nonempty])[:-1]]
+        low = np.minimum.reduceat(points, first)
+        high = np.maximum.reduceat(points, first)
+        scale = 0.85 / np.maximum((high - low).max(axis=1), 1e-9)
+        # 格子 k 的中心在 (k % cols, -(k // cols))
+        cell = np.flatnonzero(nonempty)
+        centers = np.column_stack([cell % cols, -(cell // cols)]).astype(float)
+        owner = np.repeat(np.arange(len(first)), counts[nonempty])
+        points = (points - ((low + high) / 2)[owner]) * scale[owner, None] + centers[owner]
+        ax.add_collection(LineCollection(np.split(points, first[1:]), linewidths=0.6, colors="k"))
+    if titles:
+        for k, i in enumerate(indices.tolist()):
+            ax.text(k % cols - 0.48, -(k // cols) + 0.48, library.label(i), fontsize=6, color="tab:red",
+                    va="top", ha="left")
+    rows = -(-len(indices) // cols)
+    ax.set_xlim(-0.5, min(cols, len(indices)) - 0.5)
+    ax.set_ylim(-rows + 0.5, 0.5)
+    if show:
+        plt.show()
+    return ax
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+
+    t = time.perf_counter()
+    lib = load(*sys.argv[1:2])
+    print(f"{lib.path}: {len(lib.source_names)} files, {len(lib)} samples, {len(lib.labels)} labels, "
+          f"{len(lib.points)} points ({time.perf_counter() - t:.3f} s)")
@@ -1,4 +1,11 @@
+import importlib
+import itertools
 import os
+import queue
+import sys
+import threading
+import types
+from collections import deque
 
 def list_file(folder_path, suffixes=None):
     if not isinstance(suffixes, (str, list, tuple, type(None))):
@@ -14,4 +21,125 @@ def list_file(folder_path, suffixes=None):
             if not suffixes:
                 font_files.append(os.path.join(root, file))
 
-    return font_files
\ No newline at end of file
+    return font_files
+
+
+class _Failure:
+    def __init__(self, error):
+        self.error = error
+
+
+class _Prefetched:
+    # prefetch 返回的迭代器: 后台线程在创建时已经启动
+    def __init__(self, items, done, stop):
+        self._items = items
+        self._done = done
+        self._stop = stop
+        self._finished = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._finished:
+            raise StopIteration
+        item = self._items.get()
+        if item is self._done:
+            self.close()
+            raise StopIteration
+        if isinstance(item, _Failure):
+            self.close()
+            raise item.error
+        return item
+
+    def close(self):
+        """提前停止: 后台线程随之退出"""
+        self._finished = True
+        self._stop.set()
+
+    def __del__(self):
+        self._stop.set()
+
+
+def prefetch(iterable, size=256):
+    """
+    在后台线程中提前迭代 iterable, 让生产 (生成 G-code) 与消费 (串口发送) 同时进行
+
+    线程在调用时立即启动 (不等第一次 next), 打开串口、等待控制器复位期间就开始生成。
+    生产端的异常会在消费端重新抛出; 消费端提前停止 (close 或不再引用) 时后台线程随之退出。
+    """
+    items = queue.Queue(size)
+    done = object()
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put(item):
+                    return
+        except Exception as e:
+            put(_Failure(e))
+        put(done)
+
+    threading.Thread(target=produce, daemon=True).start()
+    return _Prefetched(items, done, stop)
+
+
+def ordered_map(func, iterable, workers=None, window=None):
+    """
+    在多个进程中执行 func(item), 按输入顺序逐个产出结果
+
+    同时提交的任务不超过 window 个 (默认进程数的 2 倍), 前面的结果被取走后再提交后面的,
+    内存占用与任务总数无关。workers=1 时在当前进程中依次执行。
+    func 和 item 需要能被 pickle (模块级函数)。
+    """
+    if workers == 1:
+        for item in iterable:
+            yield func(item)
+        return
+    from concurrent.futures import ProcessPoolExecutor
+
+    workers = workers or os.cpu_count() or 1
+    window = window or 2 * workers
+    with ProcessPoolExecutor(workers) as pool:
+        items = iter(iterable)
+        pending = deque(pool.submit(func, item) for item in itertools.islice(items, window))
+        try:
+            while pending:
+                result = pending.popleft().result()
+                for item in itertools.islice(items, 1):
+                    pending.append(pool.submit(func, item))
+                yield result
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+class _LazyModule(types.ModuleType):
+    # 第一次访问属性时才导入真正的模块, 之后把其属性复制过来, 不再经过 __getattr__
+    def __getattr__(self, attr):
+        module = importlib.import_module(self.__name__)
+        self.__dict__.update(module.__dict__)
+        return getattr(module, attr)
+
+
+def lazy_import(name):
+    """
+    延迟导入: 返回一个占位模块, 用到其中的属性时才真正 import
+
+    用于 matplotlib、numpy 等导入较慢、又不是启动时就需要的模块, 例如
+        plt = lazy_import("matplotlib.pyplot")
+    已经导入过的模块直接返回。
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    return _LazyModule(name)